@@ -1,7 +1,8 @@
 from django.contrib import admin
-from .models import ItemCategory, ItemImage, Items
+from .models import ItemCategory, ItemImage, Items, MediaAsset
 
 
 admin.site.register(ItemCategory)
 admin.site.register(ItemImage)
-admin.site.register(Items)
\ No newline at end of file
+admin.site.register(Items)
+admin.site.register(MediaAsset)
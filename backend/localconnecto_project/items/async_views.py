@@ -0,0 +1,200 @@
+from math import ceil
+from django import forms
+from django.conf import settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from localconnecto_project.async_views import Fallback, authenticate, json_response
+from localconnecto_project.instrumentation import cache
+from localconnecto_project.db_routing import read_from_replica
+from .cache import aget_version, amake_key
+from .conditional import conditional_response, make_etag, query_etag_parts, set_validators
+from .lookups import aget_categories, aget_profiles
+from .models import ItemCategory, Items
+from .paginations import ItemPagination
+from .serializers import ItemCategorySerializer, ItemSerializers, LIST_IMAGE_SIZES
+
+# Async versions of the public item and category reads, served under ASGI
+# (see localconnecto_project/async_views.py).
+#
+# They follow ItemsViewSet and CategoryViewSet step for step: authenticate,
+# pick a replica, answer conditional GETs, then serve anonymous requests from
+# the response cache, sharing its keys with the DRF views. Seller profiles
+# are loaded up front and handed to the serializers, which then run without
+# touching the database. The item list handles page numbers and the
+# `filterset_fields` filters; searches, `?near=`, cursor pages, card views
+# and sparse fieldsets are left to ItemsViewSet.
+
+LISTING_TYPES = Items._meta.get_field('listing_type').choices
+
+# ItemsViewSet.filterset_fields, as the form fields django-filter validates them with
+FILTER_FIELDS = {
+    'price': forms.DecimalField(required=False),
+    'price__gte': forms.DecimalField(required=False),
+    'price__lte': forms.DecimalField(required=False),
+    'listing_type': forms.ChoiceField(choices=LISTING_TYPES, required=False),
+}
+LIST_PARAMS = {'page', 'category', *FILTER_FIELDS}
+
+
+async def cached_read(request, user, namespace, action, validators, build):
+    """
+    ConditionalGetMixin and CachedResponseMixin for the handlers below: a 304
+    for matching validators, the cached data for anonymous requests, and
+    otherwise `await build()`, cached for the next anonymous request.
+    """
+    etag, last_modified = validators
+    response = conditional_response(request, etag, last_modified)
+    if response is None:
+        key = None if user.is_authenticated else await amake_key(namespace, request, suffix=action)
+        data = await cache.aget(key) if key else None
+        if data is None:
+            data = await build()
+            if key:
+                await cache.aset(key, data, timeout=settings.RESPONSE_CACHE_TIMEOUT)
+        response = json_response(data)
+
+    set_validators(response, etag, last_modified)
+    return response
+
+
+def parse_filters(params):
+    """The queryset filters for the `filterset_fields` params; Fallback for values DRF would reject."""
+    filters = {}
+    try:
+        for name, field in FILTER_FIELDS.items():
+            value = field.clean(params.get(name, ''))
+            if value not in (None, ''):
+                filters[name] = value
+    except forms.ValidationError:
+        raise Fallback
+    return filters
+
+
+async def parse_category(params):
+    value = params.get('category', '')
+    if value == '':
+        return None
+    try:
+        pk = int(value)
+    except ValueError:
+        raise Fallback
+    if pk not in {category.pk for category in await aget_categories()}:
+        raise Fallback  # DRF answers with the filter's 400
+    return pk
+
+
+def page_number(params):
+    value = params.get('page')
+    if value is None:
+        return 1
+    try:
+        number = int(value)
+    except ValueError:
+        raise Fallback  # 'last' and bad numbers
+    if number < 1:
+        raise Fallback
+    return number
+
+
+async def items_list(request):
+    """GET /items/: ItemsViewSet.list for page numbers and filters."""
+    params = request.GET
+    if set(params) - LIST_PARAMS:
+        raise Fallback
+
+    user = await authenticate(request)
+    await read_from_replica(user)
+
+    queryset = Items.objects.filter(status='available', **parse_filters(params))
+    category = await parse_category(params)
+    if category is not None:
+        queryset = queryset.filter(category=category)
+    number = page_number(params)
+
+    # As ItemsViewSet.get_list_validators: no query before a 304 or a cache hit
+    etag = make_etag(await aget_version('items'), *query_etag_parts(request), weak=True)
+
+    async def build():
+        page_size = ItemPagination.page_size
+        count = await queryset.acount()
+        num_pages = max(ceil(count / page_size), 1)
+        if number > num_pages:
+            raise Fallback  # DRF's "Invalid page." 404
+
+        offset = (number - 1) * page_size
+        items = [item async for item in queryset.with_related()[offset:offset + page_size]]
+        context = {'image_sizes': LIST_IMAGE_SIZES, 'profiles': await aget_profiles({item.user_id for item in items})}
+
+        url = request.build_absolute_uri()
+        if number == 1:
+            previous = None
+        elif number == 2:
+            previous = remove_query_param(url, 'page')
+        else:
+            previous = replace_query_param(url, 'page', number - 1)
+        return {
+            'count': count,
+            'next': replace_query_param(url, 'page', number + 1) if number < num_pages else None,
+            'previous': previous,
+            'results': ItemSerializers(items, many=True, context=context).data,
+        }
+
+    return await cached_read(request, user, 'items', 'list', (etag, None), build)
+
+
+async def item_detail(request, pk):
+    """GET /items/<pk>/: ItemsViewSet.retrieve."""
+    if request.GET:
+        raise Fallback
+
+    user = await authenticate(request)
+    await read_from_replica(user)
+
+    queryset = Items.objects.filter(status='available')
+    updated_at = await queryset.filter(pk=pk).values_list('updated_at', flat=True).afirst()
+    if updated_at is None:
+        raise Fallback  # 404
+    etag = make_etag(pk, updated_at.isoformat(), *query_etag_parts(request))
+
+    async def build():
+        try:
+            item = await queryset.with_related().aget(pk=pk)
+        except Items.DoesNotExist:
+            raise Fallback  # deleted meanwhile
+        context = {'profiles': await aget_profiles([item.user_id])}
+        return ItemSerializers(item, context=context).data
+
+    return await cached_read(request, user, 'items', 'retrieve', (etag, updated_at), build)
+
+
+async def category_validators(request):
+    categories = await aget_categories()
+    etag = make_etag([(category.pk, category.name) for category in categories], *query_etag_parts(request))
+    return categories, etag
+
+
+async def categories_list(request):
+    """GET /categories/: CategoryViewSet.list, from the two-tier cache."""
+    user = await authenticate(request)
+    await read_from_replica(user)
+    categories, etag = await category_validators(request)
+
+    async def build():
+        return ItemCategorySerializer(categories, many=True).data
+
+    return await cached_read(request, user, 'categories', 'list', (etag, None), build)
+
+
+async def category_detail(request, pk):
+    """GET /categories/<pk>/: CategoryViewSet.retrieve."""
+    user = await authenticate(request)
+    await read_from_replica(user)
+    _, etag = await category_validators(request)
+
+    async def build():
+        try:
+            category = await ItemCategory.objects.aget(pk=pk)
+        except ItemCategory.DoesNotExist:
+            raise Fallback  # 404
+        return ItemCategorySerializer(category).data
+
+    return await cached_read(request, user, 'categories', 'retrieve', (etag, None), build)
@@ -0,0 +1,113 @@
+import hashlib
+import secrets
+from django.conf import settings
+from django.db import transaction
+from rest_framework.response import Response
+from localconnecto_project.instrumentation import cache
+
+# Anonymous list/retrieve responses are cached under a versioned namespace.
+# Writes never delete keys: they bump the namespace version, which makes every
+# key built with the old version unreachable (it then expires on its own).
+
+VERSION_KEY = 'response_cache_version:{namespace}'
+
+
+def initial_version():
+    # Random rather than 1, so a counter lost with the cache doesn't start
+    # over at versions (and list ETags, see items/views.py) already handed out
+    return secrets.randbits(48)
+
+
+def get_version(namespace):
+    key = VERSION_KEY.format(namespace=namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(namespace):
+    key = VERSION_KEY.format(namespace=namespace)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, initial_version(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_version(namespace):
+    key = VERSION_KEY.format(namespace=namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, initial_version(), timeout=None)
+
+
+def invalidate(*namespaces):
+    """Bump the namespaces once the current transaction commits."""
+    for namespace in namespaces:
+        transaction.on_commit(lambda namespace=namespace: bump_version(namespace))
+
+
+def normalize_params(query_params):
+    params = sorted(
+        (key, value)
+        for key in query_params
+        for value in query_params.getlist(key)
+        if value != ''
+    )
+    return '&'.join(f'{key}={value}' for key, value in params)
+
+
+def build_key(namespace, version, path, query_params, suffix=''):
+    raw = f'{path}?{normalize_params(query_params)}'
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f'response_cache:{namespace}:v{version}:{suffix}:{digest}'
+
+
+def make_key(namespace, request, suffix=''):
+    return build_key(namespace, get_version(namespace), request.path, request.query_params, suffix)
+
+
+async def amake_key(namespace, request, suffix=''):
+    """make_key() for the plain Django requests of async views."""
+    return build_key(namespace, await aget_version(namespace), request.path, request.GET, suffix)
+
+
+class CachedResponseMixin:
+    """
+    Serve anonymous `list` and `retrieve` responses from the cache.
+
+    `cache_namespace` names the version counter bumped by the model signals
+    in items/signals.py.
+    """
+    cache_namespace = None
+    cache_actions = ('list', 'retrieve')
+
+    def _should_cache(self, request):
+        return (
+            self.cache_namespace is not None
+            and self.action in self.cache_actions
+            and not request.user.is_authenticated
+        )
+
+    def _cached_response(self, request, handler, *args, **kwargs):
+        if not self._should_cache(request):
+            return handler(request, *args, **kwargs)
+
+        key = make_key(self.cache_namespace, request, suffix=self.action)
+        cached = cache.get(key)
+        if cached is not None:
+            return Response(cached)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, timeout=settings.RESPONSE_CACHE_TIMEOUT)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(request, super().retrieve, *args, **kwargs)
@@ -0,0 +1,61 @@
+import hashlib
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from .cache import normalize_params
+
+
+def make_etag(*parts, weak=False):
+    digest = hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def conditional_response(request, etag, last_modified):
+    """The 304 (or 412) answering `request` for these validators, or None."""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    if etag or timestamp:
+        return get_conditional_response(request, etag=etag, last_modified=timestamp)
+    return None
+
+
+def set_validators(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        if etag:
+            response.headers['ETag'] = etag
+        if last_modified:
+            response.headers['Last-Modified'] = http_date(int(last_modified.timestamp()))
+
+
+class ConditionalGetMixin:
+    """
+    Answer `If-None-Match` / `If-Modified-Since` on list and retrieve with a
+    304 before the queryset is serialized.
+
+    Views implement `get_list_validators(request)` and
+    `get_detail_validators(request, **kwargs)`, returning (etag, last_modified).
+    """
+
+    def get_list_validators(self, request):
+        return None, None
+
+    def get_detail_validators(self, request, **kwargs):
+        return None, None
+
+    def _conditional_response(self, request, validators, handler, *args, **kwargs):
+        etag, last_modified = validators
+        response = conditional_response(request._request, etag, last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        set_validators(response, etag, last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional_response(request, self.get_list_validators(request), super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        validators = self.get_detail_validators(request, **kwargs)
+        return self._conditional_response(request, validators, super().retrieve, *args, **kwargs)
+
+
+def query_etag_parts(request):
+    # request.GET is the query_params of DRF requests as well
+    return request.path, normalize_params(request.GET)
@@ -0,0 +1,140 @@
+import base64
+import io
+from django.conf import settings
+from django.db import transaction
+from PIL import ExifTags, Image, ImageFilter, ImageOps
+from users_auth.models import UserProfile
+from .cache import invalidate
+from .lookups import profile_cache
+from .media import get_backend, run_storage_calls, variant_public_id
+from .models import Items, ItemImage, MediaAsset
+
+# Responsive derivatives of stored images.
+#
+# Every MediaAsset gets each size in IMAGE_VARIANTS (longest side in pixels,
+# never upscaled) in each of IMAGE_VARIANT_FORMATS, plus a tiny placeholder
+# the clients blow up (blurred) while the real image loads. They are rendered
+# by the `generate_image_variants` task, once per distinct content, and copied
+# onto the ItemImage/UserProfile rows using the asset so the serializers can
+# hand out the right size without a join:
+#
+#     {"card": {"width": 480, "height": 360, "webp": "https://...", "jpeg": "https://..."}, ...}
+
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}  # IMAGE_VARIANT_FORMATS -> Pillow format
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def encode(image, format, quality):
+    if format == 'jpeg' and image.mode != 'RGB':
+        # No alpha in JPEG: flatten transparent images onto white
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    options = {'optimize': True, 'progressive': True} if format == 'jpeg' else {'method': 4}
+    out = io.BytesIO()
+    image.save(out, FORMATS[format], quality=quality, **options)
+    out.seek(0)
+    return out
+
+
+def placeholder(image):
+    tiny = image.copy()
+    tiny.thumbnail((settings.IMAGE_PLACEHOLDER_SIZE,) * 2, Image.Resampling.BILINEAR)
+    tiny = tiny.filter(ImageFilter.GaussianBlur(1))
+    data = encode(tiny.convert('RGBA' if 'A' in tiny.getbands() else 'RGB'), 'webp', 30).getvalue()
+    return 'data:image/webp;base64,' + base64.b64encode(data).decode('ascii')
+
+
+def render(source):
+    """
+    Decode `source` once and render every configured size, largest first, each
+    from the previous one. Returns (width, height, placeholder, renditions)
+    with renditions as (size, format, file, width, height).
+    """
+    sizes = sorted(settings.IMAGE_VARIANTS.items(), key=lambda entry: entry[1], reverse=True)
+
+    image = Image.open(source)
+    width, height = image.size
+    if image.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8):
+        width, height = height, width
+
+    # Let the JPEG decoder scale down while decoding (DCT scaling) when even
+    # the largest size is a fraction of the original
+    image.draft('RGB', (sizes[0][1], sizes[0][1]))
+    image = ImageOps.exif_transpose(image)  # also loads the (first) frame
+    image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    renditions = []
+    current = image
+    for size, longest_side in sizes:
+        current = current.copy()
+        current.thumbnail((longest_side, longest_side), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        for format in settings.IMAGE_VARIANT_FORMATS:
+            file = encode(current, format, settings.IMAGE_VARIANT_QUALITY)
+            file.name = f'{size}.{EXTENSIONS[format]}'
+            renditions.append((size, format, file, *current.size))
+
+    return width, height, placeholder(current), renditions
+
+
+def generate_variants(asset):
+    """Render and store the derivatives of `asset`, then record them on it and its users."""
+    backend = get_backend()
+    with backend.open(asset.public_id, asset.format, asset.version) as source:
+        width, height, tiny, renditions = render(io.BytesIO(source.read()))
+
+    stored = run_storage_calls(
+        lambda rendition: backend.upload(
+            rendition[2], variant_public_id(asset.public_id, rendition[0], rendition[1])
+        ),
+        renditions
+    )
+
+    variants = {}
+    for (size, format, _, variant_width, variant_height), (public_id, stored_format, version) in zip(renditions, stored):
+        variant = variants.setdefault(size, {'width': variant_width, 'height': variant_height})
+        variant[format] = backend.url(public_id, stored_format, version)
+
+    asset.width, asset.height, asset.placeholder, asset.variants = width, height, tiny, variants
+    MediaAsset.objects.filter(pk=asset.pk).update(width=width, height=height, placeholder=tiny, variants=variants)
+    apply_variants(asset)
+
+
+def variant_fields(asset):
+    """ItemImage fields carrying the derivatives of `asset`."""
+    return {'width': asset.width, 'height': asset.height, 'placeholder': asset.placeholder, 'variants': asset.variants}
+
+
+def apply_variants(asset):
+    """Copy the derivatives of `asset` onto the item images and profiles using it."""
+    # Writes before reads: on SQLite a transaction that reads first can't
+    # take the write lock later without failing (see LockingQuerySet.lock())
+    with transaction.atomic():
+        ItemImage.objects.filter(image_public_id=asset.public_id).update(**variant_fields(asset))
+        UserProfile.objects.filter(image_public_id=asset.public_id).update(image_variants=asset.variants)
+
+        item_ids = list(
+            ItemImage.objects.filter(image_public_id=asset.public_id).values_list('item_id', flat=True).distinct()
+        )
+        user_ids = list(UserProfile.objects.filter(image_public_id=asset.public_id).values_list('user_id', flat=True))
+
+        # Queryset updates skip the signals that keep the listings fresh
+        Items.objects.filter(pk__in=item_ids).touch()
+        Items.objects.filter(user_id__in=user_ids).touch()
+
+    invalidate('items')
+    for user_id in user_ids:
+        profile_cache.invalidate(user_id)
+
+
+def queue_variants(assets):
+    """
+    For rows just saved without derivatives: generate them in the background
+    once the transaction commits (or copy them over, when another upload of
+    the same content got there first).
+    """
+    from .tasks import generate_image_variants
+
+    pending = {asset.pk for asset in assets if not asset.variants}
+    for pk in pending:
+        transaction.on_commit(lambda pk=pk: generate_image_variants.delay(pk))
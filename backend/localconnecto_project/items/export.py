@@ -0,0 +1,117 @@
+import csv
+import io
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django_filters.rest_framework import FilterSet
+from django_filters.filterset import filterset_factory
+from rest_framework.exceptions import ValidationError
+from .media import get_backend
+from .models import Items, ItemImage
+
+# Bulk export of listings for analytics (the `items/export/` endpoint and
+# `manage.py export_items`).
+#
+# Rows are read in primary key order with QuerySet.values().iterator(), so
+# neither Django model instances nor the whole result set are ever held in
+# memory, and the images of each chunk are fetched in one extra query. Each
+# chunk is encoded to a single string before it is handed on, which keeps
+# the per-row overhead of the streaming response low. Under ASGI the stream
+# is handed to the response through astream(): Django reads a sync iterator
+# to the end before sending any of it there.
+
+EXPORT_CHUNK_SIZE = 2000
+
+COLUMNS = [
+    'id', 'title', 'description', 'category_id', 'listing_type', 'price', 'condition', 'status',
+    'images_status', 'location', 'latitude', 'longitude', 'posted_date', 'updated_at',
+]
+JOINED_COLUMNS = {
+    'category_name': F('category__name'),
+    'seller_id': F('user_id'),
+    'seller_first_name': F('user__first_name'),
+    'seller_last_name': F('user__last_name'),
+}
+FIELDS = [*COLUMNS, *JOINED_COLUMNS, 'images']
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def filter_items(queryset, params, filterset_fields):
+    """Apply `filterset_fields` lookups (as in ItemsViewSet) given as query params."""
+    filterset = filterset_factory(Items, filterset=FilterSet, fields=filterset_fields)(params, queryset=queryset)
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+    return filterset.qs
+
+
+def export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of row dicts, `chunk_size` items at a time, with their image URLs in order."""
+    rows = queryset.order_by('pk').values(*COLUMNS, **JOINED_COLUMNS).iterator(chunk_size=chunk_size)
+    backend = get_backend()
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+
+        images = {}
+        image_rows = (
+            ItemImage.objects.using(queryset.db)
+            .filter(item_id__in=[row['id'] for row in chunk])
+            .order_by('item_id', 'order')
+            .values_list('item_id', 'image')
+        )
+        for item_id, image in image_rows:
+            images.setdefault(item_id, []).append(backend.representation(image))
+
+        for row in chunk:
+            row['images'] = images.get(row['id'], [])
+        yield chunk
+
+
+def encode_ndjson(chunks):
+    encoder = DjangoJSONEncoder(separators=(',', ':'), ensure_ascii=False)
+    for chunk in chunks:
+        yield ''.join(encoder.encode(row) + '\n' for row in chunk)
+
+
+def encode_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for chunk in chunks:
+        for row in chunk:
+            row['images'] = ' '.join(row['images'])
+            writer.writerow([row[field] for field in FIELDS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # Header only: nothing matched
+
+
+def stream_items(queryset, format='ndjson', chunk_size=EXPORT_CHUNK_SIZE):
+    """The export of `queryset` as a stream of strings in `format` ('ndjson' or 'csv')."""
+    encode = encode_csv if format == 'csv' else encode_ndjson
+    return encode(export_rows(queryset, chunk_size))
+
+
+async def astream(strings):
+    """
+    `strings` as an async iterator, a chunk at a time. Each next() runs on
+    the thread-sensitive executor, so the database cursor stays on one
+    thread.
+    """
+    iterator = iter(strings)
+    done = object()
+    read = sync_to_async(next)
+    while True:
+        data = await read(iterator, done)
+        if data is done:
+            return
+        yield data
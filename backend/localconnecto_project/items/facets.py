@@ -0,0 +1,63 @@
+from decimal import Decimal
+from django.db.models import Case, When, Value, CharField, Count
+
+# Upper bounds of the price facet buckets; the last bucket is open-ended
+PRICE_BUCKETS = [Decimal(500), Decimal(1000), Decimal(5000), Decimal(10000)]
+
+
+def price_bucket_labels():
+    labels = []
+    lower = Decimal(0)
+    for upper in PRICE_BUCKETS:
+        labels.append((f'{lower}-{upper}', lower, upper))
+        lower = upper
+    labels.append((f'{lower}+', lower, None))
+    return labels
+
+
+def price_bucket_expression():
+    whens = [When(price__isnull=True, then=Value('free'))]
+    for label, lower, upper in price_bucket_labels():
+        if upper is None:
+            whens.append(When(price__gte=lower, then=Value(label)))
+        else:
+            whens.append(When(price__gte=lower, price__lt=upper, then=Value(label)))
+    return Case(*whens, default=Value('free'), output_field=CharField())
+
+
+def compute_facets(queryset):
+    """
+    Count the filtered items per category, listing type and price bucket.
+    All three come out of a single GROUP BY over (category, type, bucket).
+    """
+    rows = (
+        queryset.order_by()
+        .annotate(price_bucket=price_bucket_expression())
+        .values('category_id', 'category__name', 'listing_type', 'price_bucket')
+        .annotate(count=Count('id'))
+    )
+
+    categories, listing_types, prices = {}, {}, {}
+    total = 0
+    for row in rows:
+        count = row['count']
+        total += count
+
+        category = categories.setdefault(row['category_id'], {
+            'id': row['category_id'], 'name': row['category__name'], 'count': 0
+        })
+        category['count'] += count
+        listing_types[row['listing_type']] = listing_types.get(row['listing_type'], 0) + count
+        prices[row['price_bucket']] = prices.get(row['price_bucket'], 0) + count
+
+    bucket_order = ['free'] + [label for label, _, _ in price_bucket_labels()]
+    return {
+        'count': total,
+        'category': sorted(categories.values(), key=lambda category: category['name']),
+        'listing_type': [
+            {'value': value, 'count': count} for value, count in sorted(listing_types.items())
+        ],
+        'price': [
+            {'bucket': bucket, 'count': prices[bucket]} for bucket in bucket_order if bucket in prices
+        ],
+    }
@@ -0,0 +1,125 @@
+import math
+from rest_framework import serializers
+
+# "Near me" search for listings.
+#
+# Items with coordinates carry a `geo_cell`: the index of the CELL_SIZE x
+# CELL_SIZE degree grid cell they fall in. A radius query first narrows the
+# candidates to the cells covering its bounding box (an indexed IN lookup)
+# plus the exact box, then computes haversine distances for the candidate
+# coordinates in one batch and keeps the ones inside the radius.
+
+EARTH_RADIUS_KM = 6371.0088
+CELL_SIZE = 0.1  # degrees, roughly 11 km of latitude
+CELLS_PER_ROW = round(360 / CELL_SIZE)
+DEFAULT_RADIUS_KM = 5
+MAX_RADIUS_KM = 100
+MAX_CELLS = 2000  # beyond this the bounding box alone is used
+
+
+def geo_cell(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    row = int(math.floor((latitude + 90) / CELL_SIZE))
+    col = int(math.floor((longitude + 180) / CELL_SIZE)) % CELLS_PER_ROW
+    return row * CELLS_PER_ROW + col
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """Return (min_lat, max_lat, min_lng, max_lng); longitudes are None near the poles."""
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = max(latitude - lat_delta, -90.0), min(latitude + lat_delta, 90.0)
+
+    cos_lat = math.cos(math.radians(latitude))
+    if min_lat <= -90 or max_lat >= 90 or cos_lat <= 1e-9:
+        return min_lat, max_lat, None, None
+
+    lng_delta = math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat))
+    if lng_delta >= 180:
+        return min_lat, max_lat, None, None
+    return min_lat, max_lat, longitude - lng_delta, longitude + lng_delta
+
+
+def cells_for_box(min_lat, max_lat, min_lng, max_lng):
+    """The grid cells covering a box, or None if there are too many to list."""
+    if min_lng is None:
+        return None
+
+    first_row = int(math.floor((min_lat + 90) / CELL_SIZE))
+    last_row = int(math.floor((max_lat + 90) / CELL_SIZE))
+    first_col = int(math.floor((min_lng + 180) / CELL_SIZE))
+    last_col = int(math.floor((max_lng + 180) / CELL_SIZE))
+
+    if (last_row - first_row + 1) * (last_col - first_col + 1) > MAX_CELLS:
+        return None
+    return [
+        row * CELLS_PER_ROW + col % CELLS_PER_ROW
+        for row in range(first_row, last_row + 1)
+        for col in range(first_col, last_col + 1)
+    ]
+
+
+def haversine_km(latitude, longitude, points):
+    """Distances in km from one origin to every (latitude, longitude) in `points`."""
+    lat1 = math.radians(latitude)
+    lng1 = math.radians(longitude)
+    cos_lat1 = math.cos(lat1)
+    sin, cos, asin, sqrt, radians = math.sin, math.cos, math.asin, math.sqrt, math.radians
+
+    distances = []
+    for lat2, lng2 in points:
+        lat2 = radians(lat2)
+        a = sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos(lat2) * sin((radians(lng2) - lng1) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a))))
+    return distances
+
+
+def parse_near(query_params):
+    """Read `?near=lat,lng&radius=km`. Returns None when `near` is absent."""
+    near = query_params.get('near')
+    if not near:
+        return None
+
+    try:
+        latitude, longitude = (float(value) for value in near.split(','))
+    except ValueError:
+        raise serializers.ValidationError({"near": "Expected near=<latitude>,<longitude>."})
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise serializers.ValidationError({"near": "Coordinates are out of range."})
+
+    try:
+        radius = float(query_params.get('radius', DEFAULT_RADIUS_KM))
+    except ValueError:
+        raise serializers.ValidationError({"radius": "Radius must be a number of kilometres."})
+    if not (0 < radius <= MAX_RADIUS_KM):
+        raise serializers.ValidationError({"radius": f"Radius must be between 0 and {MAX_RADIUS_KM} km."})
+
+    return latitude, longitude, radius
+
+
+def nearby(queryset, latitude, longitude, radius_km):
+    """
+    Return [(item_id, distance_km)] for items in `queryset` within the radius,
+    nearest first (newest first on ties).
+    """
+    min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude, radius_km)
+
+    queryset = queryset.filter(latitude__gte=min_lat, latitude__lte=max_lat)
+    # A box wrapping around the antimeridian relies on the cells and exact distance
+    if min_lng is not None and min_lng >= -180 and max_lng <= 180:
+        queryset = queryset.filter(longitude__gte=min_lng, longitude__lte=max_lng)
+
+    cells = cells_for_box(min_lat, max_lat, min_lng, max_lng)
+    if cells is not None:
+        queryset = queryset.filter(geo_cell__in=cells)
+
+    candidates = list(queryset.order_by().values_list('id', 'latitude', 'longitude', 'posted_date'))
+    distances = haversine_km(latitude, longitude, [(lat, lng) for _, lat, lng, _ in candidates])
+
+    matches = [
+        (distance, -posted_date.timestamp(), pk)
+        for (pk, _, _, posted_date), distance in zip(candidates, distances)
+        if distance <= radius_km
+    ]
+    matches.sort()
+    return [(pk, distance) for distance, _, pk in matches]
@@ -0,0 +1,105 @@
+from django.db import transaction
+from django.db.models import Max
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound
+from .models import Items, ItemImage
+from .cache import invalidate
+
+# Set-based maintenance of ItemImage.order.
+#
+# Every operation runs in one transaction that first locks the item row, so
+# concurrent reorder/remove/add requests for the same item are serialized.
+# The MAX_IMAGES limit is checked under that lock wherever rows are added
+# (items/uploads.py:save_item_images).
+# (item, order) is unique, so renumbering goes through a temporary range that
+# is disjoint from both the current and the final orders: two UPDATE
+# statements no matter how many images move.
+
+MAX_IMAGES = 3
+
+
+class ImageOrderError(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = "Invalid image order."
+    default_code = 'invalid_image_order'
+
+
+def lock_item(item):
+    """
+    Take the row lock for `item` for the rest of the current transaction
+    (the database's write lock on SQLite, see LockingQuerySet.lock()). Call
+    it before the transaction reads anything it goes on to write from.
+    """
+    Items.objects.filter(pk=item.pk).lock()
+
+
+def next_image_order(item):
+    last = item.images.aggregate(last=Max('order'))['last']
+    return 0 if last is None else last + 1
+
+
+def renumber(images):
+    """Store orders 0..n-1 for `images` (already in the wanted order)."""
+    moved = [image for i, image in enumerate(images) if image.order != i]
+    if not moved:
+        return
+
+    offset = max(image.order for image in images) + 1
+    for i, image in enumerate(images):
+        image.order = offset + i
+    ItemImage.objects.bulk_update(moved, ['order'])
+
+    for i, image in enumerate(images):
+        image.order = i
+    ItemImage.objects.bulk_update(moved, ['order'])
+
+    # bulk_update skips the model signals
+    Items.objects.filter(pk=images[0].item_id).touch()
+    invalidate('items')
+
+
+def reorder_item_images(item, image_order):
+    """Put the item's images in the order of `image_order` (a list of image ids)."""
+    try:
+        image_ids = [int(image_id) for image_id in image_order]
+    except (TypeError, ValueError):
+        raise ImageOrderError("Image ids must be integers.")
+
+    with transaction.atomic():
+        lock_item(item)
+        images = {image.pk: image for image in ItemImage.objects.filter(item=item)}
+
+        if not image_ids or len(image_ids) != len(set(image_ids)) or set(image_ids) != set(images):
+            raise ImageOrderError("Please provide the correct order for all images.")
+
+        renumber([images[image_id] for image_id in image_ids])
+
+
+def remove_item_image(item, image_id):
+    """
+    Delete one image row and close the gap it leaves. The deletion releases
+    the image's stored asset (see items/signals.py).
+    """
+    with transaction.atomic():
+        lock_item(item)
+        images = list(ItemImage.objects.filter(item=item).order_by('order'))
+
+        image = next((image for image in images if str(image.pk) == str(image_id)), None)
+        if image is None:
+            raise NotFound("No ItemImage matches the given query.")
+
+        if len(images) <= 1:
+            raise ImageOrderError("Item must have at least one image.")
+
+        remaining = [other for other in images if other.pk != image.pk]
+        image.delete()
+        renumber(remaining)
+
+
+def check_image_capacity(item, adding, pending=0):
+    """
+    Raise unless `adding` more images fit on the item, next to `pending`
+    ones still being uploaded. Call with the item locked.
+    """
+    if ItemImage.objects.filter(item=item).count() + pending + adding > MAX_IMAGES:
+        raise ImageOrderError(f"Item already has the maximum of {MAX_IMAGES} images.")
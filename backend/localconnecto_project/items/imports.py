@@ -0,0 +1,104 @@
+import csv
+import json
+from itertools import islice
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from . import search
+from .cache import invalidate
+from .geo import geo_cell
+from .models import Items
+from .serializers import ItemImportSerializer
+
+# Bulk listing imports (the `items/import/` endpoint and `manage.py import_items`).
+#
+# Rows are validated by one reused ItemImportSerializer against the cached
+# categories, so validation runs no queries, and the valid rows of each chunk
+# are inserted with a single bulk_create. bulk_create skips Items.save() and
+# the model signals, so the geo cell, the search index and the response
+# cache are taken care of here. Images are given as URLs and fetched in the
+# background by `import_item_images` tasks of ITEM_IMPORT_IMAGE_BATCH items
+# each, so the downloads spread over the workers and a retry or a crash only
+# concerns a few items.
+
+
+def read_rows(file, format):
+    """Yield the rows of a CSV (with a header) or NDJSON text file as dicts."""
+    if format == 'csv':
+        for row in csv.DictReader(file):
+            # Empty cells count as missing, so optional fields keep their defaults
+            row = {key: value for key, value in row.items() if key and value not in ('', None)}
+            if 'image_urls' in row:
+                row['image_urls'] = row['image_urls'].split()
+            yield row
+        return
+
+    for line in file:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield e  # Reported against its row
+
+
+def import_rows(rows, user, chunk_size=None):
+    """
+    Create a listing for `user` from every valid row. Returns the ids
+    created and the errors of the other rows, by 1-based row number:
+
+        {'created': 2, 'ids': [...], 'errors': [{'row': 3, 'errors': {...}}]}
+    """
+    chunk_size = chunk_size or settings.ITEM_IMPORT_CHUNK_SIZE
+
+    result = {'created': 0, 'ids': [], 'errors': []}
+    numbered = enumerate(rows, start=1)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            break
+        ids, errors = import_chunk(chunk, user)
+        result['ids'].extend(ids)
+        result['errors'].extend(errors)
+
+    result['created'] = len(result['ids'])
+    if result['ids']:
+        invalidate('items')
+    return result
+
+
+def import_chunk(chunk, user):
+    serializer = ItemImportSerializer()
+    items, image_urls, errors = [], [], []
+    for number, row in chunk:
+        if isinstance(row, Exception):
+            errors.append({'row': number, 'errors': {'non_field_errors': [str(row)]}})
+            continue
+        try:
+            data = serializer.run_validation(row)
+        except ValidationError as e:
+            errors.append({'row': number, 'errors': e.detail})
+            continue
+
+        urls = data.pop('image_urls')
+        items.append(Items(
+            user=user, images_status='pending', geo_cell=geo_cell(data.get('latitude'), data.get('longitude')),
+            **data
+        ))
+        image_urls.append(urls)
+
+    if not items:
+        return [], errors
+
+    with transaction.atomic():
+        items = Items.objects.bulk_create(items)
+        search.index_items(items)
+
+        from .tasks import import_item_images
+        entries = [(item.pk, urls) for item, urls in zip(items, image_urls)]
+        batch = settings.ITEM_IMPORT_IMAGE_BATCH
+        for start in range(0, len(entries), batch):
+            transaction.on_commit(lambda group=entries[start:start + batch]: import_item_images.delay(group))
+
+    return [item.pk for item in items], errors
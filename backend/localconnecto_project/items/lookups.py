@@ -0,0 +1,66 @@
+from localconnecto_project.tiered_cache import TieredCache
+from users_auth.models import UserProfile
+from .models import ItemCategory
+
+# Hot lookup data served from the two-tier cache. The signals in
+# items/signals.py invalidate these when the underlying rows change.
+
+category_cache = TieredCache('categories', maxsize=1, ttl=60)
+profile_cache = TieredCache('profiles', maxsize=4096, ttl=30)
+
+
+def load_categories():
+    return list(ItemCategory.objects.order_by('id').values('id', 'name'))
+
+
+async def aload_categories():
+    return [category async for category in ItemCategory.objects.order_by('id').values('id', 'name')]
+
+
+def get_categories():
+    """All categories as unsaved-looking ItemCategory instances (id and name set)."""
+    return [ItemCategory(**category) for category in category_cache.get('all', load_categories)]
+
+
+async def aget_categories():
+    return [ItemCategory(**category) for category in await category_cache.aget('all', aload_categories)]
+
+
+def get_category(pk):
+    for category in category_cache.get('all', load_categories):
+        if category['id'] == pk:
+            return ItemCategory(**category)
+    return None
+
+
+def profile_snapshot(profile):
+    # Imported here: the serializers use this module
+    from .serializers import ProfileSerializer
+    return dict(ProfileSerializer(profile).data)
+
+
+def load_profiles(user_ids):
+    return {
+        profile.user_id: profile_snapshot(profile)
+        for profile in UserProfile.objects.filter(user_id__in=user_ids)
+    }
+
+
+async def aload_profiles(user_ids):
+    return {
+        profile.user_id: profile_snapshot(profile)
+        async for profile in UserProfile.objects.filter(user_id__in=user_ids)
+    }
+
+
+def get_profiles(user_ids):
+    """Serialized seller profiles keyed by user id (users without one are left out)."""
+    return profile_cache.get_many(list(user_ids), load_profiles)
+
+
+async def aget_profiles(user_ids):
+    return await profile_cache.aget_many(list(user_ids), aload_profiles)
+
+
+def get_profile(user_id):
+    return get_profiles([user_id]).get(user_id)
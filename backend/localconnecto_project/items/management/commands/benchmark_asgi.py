@@ -0,0 +1,252 @@
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+from items.models import ItemCategory, Items
+from localconnecto_project.benchmarks import git_revision
+from .loadtest import ENDPOINTS, summarize
+
+User = get_user_model()
+
+# The read endpoints with a native async view (see localconnecto_project/async_views.py)
+ASYNC_ENDPOINTS = ['categories', 'items_list', 'items_page', 'items_filtered', 'item_detail', 'user_data', 'profile']
+MODES = {'sync': '0', 'async': '1'}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the DRF (sync) and native async read views under ASGI: drive the ASGI "
+        "application in this process with many concurrent, slow clients and report "
+        "req/s, latency percentiles and the peak number of threads for each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['sync', 'async', 'both'], default='both',
+                            help="'both' runs each mode in its own process, one after the other.")
+        parser.add_argument('--concurrency', type=int, default=200, help="Open connections.")
+        parser.add_argument('--duration', type=float, default=20, help="Seconds of measured traffic.")
+        parser.add_argument('--warmup', type=float, default=3, help="Seconds of unmeasured traffic first.")
+        parser.add_argument('--client-delay', type=float, default=50,
+                            help="Milliseconds each client takes to read a response, holding its connection.")
+        parser.add_argument('--only', help="Comma separated endpoint names to run.")
+        parser.add_argument('--auth-users', type=int, default=20, help="Sellers to sign in as.")
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument('--json', dest='json_path', help="Write the report here.")
+
+    def handle(self, *args, **options):
+        endpoints = self.select_endpoints(options)
+        if options['mode'] == 'both':
+            reports = {mode: self.run_in_process(mode, options) for mode in MODES}
+            self.print_comparison(reports)
+            report = {'revision': git_revision(), 'started_at': timezone.now().isoformat(), 'modes': reports}
+        else:
+            if settings.ASYNC_READ_VIEWS != (options['mode'] == 'async'):
+                raise CommandError(f"Run with ASYNC_READ_VIEWS={MODES[options['mode']]} (or --mode both).")
+            report = asyncio.run(self.benchmark(endpoints, options))
+            self.print_report(report)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as out:
+                json.dump(report, out, indent=2)
+
+    def select_endpoints(self, options):
+        names = options['only'].split(',') if options['only'] else ASYNC_ENDPOINTS
+        unknown = set(names) - set(ASYNC_ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+        return [endpoint for endpoint in ENDPOINTS if endpoint.name in names]
+
+    def run_in_process(self, mode, options):
+        """Run one mode in a fresh process (the URLconf is built once per process)."""
+        with tempfile.NamedTemporaryFile(suffix='.json') as report_file:
+            command = [
+                sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'benchmark_asgi',
+                '--mode', mode, '--json', report_file.name,
+            ]
+            for name in ('concurrency', 'duration', 'warmup', 'client_delay', 'only', 'auth_users', 'random_seed'):
+                if options[name] is not None:
+                    command += [f"--{name.replace('_', '-')}", str(options[name])]
+
+            self.stdout.write(f"Running {mode} views...")
+            subprocess.run(command, check=True, env={**os.environ, 'ASYNC_READ_VIEWS': MODES[mode]})
+            with open(report_file.name) as report:
+                return json.load(report)
+
+    def build_context(self, endpoints, options):
+        item_ids = list(Items.objects.filter(status='available').order_by('?').values_list('id', flat=True)[:1000])
+        if not item_ids:
+            raise CommandError("No items to benchmark against, seed some with `loadtest --seed N` first.")
+
+        context = {
+            'item_ids': item_ids,
+            'category_ids': list(ItemCategory.objects.values_list('id', flat=True)),
+            'tokens': [],
+        }
+        if any(endpoint.auth for endpoint in endpoints):
+            sellers = User.objects.filter(items__isnull=False).distinct().order_by('id')[:options['auth_users']]
+            context['tokens'] = [str(RefreshToken.for_user(user).access_token) for user in sellers]
+        return context
+
+    async def benchmark(self, endpoints, options):
+        context = await sync_to_async(self.build_context)(endpoints, options)
+        application = ASGIHandler()
+
+        if options['warmup']:
+            await self.run(application, endpoints, context, options, options['warmup'])
+        threads = ThreadWatcher()
+        threads.start()
+        try:
+            results, elapsed = await self.run(application, endpoints, context, options, options['duration'])
+        finally:
+            threads.stop()
+
+        all_latencies, all_statuses, all_errors = [], {}, 0
+        for latencies, statuses, errors in results.values():
+            all_latencies.extend(latencies)
+            for code, n in statuses.items():
+                all_statuses[code] = all_statuses.get(code, 0) + n
+            all_errors += errors
+
+        return {
+            'revision': git_revision(),
+            'started_at': timezone.now().isoformat(),
+            'mode': 'async' if settings.ASYNC_READ_VIEWS else 'sync',
+            'settings': settings.SETTINGS_MODULE,
+            'concurrency': options['concurrency'],
+            'client_delay_ms': options['client_delay'],
+            'duration_s': round(elapsed, 2),
+            'peak_threads': threads.peak,
+            'endpoints': {name: summarize(*result, elapsed) for name, result in results.items()},
+            'total': summarize(all_latencies, all_statuses, all_errors, elapsed),
+        }
+
+    async def run(self, application, endpoints, context, options, duration):
+        """`concurrency` clients for `duration` seconds. Returns ({name: (latencies, statuses, errors)}, elapsed)."""
+        results = {endpoint.name: ([], {}, 0) for endpoint in endpoints}
+        weights = [endpoint.weight for endpoint in endpoints]
+        delay = options['client_delay'] / 1000
+        deadline = time.monotonic() + duration
+
+        async def client(number):
+            rng = random.Random(options['random_seed'] * 1000 + number)
+            token = context['tokens'][number % len(context['tokens'])] if context['tokens'] else None
+            while time.monotonic() < deadline:
+                endpoint = rng.choices(endpoints, weights)[0]
+                path, kwargs = endpoint.build(context, rng)
+                headers = [(b'host', b'localhost')]
+                if endpoint.auth:
+                    headers.append((b'authorization', f'Bearer {token}'.encode()))
+
+                started = time.perf_counter()
+                status = await request(application, path, kwargs.get('params'), headers, delay)
+                latencies, statuses, errors = results[endpoint.name]
+                latencies.append(round((time.perf_counter() - started) * 1000, 3))
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                results[endpoint.name] = (latencies, statuses, errors + (status >= 400))
+
+        started = time.monotonic()
+        await asyncio.gather(*(client(number) for number in range(options['concurrency'])))
+        return {name: result for name, result in results.items() if result[0]}, time.monotonic() - started
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"\n{report['mode']} views, {report['concurrency']} clients reading responses in "
+            f"{report['client_delay_ms']:g}ms, peak {report['peak_threads']} threads"
+        )
+        self.stdout.write(
+            f"{'endpoint':<16} {'reqs':>7} {'err':>5} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8}  (ms)"
+        )
+        for name, stats in [*report['endpoints'].items(), ('TOTAL', report['total'])]:
+            self.stdout.write(
+                f"{name:<16} {stats['requests']:>7} {stats['errors']:>5} {stats['rps']:>8.1f} "
+                f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f}"
+            )
+
+    def print_comparison(self, reports):
+        sync, native = reports['sync'], reports['async']
+        self.stdout.write(
+            f"\n{'endpoint':<16} {'sync req/s':>11} {'async req/s':>12} {'sync p99':>9} {'async p99':>10}  (ms)"
+        )
+        for name in [*sync['endpoints'], 'TOTAL']:
+            before = sync['total'] if name == 'TOTAL' else sync['endpoints'][name]
+            after = native['total'] if name == 'TOTAL' else native['endpoints'].get(name)
+            if after is None:
+                continue
+            self.stdout.write(
+                f"{name:<16} {before['rps']:>11.1f} {after['rps']:>12.1f} {before['p99_ms']:>9.1f} {after['p99_ms']:>10.1f}"
+            )
+        self.stdout.write(f"peak threads: sync {sync['peak_threads']}, async {native['peak_threads']}")
+
+
+async def request(application, path, params, headers, delay):
+    """One GET through the ASGI application; the client takes `delay` seconds to read the body."""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': urlencode(params or {}).encode(),
+        'root_path': '',
+        'headers': headers,
+        'client': ('127.0.0.1', 50000),
+        'server': ('localhost', 80),
+    }
+    sent = False
+    finished = asyncio.Event()
+    status = None
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await finished.wait()  # the connection stays open until the response is read
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body' and not message.get('more_body'):
+            await asyncio.sleep(delay)
+            finished.set()
+
+    await application(scope, receive, send)
+    return status
+
+
+class ThreadWatcher:
+    """Samples the number of live threads while the benchmark runs."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='thread-watcher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
@@ -0,0 +1,171 @@
+import itertools
+import json
+import statistics
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.db import connections
+from rest_framework.test import APIRequestFactory, force_authenticate
+from items.models import Items
+from items.seeding import seed_dataset, clear_dataset
+from items.views import ItemsViewSet
+
+User = get_user_model()
+
+# Values used for each `filterset_fields` lookup of ItemsViewSet
+FILTER_VALUES = {
+    'price': '500',
+    'price__gte': '1000',
+    'price__lte': '20000',
+    'category': None,  # first category id, filled in at runtime
+    'listing_type': 'sell',
+}
+
+VARIANTS = {
+    'page': {},
+    'deep_page': {'page': '50'},
+    'cursor': {'pagination': 'cursor'},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Run every ItemsViewSet filter combination (with and without search, for each "
+        "pagination mode) against the database, capturing timings and query plans, and "
+        "report the queries on items that fall back to full table scans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help="Insert this many items before running.")
+        parser.add_argument('--users', type=int, default=500, help="Sellers to create when seeding.")
+        parser.add_argument('--clear', action='store_true', help="Remove the seeded dataset and exit.")
+        parser.add_argument('--repeat', type=int, default=3, help="Timed runs per combination.")
+        parser.add_argument('--search', default='chair', help="Search term used for the search variants.")
+        parser.add_argument('--json', dest='json_path', help="Write the full report (plans included) here.")
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--fail-on-full-scan', action='store_true',
+                            help="Exit with an error if any combination scans the items table.")
+
+    def handle(self, *args, **options):
+        using = options['database']
+
+        if options['clear']:
+            clear_dataset(using=using)
+            self.stdout.write(self.style.SUCCESS("Seeded dataset removed."))
+            return
+
+        if options['seed']:
+            self.stdout.write(f"Seeding {options['seed']} items...")
+            started = time.perf_counter()
+            seed_dataset(items=options['seed'], users=options['users'], using=using, log=self.stdout.write)
+            self.stdout.write(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+        if not Items.objects.using(using).exists():
+            raise CommandError("No items to benchmark, run with --seed N first.")
+
+        connection = connections[using]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        FILTER_VALUES['category'] = str(Items.objects.using(using).values_list('category_id', flat=True).first())
+        user = User.objects.using(using).order_by('id').first()
+
+        results = []
+        # Hundreds of searches as one user: the 'search' rate limit would stop the run
+        with override_settings(THROTTLE_ENABLED=False):
+            for params in self.combinations(options['search']):
+                result = self.run_combination(connection, user, params, options['repeat'])
+                results.append(result)
+                marker = self.style.ERROR('FULL SCAN') if result['full_scan'] else self.style.SUCCESS('ok')
+                self.stdout.write(
+                    f"{result['median_ms']:9.2f} ms  {result['query_count']:2d} queries  {marker:>9}  {result['query_string']}"
+                )
+
+        full_scans = [result for result in results if result['full_scan']]
+        self.stdout.write(
+            f"\n{len(results)} combinations, {len(full_scans)} with a full scan of items_items "
+            f"({connection.vendor}, {Items.objects.using(using).count()} items)"
+        )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as out:
+                json.dump({'vendor': connection.vendor, 'results': results}, out, indent=2, default=str)
+
+        if full_scans and options['fail_on_full_scan']:
+            raise CommandError(f"{len(full_scans)} combinations scan the items table.")
+
+    def combinations(self, search_term):
+        lookups = list(FILTER_VALUES)
+        for size in range(len(lookups) + 1):
+            for subset in itertools.combinations(lookups, size):
+                for search in (None, search_term):
+                    for variant in VARIANTS.values():
+                        params = {lookup: FILTER_VALUES[lookup] for lookup in subset}
+                        if search:
+                            params['search'] = search
+                        params.update(variant)
+                        yield params
+
+    def run_combination(self, connection, user, params, repeat):
+        factory = APIRequestFactory()
+        view = ItemsViewSet.as_view({'get': 'list'})
+
+        timings = []
+        executed = []
+        for i in range(repeat):
+            request = factory.get('/items/', params)
+            # Authenticated requests skip the response cache, so every run hits the database
+            force_authenticate(request, user=user)
+
+            queries = []
+
+            def record(execute, sql, sql_params, many, context):
+                queries.append((sql, sql_params))
+                return execute(sql, sql_params, many, context)
+
+            started = time.perf_counter()
+            with connection.execute_wrapper(record):
+                response = view(request)
+                response.render()
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code not in (200, 404):
+                raise CommandError(f"{params} returned {response.status_code}: {response.content[:200]}")
+            if i == 0:
+                executed = queries
+
+        plans = [
+            {'sql': sql, 'plan': self.explain(connection, sql, sql_params)}
+            for sql, sql_params in executed
+            if 'items_items' in sql.split(' FROM ', 1)[-1]
+        ]
+        full_scan = any(self.is_full_scan(connection, plan['plan']) for plan in plans)
+
+        return {
+            'params': params,
+            'query_string': '&'.join(f'{key}={value}' for key, value in params.items()) or '(none)',
+            'median_ms': statistics.median(timings),
+            'min_ms': min(timings),
+            'query_count': len(executed),
+            'full_scan': full_scan,
+            'plans': plans,
+        }
+
+    def explain(self, connection, sql, params):
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+        if connection.vendor == 'sqlite':
+            return [row[-1] for row in rows]
+        return [row[0] for row in rows]
+
+    def is_full_scan(self, connection, plan):
+        for line in plan:
+            if connection.vendor == 'sqlite':
+                # "SCAN items_items" without an index; "SCAN ... USING INDEX" walks an index
+                if line.startswith('SCAN items_items') and 'INDEX' not in line:
+                    return True
+            elif 'Seq Scan on items_items' in line:
+                return True
+        return False
@@ -0,0 +1,51 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+from rest_framework.exceptions import ValidationError
+from items.export import CONTENT_TYPES, EXPORT_CHUNK_SIZE, filter_items, stream_items
+from items.models import Items
+from items.views import ItemsViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream every item (any status), optionally filtered like /items/, as NDJSON or CSV "
+        "to a file or stdout."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(CONTENT_TYPES), default='ndjson')
+        parser.add_argument('-o', '--output', help="File to write to (default: stdout).")
+        parser.add_argument('--filter', action='append', default=[], metavar='LOOKUP=VALUE',
+                            help="A filter of the items list, e.g. price__gte=100 (repeatable).")
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        params = QueryDict(mutable=True)
+        for lookup in options['filter']:
+            key, sep, value = lookup.partition('=')
+            if not sep:
+                raise CommandError(f"Filters are LOOKUP=VALUE, got {lookup!r}.")
+            params.appendlist(key, value)
+
+        try:
+            queryset = filter_items(Items.objects.using(options['database']), params, ItemsViewSet.filterset_fields)
+        except ValidationError as e:
+            raise CommandError(f"Invalid filters: {e.detail}")
+
+        started = time.perf_counter()
+        written = 0
+        out = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else None
+        try:
+            for data in stream_items(queryset, options['format'], options['chunk_size']):
+                if out is None:
+                    self.stdout.write(data, ending='')
+                else:
+                    out.write(data)
+                written += len(data)
+        finally:
+            if out is not None:
+                out.close()
+
+        self.stderr.write(f"Exported {written / 1e6:.1f} MB in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from items.imports import read_rows, import_rows
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Create listings for a seller from a CSV (with a header row) or NDJSON file, in bulk. "
+        "Images are given as `image_urls` (space-separated in CSV) and fetched in the background."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for stdin.")
+        parser.add_argument('--user', required=True, help="Email of the seller the listings belong to.")
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help="Defaults to the file extension (.csv, anything else is NDJSON).")
+        parser.add_argument('--chunk-size', type=int, help="Rows per bulk insert (ITEM_IMPORT_CHUNK_SIZE).")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(email=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with email {options['user']}.")
+
+        path = options['path']
+        format = options['format'] or ('csv' if os.path.splitext(path)[1].lower() == '.csv' else 'ndjson')
+
+        started = time.perf_counter()
+        file = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            result = import_rows(read_rows(file, format), user, chunk_size=options['chunk_size'])
+        finally:
+            if file is not sys.stdin:
+                file.close()
+        elapsed = time.perf_counter() - started
+
+        for error in result['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+
+        rows = result['created'] + len(result['errors'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['created']} of {rows} listings in {elapsed:.1f}s "
+            f"({rows / elapsed if elapsed else 0:.0f} rows/s); images are being fetched in the background."
+        ))
@@ -0,0 +1,273 @@
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from PIL import Image
+from items.models import ItemCategory, Items
+from items.seeding import CITIES, NOUNS, SEED_EMAIL_DOMAIN, seed_dataset
+from localconnecto_project.benchmarks import git_revision
+
+User = get_user_model()
+
+# Seeded users log in with this password
+LOADTEST_PASSWORD = 'loadtest-Passw0rd'
+
+
+@dataclass
+class Endpoint:
+    name: str
+    method: str
+    build: Callable  # (context, rng) -> (path, request kwargs)
+    weight: int = 1
+    auth: bool = False
+    write: bool = False
+
+
+def item_form(context, rng):
+    city, lat, lng = rng.choice(CITIES)
+    data = {
+        'title': f'Load test {rng.choice(NOUNS)}',
+        'description': 'Created by manage.py loadtest',
+        'category': rng.choice(context['category_ids']),
+        'listing_type': 'sell',
+        'price': rng.randint(1, 2000) * 50,
+        'location': city,
+        'condition': 'Used',
+    }
+    files = [('uploaded_images', ('image.jpg', context['image'], 'image/jpeg'))]
+    return '/items/', {'data': data, 'files': files}
+
+
+# The API surface from localconnecto_project/urls.py and items/urls.py.
+# Admin, allauth and the Google callbacks need a browser session and are
+# left out.
+ENDPOINTS = [
+    Endpoint('categories', 'GET', lambda c, r: ('/categories/', {}), weight=2),
+    Endpoint('items_list', 'GET', lambda c, r: ('/items/', {}), weight=6),
+    Endpoint('items_page', 'GET', lambda c, r: ('/items/', {'params': {'page': r.randint(2, 20)}}), weight=2),
+    Endpoint('items_cursor', 'GET', lambda c, r: ('/items/', {'params': {'pagination': 'cursor'}}), weight=2),
+    Endpoint('items_cards', 'GET', lambda c, r: ('/items/', {'params': {'view': 'card'}}), weight=3),
+    Endpoint('items_filtered', 'GET', lambda c, r: ('/items/', {'params': {
+        'category': r.choice(c['category_ids']), 'price__lte': r.choice([5000, 20000, 50000]),
+    }}), weight=3),
+    Endpoint('items_search', 'GET', lambda c, r: ('/items/', {'params': {'search': r.choice(NOUNS)}}), weight=3),
+    Endpoint('items_near', 'GET', lambda c, r: ('/items/', {'params': {
+        'near': '{1},{2}'.format(*r.choice(CITIES)), 'radius': r.choice([2, 5, 10]),
+    }}), weight=2),
+    Endpoint('items_facets', 'GET', lambda c, r: ('/items/facets/', {}), weight=1),
+    Endpoint('item_detail', 'GET', lambda c, r: (f"/items/{r.choice(c['item_ids'])}/", {}), weight=4),
+    Endpoint('users_items', 'GET', lambda c, r: ('/items/users_items/', {}), weight=1, auth=True),
+    Endpoint('user_data', 'GET', lambda c, r: ('/auth/users/', {}), weight=1, auth=True),
+    Endpoint('profile', 'GET', lambda c, r: ('/auth/profiles/', {}), weight=1, auth=True),
+
+    Endpoint('token', 'POST', lambda c, r: ('/auth/token/', {'json': {
+        'email': r.choice(c['emails']), 'password': LOADTEST_PASSWORD,
+    }}), write=True),
+    Endpoint('send_otp', 'POST', lambda c, r: ('/send-otp/', {'json': {'email': r.choice(c['emails'])}}), write=True),
+    Endpoint('registration', 'POST', lambda c, r: ('/auth/registration/', {'json': {
+        'email': f'load{uuid.uuid4().hex}@{SEED_EMAIL_DOMAIN}', 'password': LOADTEST_PASSWORD,
+        'first_name': 'Load', 'last_name': 'Test',
+    }}), write=True),
+    Endpoint('item_create', 'POST', item_form, auth=True, write=True),
+]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies, statuses, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'statuses': dict(sorted(statuses.items())),
+        'rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else None,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': latencies[-1] if latencies else None,
+    }
+
+
+def tiny_jpeg():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (200, 120, 40)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive concurrent traffic at a running server and report p50/p95/p99 latency and "
+        "req/s per endpoint. Run the server with localconnecto_project.settings_loadtest so "
+        "Cloudinary and SMTP are replaced by local stand-ins."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--seed', type=int, default=0, help="Insert this many items (and --users sellers) first.")
+        parser.add_argument('--users', type=int, default=200, help="Sellers to create when seeding.")
+        parser.add_argument('--concurrency', type=int, default=8, help="Parallel clients.")
+        parser.add_argument('--duration', type=float, default=30, help="Seconds of measured traffic.")
+        parser.add_argument('--warmup', type=float, default=3, help="Seconds of unmeasured traffic first.")
+        parser.add_argument('--writes', action='store_true', help="Include the write endpoints.")
+        parser.add_argument('--only', help="Comma separated endpoint names to run.")
+        parser.add_argument('--auth-users', type=int, default=20, help="Seeded users to log in as.")
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument('--json', dest='json_path', help="Write the report here.")
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.stdout.write(f"Seeding {options['seed']} items...")
+            seed_dataset(
+                items=options['seed'], users=options['users'], password=LOADTEST_PASSWORD, log=self.stdout.write
+            )
+
+        endpoints = self.select_endpoints(options)
+        base_url = options['base_url'].rstrip('/')
+        context = self.build_context(base_url, endpoints, options)
+
+        self.stdout.write(
+            f"{len(endpoints)} endpoints, {options['concurrency']} clients, "
+            f"{options['warmup']}s warmup + {options['duration']}s against {base_url}"
+        )
+        if options['warmup']:
+            self.run(base_url, endpoints, context, options, options['warmup'])
+        results, elapsed = self.run(base_url, endpoints, context, options, options['duration'])
+
+        report = {
+            'revision': git_revision(),
+            'started_at': timezone.now().isoformat(),
+            'base_url': base_url,
+            'settings': settings.SETTINGS_MODULE,
+            'items': Items.objects.count(),
+            'concurrency': options['concurrency'],
+            'duration_s': round(elapsed, 2),
+            'endpoints': {
+                endpoint.name: summarize(*results[endpoint.name], elapsed) for endpoint in endpoints
+            },
+        }
+        all_latencies, all_statuses, all_errors = [], {}, 0
+        for latencies, statuses, errors in results.values():
+            all_latencies.extend(latencies)
+            for code, n in statuses.items():
+                all_statuses[code] = all_statuses.get(code, 0) + n
+            all_errors += errors
+        report['total'] = summarize(all_latencies, all_statuses, all_errors, elapsed)
+
+        self.print_report(report)
+        if options['json_path']:
+            with open(options['json_path'], 'w') as out:
+                json.dump(report, out, indent=2)
+
+    def select_endpoints(self, options):
+        endpoints = [endpoint for endpoint in ENDPOINTS if options['writes'] or not endpoint.write]
+        if options['only']:
+            names = set(options['only'].split(','))
+            unknown = names - {endpoint.name for endpoint in ENDPOINTS}
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+            endpoints = [endpoint for endpoint in ENDPOINTS if endpoint.name in names]
+        return endpoints
+
+    def build_context(self, base_url, endpoints, options):
+        item_ids = list(Items.objects.filter(status='available').order_by('?').values_list('id', flat=True)[:1000])
+        if not item_ids:
+            raise CommandError("No items to load test against, run with --seed N first.")
+
+        emails = list(
+            User.objects.filter(email__endswith=f'@{SEED_EMAIL_DOMAIN}', items__isnull=False)
+            .distinct().order_by('id').values_list('email', flat=True)[:options['auth_users']]
+        )
+        context = {
+            'item_ids': item_ids,
+            'category_ids': list(ItemCategory.objects.values_list('id', flat=True)),
+            'emails': emails,
+            'image': tiny_jpeg(),
+            'tokens': [],
+        }
+
+        if any(endpoint.auth for endpoint in endpoints):
+            for email in emails:
+                response = requests.post(
+                    f'{base_url}/auth/token/', json={'email': email, 'password': LOADTEST_PASSWORD}, timeout=30
+                )
+                if response.status_code == 200:
+                    context['tokens'].append(response.json()['access'])
+            if not context['tokens']:
+                raise CommandError(
+                    "Could not log in as any seeded user. Seed with this command (it sets a known password)."
+                )
+        return context
+
+    def run(self, base_url, endpoints, context, options, duration):
+        """Run `concurrency` clients for `duration` seconds. Returns ({name: (latencies, statuses, errors)}, elapsed)."""
+        lock = threading.Lock()
+        results = {endpoint.name: ([], {}, 0) for endpoint in endpoints}
+        weights = [endpoint.weight for endpoint in endpoints]
+
+        def client(number):
+            rng = random.Random(options['random_seed'] * 1000 + number)
+            session = requests.Session()
+            token = context['tokens'][number % len(context['tokens'])] if context['tokens'] else None
+            deadline = time.monotonic() + duration
+
+            local = {endpoint.name: ([], {}, 0) for endpoint in endpoints}
+            while time.monotonic() < deadline:
+                endpoint = rng.choices(endpoints, weights)[0]
+                path, kwargs = endpoint.build(context, rng)
+                if endpoint.auth:
+                    kwargs['headers'] = {'Authorization': f'Bearer {token}'}
+
+                latencies, statuses, errors = local[endpoint.name]
+                started = time.perf_counter()
+                try:
+                    response = session.request(endpoint.method, base_url + path, timeout=60, **kwargs)
+                    code, failed = str(response.status_code), response.status_code >= 400
+                except requests.RequestException:
+                    code, failed = 'error', True
+                latencies.append(round((time.perf_counter() - started) * 1000, 3))
+                statuses[code] = statuses.get(code, 0) + 1
+                errors += failed
+                local[endpoint.name] = (latencies, statuses, errors)
+
+            with lock:
+                for name, (latencies, statuses, errors) in local.items():
+                    total_latencies, total_statuses, total_errors = results[name]
+                    total_latencies.extend(latencies)
+                    for code, n in statuses.items():
+                        total_statuses[code] = total_statuses.get(code, 0) + n
+                    results[name] = (total_latencies, total_statuses, total_errors + errors)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(client, range(options['concurrency'])))
+        return results, time.monotonic() - started
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"\n{'endpoint':<16} {'reqs':>7} {'err':>5} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8}  (ms)"
+        )
+        rows = list(report['endpoints'].items()) + [('TOTAL', report['total'])]
+        for name, stats in rows:
+            if not stats['requests']:
+                continue
+            self.stdout.write(
+                f"{name:<16} {stats['requests']:>7} {stats['errors']:>5} {stats['rps']:>8.1f} "
+                f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f}"
+            )
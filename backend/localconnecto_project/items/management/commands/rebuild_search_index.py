@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from items.search import create_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for items (e.g. after raw SQL or bulk loads)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        create_index(connections[options['database']])
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
@@ -0,0 +1,362 @@
+import contextvars
+import hashlib
+import io
+import mmap
+import os
+import secrets
+import shutil
+import requests
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from cloudinary import CloudinaryImage, uploader
+from localconnecto_project.instrumentation import timed
+from .models import MediaAsset
+
+# Content-addressed image storage.
+#
+# Every stored file is keyed by the sha256 of its content: re-posting the
+# same photo takes another reference on the existing MediaAsset instead of
+# uploading it again. References are released when the ItemImage (or profile
+# image) using the asset goes away, and the asset itself is destroyed once
+# the last reference is gone. Where the bytes live is up to MEDIA_BACKEND:
+# Cloudinary in production, the local filesystem for development, CI and
+# benchmarks.
+#
+# The bookkeeping queries run on the calling thread (inside its transaction);
+# only the storage calls go to the thread pool.
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class ImageStorageError(APIException):
+    """One or more storage calls in a batch failed."""
+    status_code = status.HTTP_502_BAD_GATEWAY
+    default_detail = "Image storage is unavailable, please try again."
+    default_code = 'image_storage_error'
+
+    def __init__(self, errors, results=None):
+        super().__init__([f"{name}: {exc}" for name, exc in errors])
+        self.errors = errors
+        self.results = results or []
+
+
+_executor = None
+
+
+def get_executor():
+    # Created lazily so every (forked) web or Celery worker gets its own pool
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_STORAGE_MAX_WORKERS,
+            thread_name_prefix='image-storage'
+        )
+    return _executor
+
+
+def run_storage_calls(func, args):
+    """
+    Run `func` for every argument on the storage thread pool and return the
+    results in order. Each call may take up to IMAGE_STORAGE_TIMEOUT seconds.
+    Failures do not stop the other calls; they are raised together as an
+    ImageStorageError carrying the successful results (None for failures).
+    """
+    args = list(args)
+    if len(args) > 1:
+        # Each call runs in a copy of the caller's context so the request's instrumentation sees it
+        futures = [get_executor().submit(contextvars.copy_context().run, func, arg) for arg in args]
+    else:
+        futures = None
+
+    results, errors = [], []
+    for i, arg in enumerate(args):
+        try:
+            if futures is None:
+                results.append(func(arg))
+            else:
+                results.append(futures[i].result(timeout=settings.IMAGE_STORAGE_TIMEOUT))
+        except Exception as exc:
+            results.append(None)
+            errors.append((getattr(arg, 'name', arg), exc))
+
+    if errors:
+        raise ImageStorageError(errors, results)
+    return results
+
+
+# Backends
+
+class CloudinaryBackend:
+
+    @timed('storage')
+    def upload(self, file, public_id):
+        """Store `file` as `public_id`. Returns (public_id, format, version)."""
+        resource = uploader.upload_resource(
+            file,
+            public_id=public_id,
+            overwrite=False,  # already there (e.g. a lost MediaAsset row): keep it
+            type='upload',
+            resource_type='image',
+            timeout=settings.IMAGE_STORAGE_TIMEOUT,
+        )
+        return resource.public_id, resource.format, str(resource.version or 1)
+
+    @timed('storage')
+    def destroy(self, public_id):
+        uploader.destroy(public_id, timeout=settings.IMAGE_STORAGE_TIMEOUT)
+
+    @timed('storage')
+    def open(self, public_id, format, version):
+        response = requests.get(self.url(public_id, format, version), timeout=settings.IMAGE_STORAGE_TIMEOUT)
+        response.raise_for_status()
+        return io.BytesIO(response.content)
+
+    def url(self, public_id, format, version):
+        return CloudinaryImage(public_id, format=format, version=version).build_url(secure=True)
+
+    def representation(self, resource):
+        # What the API has always returned: the stored `image/upload/v<version>/<public_id>.<format>`
+        return resource.get_prep_value()
+
+
+class LocalBackend:
+    """Files under MEDIA_ROOT, served from MEDIA_URL (by runserver when DEBUG is on)."""
+
+    def path(self, public_id, format):
+        return os.path.join(settings.MEDIA_ROOT, f'{public_id}.{format}')
+
+    @timed('storage')
+    def upload(self, file, public_id):
+        name = file if isinstance(file, (str, os.PathLike)) else getattr(file, 'name', '')
+        format = os.path.splitext(str(name))[1].lstrip('.').lower() or 'jpg'
+        path = self.path(public_id, format)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written next to the target and renamed, so readers never see half a file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'wb') as out:
+                if isinstance(file, (str, os.PathLike)):
+                    with open(file, 'rb') as source:
+                        shutil.copyfileobj(source, out)
+                else:
+                    file.seek(0)
+                    shutil.copyfileobj(file, out)
+            os.replace(tmp_path, path)
+        return public_id, format, '1'
+
+    @timed('storage')
+    def open(self, public_id, format, version):
+        return open(self.path(public_id, format), 'rb')
+
+    @timed('storage')
+    def destroy(self, public_id):
+        directory, name = os.path.split(os.path.join(settings.MEDIA_ROOT, public_id))
+        for entry in os.listdir(directory) if os.path.isdir(directory) else []:
+            if os.path.splitext(entry)[0] == name:
+                os.remove(os.path.join(directory, entry))
+
+    def url(self, public_id, format, version):
+        return f'{settings.MEDIA_URL}{public_id}.{format}'
+
+    def representation(self, resource):
+        return self.url(resource.public_id, resource.format, resource.version)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.MEDIA_BACKEND)()
+    return _backend
+
+
+# Content hashing
+
+def content_digest(file):
+    """sha256 hex digest and size of a local path or a (Django) file object."""
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            return _digest(f)
+    return _digest(file)
+
+
+def _digest(f):
+    try:
+        fileno = f.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        fileno = None
+
+    if fileno is not None:
+        size = os.fstat(fileno).st_size
+        if size:
+            # Hash straight from the page cache instead of copying the file into memory
+            with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as mapped:
+                return hashlib.sha256(mapped).hexdigest(), size
+
+    digest, size = hashlib.sha256(), 0
+    f.seek(0)
+    for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    f.seek(0)
+    return digest.hexdigest(), size
+
+
+def asset_public_id(digest):
+    # Unique per upload: content stored again while collect() is destroying
+    # its previous copy must not share that copy's public id
+    return f'{settings.MEDIA_ASSET_FOLDER}/{digest}_{secrets.token_hex(4)}'
+
+
+def variant_public_id(public_id, size, format):
+    """Public id of one derivative (see items/derivatives.py)."""
+    return f'{public_id}_{size}_{format}'
+
+
+def stored_public_ids(asset):
+    """The original and every derivative stored for `asset`."""
+    return [asset.public_id] + [
+        variant_public_id(asset.public_id, size, format)
+        for size, variant in asset.variants.items()
+        for format in variant if format not in ('width', 'height')
+    ]
+
+
+def asset_url(asset):
+    return get_backend().url(asset.public_id, asset.format, asset.version)
+
+
+# References
+
+def store_files(files):
+    """
+    Take a reference on the stored asset for each file, uploading only the
+    content that is not stored yet. Returns the MediaAssets in file order.
+    On failure nothing stays referenced and the error is raised as an
+    ImageStorageError.
+    """
+    files = list(files)
+    hashed = [content_digest(file) for file in files]
+    wanted = Counter(digest for digest, _ in hashed)
+
+    # Known content: one UPDATE per distinct digest, no upload
+    assets = {}
+    for digest, count in wanted.items():
+        if MediaAsset.objects.filter(digest=digest).update(refcount=F('refcount') + count):
+            assets[digest] = None
+    for asset in MediaAsset.objects.filter(digest__in=assets):
+        assets[asset.digest] = asset
+
+    missing = {}
+    for file, (digest, size) in zip(files, hashed):
+        if digest not in assets and digest not in missing:
+            missing[digest] = (file, size)
+
+    backend = get_backend()
+    try:
+        uploaded = run_storage_calls(
+            lambda digest: backend.upload(missing[digest][0], asset_public_id(digest)), list(missing)
+        )
+    except ImageStorageError as e:
+        # Leave nothing referenced: give back the references taken above, and
+        # register the uploads that did go through unreferenced so they are
+        # collected like any other unused asset
+        release([asset.public_id for asset in assets.values() for _ in range(wanted[asset.digest])])
+        stored = [
+            register(digest, *result, missing[digest][1], refcount=0)
+            for digest, result in zip(missing, e.results) if result is not None
+        ]
+        if stored:
+            transaction.on_commit(lambda: collect([asset.digest for asset in stored]))
+        raise
+
+    for digest, (public_id, format, version) in zip(missing, uploaded):
+        assets[digest] = register(digest, public_id, format, version, missing[digest][1], wanted[digest])
+
+    return [assets[digest] for digest, _ in hashed]
+
+
+def register(digest, public_id, format, version, size, refcount):
+    try:
+        with transaction.atomic():
+            return MediaAsset.objects.create(
+                digest=digest, public_id=public_id, format=format, version=version, size=size, refcount=refcount
+            )
+    except IntegrityError:
+        # Someone stored the same content concurrently: share theirs, drop ours
+        MediaAsset.objects.filter(digest=digest).update(refcount=F('refcount') + refcount)
+        transaction.on_commit(lambda: destroy([public_id]))
+        return MediaAsset.objects.get(digest=digest)
+
+
+def release(public_ids):
+    """
+    Drop one reference per public id. Assets left without references are
+    destroyed after the transaction commits. Public ids without a MediaAsset
+    (stored before de-duplication) are destroyed directly.
+    """
+    counts = Counter(public_id for public_id in public_ids if public_id)
+    if not counts:
+        return
+
+    with transaction.atomic():
+        matching = MediaAsset.objects.filter(public_id__in=counts)
+        matching.lock()
+        assets = {asset.public_id: asset for asset in matching}
+        unreferenced = []
+        for public_id, count in counts.items():
+            asset = assets.get(public_id)
+            if asset is None:
+                continue
+            asset.refcount = max(asset.refcount - count, 0)
+            MediaAsset.objects.filter(pk=asset.pk).update(refcount=asset.refcount)
+            if not asset.refcount:
+                unreferenced.append(asset.digest)
+
+    legacy = [public_id for public_id in counts if public_id not in assets]
+    if unreferenced:
+        transaction.on_commit(lambda: collect(unreferenced))
+    if legacy:
+        transaction.on_commit(lambda: destroy(legacy))
+
+
+def collect(digests):
+    """
+    Destroy the assets that still have no references. Their rows are claimed
+    (deleted) in a short transaction and the storage calls run after it, so
+    no lock is held while they take their time. Assets whose files could not
+    be destroyed get their rows back, still unreferenced.
+    """
+    with transaction.atomic():
+        unreferenced = MediaAsset.objects.filter(digest__in=digests, refcount=0)
+        unreferenced.lock()
+        assets = list(unreferenced)
+        MediaAsset.objects.filter(pk__in=[asset.pk for asset in assets]).delete()
+    if not assets:
+        return  # referenced again in the meantime
+
+    failed = destroy([public_id for asset in assets for public_id in stored_public_ids(asset)])
+    if failed:
+        # Unless the same content was stored again meanwhile (it has a new public id)
+        MediaAsset.objects.bulk_create(
+            [asset for asset in assets if set(stored_public_ids(asset)) & failed], ignore_conflicts=True
+        )
+
+
+def destroy(public_ids):
+    """Destroy stored files concurrently. Returns the public ids that could not be destroyed."""
+    try:
+        run_storage_calls(get_backend().destroy, public_ids)
+    except ImageStorageError as e:
+        print(f"Error deleting images: {e.detail}")
+        return {name for name, _ in e.errors}
+    return set()
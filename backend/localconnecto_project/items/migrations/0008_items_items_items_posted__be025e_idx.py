@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0007_items_condition'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='items',
+            index=models.Index(fields=['-posted_date', '-id'], name='items_items_posted__be025e_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from items.search import create_index
+    create_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    from items.search import drop_index
+    drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0008_items_items_items_posted__be025e_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index)
+    ]
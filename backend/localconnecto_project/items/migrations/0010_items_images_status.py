@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0009_items_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='items',
+            name='images_status',
+            field=models.CharField(choices=[('ready', 'Ready'), ('pending', 'Pending'), ('failed', 'Failed')], default='ready', max_length=10),
+        ),
+    ]
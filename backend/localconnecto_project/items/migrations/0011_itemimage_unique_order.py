@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:00
+
+from django.db import migrations, models
+
+
+def renumber_images(apps, schema_editor):
+    # Older add_image requests could store duplicate orders; make them dense first
+    ItemImage = apps.get_model('items', 'ItemImage')
+
+    changed = []
+    current_item, position = None, 0
+    for image in ItemImage.objects.order_by('item_id', 'order', 'id'):
+        if image.item_id != current_item:
+            current_item, position = image.item_id, 0
+        if image.order != position:
+            image.order = position
+            changed.append(image)
+        position += 1
+
+    ItemImage.objects.bulk_update(changed, ['order'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0010_items_images_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(renumber_images, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='itemimage',
+            constraint=models.UniqueConstraint(fields=('item', 'order'), name='unique_item_image_order'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def backfill_updated_at(apps, schema_editor):
+    Items = apps.get_model('items', 'Items')
+    Items.objects.update(updated_at=F('posted_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0012_items_geo_cell_items_latitude_items_longitude_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='items',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0013_items_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='items',
+            name='items_items_title_7dfc09_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='items',
+            name='items_items_listing_5334fa_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='items',
+            name='items_items_locatio_72fd93_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='items',
+            name='items_items_posted__be025e_idx',
+        ),
+        migrations.AddIndex(
+            model_name='items',
+            index=models.Index(fields=['status', '-posted_date', '-id', 'updated_at', 'price'], name='items_status_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='items',
+            index=models.Index(fields=['status', 'category', '-posted_date', '-id', 'updated_at', 'price'], name='items_status_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='items',
+            index=models.Index(fields=['status', 'listing_type', '-posted_date', '-id', 'updated_at', 'price'], name='items_status_type_idx'),
+        ),
+    ]
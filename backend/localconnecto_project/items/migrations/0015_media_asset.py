@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0014_status_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaAsset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('public_id', models.CharField(max_length=255, unique=True)),
+                ('format', models.CharField(max_length=10)),
+                ('version', models.CharField(default='1', max_length=20)),
+                ('size', models.PositiveIntegerField()),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
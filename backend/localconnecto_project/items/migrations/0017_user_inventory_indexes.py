@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0016_image_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='items',
+            index=models.Index(fields=['user', '-posted_date', '-id'], name='items_user_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='items',
+            index=models.Index(fields=['user', 'status', '-posted_date', '-id'], name='items_user_status_idx'),
+        ),
+    ]
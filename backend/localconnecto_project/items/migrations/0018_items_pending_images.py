@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0017_user_inventory_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='items',
+            name='pending_images',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -1,6 +1,90 @@
-from rest_framework.pagination import PageNumberPagination
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, CursorPagination, Cursor
 
 
 class ItemPagination(PageNumberPagination):
     page_size = 6
 
+
+class ItemCursorPagination(CursorPagination):
+    """
+    Keyset pagination on (posted_date, id) for the infinite scroll feed.
+
+    Each page is a `WHERE (posted_date, id) < (cursor)` seek instead of a
+    COUNT(*) plus OFFSET, so deep pages cost the same as the first one.
+    """
+    page_size = 6
+    ordering = ('-posted_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        self.reverse = bool(self.cursor and self.cursor.reverse)
+
+        if self.reverse:
+            queryset = queryset.order_by('posted_date', 'id')
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if self.cursor and self.cursor.position:
+            posted_date, pk = self._decode_position(self.cursor.position)
+            if self.reverse:
+                seek = Q(posted_date__gt=posted_date) | Q(posted_date=posted_date, id__gt=pk)
+            else:
+                seek = Q(posted_date__lt=posted_date) | Q(posted_date=posted_date, id__lt=pk)
+            queryset = queryset.filter(seek)
+
+        # Fetch one extra row to know whether there is another page
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+
+        if self.reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        position = self._encode_position(self.page[-1])
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        position = self._encode_position(self.page[0])
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def _encode_position(self, instance):
+        return f'{instance.posted_date.isoformat()}|{instance.pk}'
+
+    def _decode_position(self, position):
+        try:
+            posted_date, pk = position.rsplit('|', 1)
+            posted_date = parse_datetime(posted_date)
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if posted_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return posted_date, pk
+
+
+class InventoryPagination(ItemCursorPagination):
+    """Cursor pages of a seller's own listings (`users_items`)."""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,152 @@
+import re
+from django.db import connections, DatabaseError
+from rest_framework import filters
+
+# Full-text index over Items.title, description and location.
+#
+# SQLite keeps a standalone FTS5 table keyed by the item id which is updated
+# from the Items post_save/post_delete signals (see items/signals.py).
+# PostgreSQL uses a GIN expression index over the same weighted tsvector, so
+# it needs no extra bookkeeping. Any other backend falls back to SearchFilter.
+
+FTS_TABLE = 'items_items_fts'
+
+# bm25() weights for title, description and location (lower score is better)
+FTS_WEIGHTS = (10.0, 1.0, 5.0)
+
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(items_items.title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(items_items.location, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(items_items.description, '')), 'C')"
+)
+POSTGRES_INDEX = 'items_items_search_idx'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_fts_available = {}
+
+
+def tokenize(terms):
+    tokens = []
+    for term in terms:
+        tokens.extend(token.lower() for token in TOKEN_RE.findall(term))
+    return tokens
+
+
+def fts_available(alias):
+    """Whether the FTS5 table exists on the given SQLite database."""
+    if alias not in _fts_available:
+        connection = connections[alias]
+        _fts_available[alias] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_available[alias]
+
+
+def create_index(connection):
+    """Create (and fill) the full-text index for the connection's backend."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                    "title, description, location, tokenize='unicode61 remove_diacritics 2')"
+                )
+            except DatabaseError:
+                # SQLite built without FTS5: search falls back to icontains
+                return
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, description, location) "
+                "SELECT id, title, description, location FROM items_items"
+            )
+        elif connection.vendor == 'postgresql':
+            document = POSTGRES_DOCUMENT.replace('items_items.', '')
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX} ON items_items USING GIN (({document}))"
+            )
+    _fts_available.pop(connection.alias, None)
+
+
+def drop_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f"DROP INDEX IF EXISTS {POSTGRES_INDEX}")
+    _fts_available.pop(connection.alias, None)
+
+
+def index_items(items, using='default'):
+    """Insert or refresh the FTS rows for the given items (SQLite only)."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not fts_available(using):
+        return
+
+    items = list(items)
+    if not items:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(item.pk,) for item in items])
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, description, location) VALUES (%s, %s, %s, %s)",
+            [(item.pk, item.title, item.description, item.location) for item in items]
+        )
+
+
+def unindex_items(item_ids, using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not fts_available(using):
+        return
+
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pk,) for pk in item_ids])
+
+
+def search(queryset, terms):
+    """
+    Restrict `queryset` to items matching every term (prefix match) and
+    annotate a `search_rank`. Returns None when the database has no index.
+    """
+    tokens = tokenize(terms)
+    if not tokens:
+        return queryset
+
+    vendor = connections[queryset.db].vendor
+
+    if vendor == 'sqlite' and fts_available(queryset.db):
+        match = ' '.join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = items_items.id', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+            select={'search_rank': f'bm25({FTS_TABLE}, {weights})'},
+        ).order_by('search_rank', '-posted_date')
+
+    if vendor == 'postgresql':
+        query = ' & '.join(f'{token}:*' for token in tokens)
+        return queryset.extra(
+            where=[f"({POSTGRES_DOCUMENT}) @@ to_tsquery('simple', %s)"],
+            params=[query],
+            select={'search_rank': f"ts_rank({POSTGRES_DOCUMENT}, to_tsquery('simple', %s))"},
+            select_params=[query],
+        ).order_by('-search_rank', '-posted_date')
+
+    return None
+
+
+class ItemSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter backed by the full-text index, ordered by relevance.
+    Falls back to the icontains lookups over `search_fields` when the
+    database has no full-text index.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        results = search(queryset, terms)
+        if results is None:
+            return super().filter_queryset(request, queryset, view)
+        return results
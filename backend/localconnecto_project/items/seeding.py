@@ -0,0 +1,160 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+from users_auth.models import UserProfile
+from .models import ItemCategory, Items, ItemImage
+from .geo import geo_cell
+from . import search
+
+# Fast bulk seeding of a realistic dataset for benchmarks and load tests.
+#
+# Everything goes through bulk_create in batches, so model signals do not run:
+# no welcome mails, no automatic profiles and no per-row search indexing (the
+# search index is filled per batch instead). Seeded users are recognised by
+# their e-mail domain so the data can be removed again with `clear_dataset`.
+
+User = get_user_model()
+
+SEED_EMAIL_DOMAIN = 'seed.localconnecto.invalid'
+
+CATEGORIES = ['Stationary', 'Furniture', 'Clothing', 'Electronics', 'Home', 'Kitchen', 'Vehicles']
+
+CITIES = [
+    ('Kathmandu', 27.7172, 85.3240),
+    ('Lalitpur', 27.6588, 85.3247),
+    ('Bhaktapur', 27.6710, 85.4298),
+    ('Pokhara', 28.2096, 83.9856),
+    ('Biratnagar', 26.4525, 87.2718),
+    ('Chitwan', 27.5291, 84.3542),
+    ('Butwal', 27.7006, 83.4484),
+    ('Dharan', 26.8065, 87.2846),
+]
+
+ADJECTIVES = ['Used', 'New', 'Vintage', 'Wooden', 'Compact', 'Large', 'Red', 'Blue', 'Portable', 'Classic']
+NOUNS = ['chair', 'table', 'laptop', 'phone', 'jacket', 'bicycle', 'sofa', 'lamp', 'kettle', 'bookshelf',
+         'monitor', 'scooter', 'notebook', 'rice cooker', 'wardrobe', 'guitar', 'camera', 'helmet']
+FIRST_NAMES = ['Aarav', 'Sita', 'Ram', 'Gita', 'Hari', 'Maya', 'Bikash', 'Anita', 'Suman', 'Pooja']
+LAST_NAMES = ['Shrestha', 'Sharma', 'Thapa', 'Gurung', 'Rai', 'Tamang', 'Karki', 'Adhikari']
+
+
+@contextmanager
+def manual_timestamps():
+    """Let bulk_create keep the posted_date/updated_at values we generate."""
+    posted_date = Items._meta.get_field('posted_date')
+    updated_at = Items._meta.get_field('updated_at')
+    saved = posted_date.auto_now_add, updated_at.auto_now
+    posted_date.auto_now_add, updated_at.auto_now = False, False
+    try:
+        yield
+    finally:
+        posted_date.auto_now_add, updated_at.auto_now = saved
+
+
+def ensure_categories(using='default'):
+    existing = set(ItemCategory.objects.using(using).values_list('name', flat=True))
+    ItemCategory.objects.using(using).bulk_create(
+        [ItemCategory(name=name) for name in CATEGORIES if name not in existing]
+    )
+    return list(ItemCategory.objects.using(using).values_list('id', flat=True))
+
+
+def seed_users(count, rng, using='default', batch_size=1000, password=None):
+    start = User.objects.using(using).filter(email__endswith=f'@{SEED_EMAIL_DOMAIN}').count()
+    # Hashed once and shared: hashing per user would dominate the seeding time
+    password = make_password(password) if password else '!'  # unusable password by default
+    users = [
+        User(
+            email=f'user{start + i}@{SEED_EMAIL_DOMAIN}',
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            password=password,
+        )
+        for i in range(count)
+    ]
+    User.objects.using(using).bulk_create(users, batch_size=batch_size)
+    users = list(User.objects.using(using).filter(email__in=[user.email for user in users]))
+
+    profiles = []
+    for user in users:
+        city, lat, lng = rng.choice(CITIES)
+        profiles.append(UserProfile(
+            user=user, location=city, bio='Seeded profile',
+            latitude=lat + rng.uniform(-0.05, 0.05), longitude=lng + rng.uniform(-0.05, 0.05),
+        ))
+    UserProfile.objects.using(using).bulk_create(profiles, batch_size=batch_size)
+    return [user.pk for user in users]
+
+
+def build_item(rng, user_ids, category_ids, now):
+    city, lat, lng = rng.choice(CITIES)
+    lat, lng = lat + rng.uniform(-0.1, 0.1), lng + rng.uniform(-0.1, 0.1)
+    listing_type = 'free' if rng.random() < 0.15 else 'sell'
+    posted_date = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+    title = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}'
+    return Items(
+        user_id=rng.choice(user_ids),
+        category_id=rng.choice(category_ids),
+        title=title,
+        description=f'{title} in good condition, pick up in {city}. ' * rng.randint(1, 4),
+        posted_date=posted_date,
+        updated_at=posted_date,
+        listing_type=listing_type,
+        price=None if listing_type == 'free' else rng.randint(1, 2000) * 50,
+        location=city,
+        condition=rng.choice(['New', 'Like new', 'Used', None]),
+        status='available' if rng.random() < 0.9 else 'booked',
+        latitude=lat,
+        longitude=lng,
+        geo_cell=geo_cell(lat, lng),
+    )
+
+
+def seed_items(count, user_ids, category_ids, rng, images_per_item=1, using='default', batch_size=2000, log=None):
+    now = timezone.now()
+    created = 0
+    with manual_timestamps():
+        while created < count:
+            size = min(batch_size, count - created)
+            with transaction.atomic(using=using):
+                items = Items.objects.using(using).bulk_create(
+                    [build_item(rng, user_ids, category_ids, now) for _ in range(size)]
+                )
+                ItemImage.objects.using(using).bulk_create([
+                    ItemImage(item=item, image=f'image/upload/v1/seed/item_{item.pk}_{order}.jpg', order=order)
+                    for item in items
+                    for order in range(images_per_item)
+                ])
+                search.index_items(items, using=using)
+            created += size
+            if log:
+                log(f'  {created}/{count} items')
+    return created
+
+
+def seed_dataset(items=10000, users=500, images_per_item=1, seed=0, using='default', password=None, log=None):
+    """
+    Insert `users` sellers with profiles and `items` listings with images.
+    Seeded users can log in with `password` when one is given.
+    """
+    rng = random.Random(seed)
+    category_ids = ensure_categories(using)
+    user_ids = seed_users(users, rng, using=using, password=password)
+    return seed_items(items, user_ids, category_ids, rng, images_per_item=images_per_item, using=using, log=log)
+
+
+def clear_dataset(using='default'):
+    """Remove every seeded user together with their profiles, items and images."""
+    users = User.objects.using(using).filter(email__endswith=f'@{SEED_EMAIL_DOMAIN}')
+    items = Items.objects.using(using).filter(user__in=users)
+
+    with transaction.atomic(using=using):
+        search.unindex_items(list(items.values_list('id', flat=True)), using=using)
+        # Raw deletes: going through the collector would fire per-row signals
+        ItemImage.objects.using(using).filter(item__in=items)._raw_delete(using)
+        items._raw_delete(using)
+        UserProfile.objects.using(using).filter(user__in=users)._raw_delete(using)
+        users.delete()
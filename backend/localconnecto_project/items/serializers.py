@@ -1,18 +1,40 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from .models import ItemCategory, Items, ItemImage
 from users_auth.models import UserProfile
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.conf import settings
 import os
-from cloudinary.uploader import upload, destroy
+from .media import get_backend
+from .uploads import queue_item_images, create_item_with_images, replace_item_images
+from .lookups import get_category, get_profile, get_profiles
 
 User = get_user_model()
 
+# Which of the IMAGE_VARIANTS each representation hands out
+CARD_IMAGE_SIZES = ['card']
+LIST_IMAGE_SIZES = ['thumb', 'card']
+AVATAR_IMAGE_SIZES = ['thumb']
+
+
+def select_variants(variants, sizes):
+    if sizes is None:
+        return variants
+    return {size: variant for size, variant in variants.items() if size in sizes}
+
+
 class ProfileSerializer(serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = UserProfile
-        fields = ['id', 'image', 'bio', 'location', 'phone_number', 'created_at']
+        fields = ['id', 'image', 'image_variants', 'bio', 'location', 'phone_number', 'created_at']
         read_only_fields = ['id', 'created_at']
+
+    def get_image_variants(self, profile):
+        # Sellers are shown as avatars next to their items
+        return select_variants(profile.image_variants, AVATAR_IMAGE_SIZES)
     
 
 
@@ -24,19 +46,58 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
     def get_profile(self, user):
-        try:
-            # Access through the reverse relationship
-            user_profile = UserProfile.objects.get(user=user)
-            return ProfileSerializer(user_profile).data
-        except UserProfile.DoesNotExist:
-            return None
+        # Seller profiles come from the two-tier cache; item lists prime it in one go.
+        # Async views load them beforehand and pass them in the `profiles` context entry
+        profiles = self.context.get('profiles')
+        if profiles is not None:
+            return profiles.get(user.pk)
+        return get_profile(user.pk)
     
 
 class ItemImageSerializer(serializers.ModelSerializer):
+    """
+    `image` is the original upload; `variants` has the resized copies (empty
+    until they are generated), limited to the sizes in the `image_sizes`
+    context entry when there is one.
+    """
     class Meta:
         model = ItemImage
-        fields = ['id', 'image', 'order', 'image_public_id']
-        read_only_fields = ['id', 'image_public_id']
+        fields = ['id', 'image', 'order', 'image_public_id', 'width', 'height', 'placeholder', 'variants']
+        read_only_fields = ['id', 'image_public_id', 'width', 'height', 'placeholder', 'variants']
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if instance.image:
+            data['image'] = get_backend().representation(instance.image)
+        data['variants'] = select_variants(instance.variants, self.context.get('image_sizes'))
+        return data
+
+
+class CachedCategoryField(serializers.PrimaryKeyRelatedField):
+    """Validates the category id against the cached category list instead of a query."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+        category = get_category(pk)
+        if category is None:
+            self.fail('does_not_exist', pk_value=data)
+        return category
+
+
+class ItemListSerializer(serializers.ListSerializer):
+    """Loads the seller profiles for a whole page at once before rendering it."""
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        if 'user' in self.child.fields and 'profiles' not in self.context:
+            get_profiles({item.user_id for item in items})
+        return super().to_representation(items)
 
 
 class ItemCategorySerializer(serializers.ModelSerializer):
@@ -45,14 +106,44 @@ class ItemCategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name']
         read_only_fields = ['id']
 
-class ItemSerializers(serializers.ModelSerializer):
+def parse_field_list(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
+class DynamicFieldsMixin:
+    """
+    Sparse fieldsets for read requests: `?fields=id,title` keeps only the
+    listed fields, and fields named in `Meta.expandable_fields` are left out
+    unless requested with `?expand=user`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+
+        expand = parse_field_list(request.query_params.get('expand'))
+        for name in getattr(self.Meta, 'expandable_fields', []):
+            if name not in expand:
+                self.fields.pop(name, None)
+
+        fields = parse_field_list(request.query_params.get('fields'))
+        if fields:
+            for name in set(self.fields) - fields - expand:
+                self.fields.pop(name)
+
+
+class ItemSerializers(DynamicFieldsMixin, serializers.ModelSerializer):
     images = ItemImageSerializer(many=True, required=False, read_only=True)
     first_name = serializers.CharField(source='user.first_name', read_only=True)
     last_name = serializers.CharField(source='user.last_name', read_only=True)
     user = UserSerializer(read_only=True)
     category_name = serializers.CharField(source= 'category.name', read_only=True)
-    category = serializers.PrimaryKeyRelatedField(queryset=ItemCategory.objects.all())
+    category = CachedCategoryField(queryset=ItemCategory.objects.all())
     posted_date = serializers.DateTimeField(read_only=True, format='%d %b %Y')
+    distance_km = serializers.SerializerMethodField()
     uploaded_images = serializers.ListField(
         child= serializers.ImageField(max_length=None, use_url=True),
         write_only=True,
@@ -63,10 +154,16 @@ class ItemSerializers(serializers.ModelSerializer):
         model = Items
         fields = [
             'id', 'first_name', 'last_name', 'user', 'category_name', 'title', 'description', 'category',
-            'posted_date', 'listing_type', 'price', 'location', 'status', 'images', 'uploaded_images', 'condition'
+            'posted_date', 'listing_type', 'price', 'location', 'status', 'images', 'uploaded_images', 'condition',
+            'images_status', 'latitude', 'longitude', 'distance_km'
         ]
 
-        read_only_fields = ['id', 'first_name', 'last_name', 'posted_date']
+        read_only_fields = ['id', 'first_name', 'last_name', 'posted_date', 'images_status']
+        list_serializer_class = ItemListSerializer
+
+    def get_distance_km(self, item):
+        # Only set on `?near=` searches (see ItemsViewSet.paginate_queryset)
+        return getattr(item, 'distance_km', None)
 
     
     def validate_uploaded_images(self, upload_images):
@@ -101,68 +198,108 @@ class ItemSerializers(serializers.ModelSerializer):
         
         if listing_type == 'free' and price is not None:
             validate_data['price'] = None
+
+        if ('latitude' in validate_data) != ('longitude' in validate_data) or \
+                (validate_data.get('latitude') is None) != (validate_data.get('longitude') is None):
+            raise serializers.ValidationError("Latitude and longitude must be provided together.")
         
         return validate_data
 
-    @transaction.atomic
     def create(self, validated_data):
         uploaded_images = validated_data.pop('uploaded_images', [])
 
         if not uploaded_images:
             raise serializers.ValidationError({"uploaded_images": "At least one image is required."})
 
-        item = Items.objects.create(**validated_data)
-
-        for i, image_data in enumerate(uploaded_images):
-            item_image = ItemImage(
-                item= item,
-                order= i
-            )
+        if not settings.ITEM_IMAGE_UPLOADS_ASYNC:
+            # Stores the images before its transaction, which only covers the rows
+            return create_item_with_images(validated_data, uploaded_images)
 
-            item_image.image = image_data
-            item_image.save()
-
-            if hasattr(item_image.image, 'public_id'):
-                item_image.image_public_id = item_image.image.public_id
-                item_image.save()
-        
+        with transaction.atomic():
+            item = Items.objects.create(**validated_data)
+            queue_item_images(item, uploaded_images)
         return item
     
-    @transaction.atomic
     def update(self, instance, validated_data):
         uploaded_images = validated_data.pop('uploaded_images', None)
 
-        # Update item fields
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        
+        if uploaded_images is not None and not uploaded_images:
+            raise serializers.ValidationError({"uploaded_images": "At least one image is required."})
 
-        if uploaded_images is not None:
-            if not uploaded_images:
-                raise serializers.ValidationError({"uploaded_images": "At least one image is required."})
+        def save_fields():
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
 
-            # Delete existing images
-            for image in instance.images.all():
-                if image.image_public_id:
-                    destroy(image.image_public_id)
+        if uploaded_images and not settings.ITEM_IMAGE_UPLOADS_ASYNC:
+            # Upload the new images first, then save the fields and swap the
+            # images in one transaction
+            replace_item_images(instance, uploaded_images, save_item=save_fields)
+            return instance
 
-            instance.images.all().delete()
-            
-            # Add new images
-            for i, image_data in enumerate(uploaded_images):
-                item_image = ItemImage(
-                    item=instance,
-                    order=i
-                )
-                
-                # Save to get the folder path correctly calculated
-                item_image.image = image_data
-                item_image.save()
-
-                if hasattr(item_image.image, 'public_id'):
-                    item_image.image_public_id = item_image.image.public_id
-                    item_image.save()
-                
-        
-        return instance
\ No newline at end of file
+        with transaction.atomic():
+            save_fields()
+            if uploaded_images:
+                # The task swaps the old images for the new ones once uploaded
+                queue_item_images(instance, uploaded_images, replace=True)
+        return instance
+
+
+class ItemImportSerializer(serializers.ModelSerializer):
+    """
+    One row of a bulk import (see items/imports.py): the fields of a new
+    listing, with the images given as URLs to fetch later.
+    """
+    category = CachedCategoryField(queryset=ItemCategory.objects.all())
+    image_urls = serializers.ListField(child=serializers.URLField(), min_length=1, max_length=3)
+
+    class Meta:
+        model = Items
+        fields = [
+            'title', 'description', 'category', 'listing_type', 'price', 'location', 'condition', 'status',
+            'latitude', 'longitude', 'image_urls'
+        ]
+
+    def validate(self, attrs):
+        if attrs.get('listing_type') == 'free':
+            attrs['price'] = None
+        if (attrs.get('latitude') is None) != (attrs.get('longitude') is None):
+            raise serializers.ValidationError("Latitude and longitude must be provided together.")
+        return attrs
+
+
+class ItemCardSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """
+    Compact read-only representation for feed cards (`/items/?view=card`).
+    Only the first image is returned; the seller and description are opt-in
+    with `?expand=user,description`.
+    """
+    category_name = serializers.CharField(source='category.name', read_only=True)
+    posted_date = serializers.DateTimeField(read_only=True, format='%d %b %Y')
+    primary_image = serializers.SerializerMethodField()
+    distance_km = serializers.SerializerMethodField()
+    user = UserSerializer(read_only=True)
+
+    class Meta:
+        model = Items
+        fields = [
+            'id', 'title', 'price', 'listing_type', 'location', 'posted_date', 'category',
+            'category_name', 'condition', 'status', 'images_status', 'primary_image', 'distance_km', 'user',
+            'description'
+        ]
+        read_only_fields = fields
+        expandable_fields = ['user', 'description']
+        list_serializer_class = ItemListSerializer
+
+    def get_primary_image(self, item):
+        # `primary_images` is the sliced prefetch set up by ItemsViewSet for card lists
+        images = getattr(item, 'primary_images', None)
+        if images is None:
+            images = item.images.all()[:1]
+
+        if not images:
+            return None
+        return ItemImageSerializer(images[0], context={'image_sizes': CARD_IMAGE_SIZES}).data
+
+    def get_distance_km(self, item):
+        return getattr(item, 'distance_km', None)
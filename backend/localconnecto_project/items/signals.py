@@ -0,0 +1,79 @@
+from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete
+from django.contrib.auth import get_user_model
+from users_auth.models import UserProfile
+from .models import Items, ItemImage, ItemCategory
+from . import search
+from .media import release
+from .cache import invalidate
+from .lookups import category_cache, profile_cache
+
+User = get_user_model()
+
+
+@receiver(post_save, sender= Items)
+def index_item(sender, instance, using, **kwargs):
+    search.index_items([instance], using=using)
+
+
+@receiver(post_delete, sender= Items)
+def unindex_item(sender, instance, using, **kwargs):
+    search.unindex_items([instance.pk], using=using)
+
+
+# Any change that shows up in an item listing invalidates the cached responses
+# and bumps Items.updated_at: the list ETags are built from the cache version,
+# the item ETag/Last-Modified validators from updated_at
+@receiver([post_save, post_delete], sender= Items)
+def invalidate_item_responses(sender, **kwargs):
+    invalidate('items')
+
+
+@receiver(post_delete, sender= ItemImage)
+def release_image_asset(sender, instance, **kwargs):
+    # Also runs for images deleted along with their item
+    release([instance.image_public_id])
+
+
+@receiver(post_delete, sender= UserProfile)
+def release_profile_image_asset(sender, instance, **kwargs):
+    # Also runs for profiles deleted along with their user
+    release([instance.image_public_id])
+
+
+@receiver([post_save, post_delete], sender= ItemImage)
+def touch_image_item(sender, instance, **kwargs):
+    Items.objects.filter(pk=instance.item_id).touch()
+    invalidate('items')
+
+
+@receiver([post_save, post_delete], sender= UserProfile)
+def touch_profile_items(sender, instance, created=False, **kwargs):
+    # A new profile (every signup) has no items yet to show it
+    if created:
+        return
+    Items.objects.filter(user_id=instance.user_id).touch()
+    invalidate('items')
+
+
+@receiver([post_save, post_delete], sender= User)
+def invalidate_seller_responses(sender, instance, created=False, update_fields=None, **kwargs):
+    # Logins only touch last_login, which is never part of a listing,
+    # and new users have no items yet
+    if created or update_fields and set(update_fields) <= {'last_login'}:
+        return
+    Items.objects.filter(user_id=instance.pk).touch()
+    invalidate('items')
+
+
+@receiver([post_save, post_delete], sender= ItemCategory)
+def invalidate_category_responses(sender, instance, created=False, **kwargs):
+    if not created:
+        Items.objects.filter(category_id=instance.pk).touch()
+    invalidate('items', 'categories')
+    category_cache.invalidate('all')
+
+
+@receiver([post_save, post_delete], sender= UserProfile)
+def invalidate_profile_snapshot(sender, instance, **kwargs):
+    profile_cache.invalidate(instance.user_id)
@@ -0,0 +1,87 @@
+from celery import shared_task
+from .models import Items, MediaAsset
+from .cache import invalidate
+from .derivatives import generate_variants, apply_variants
+from .media import release, run_storage_calls, store_files, ImageStorageError
+from .uploads import attach_item_images, finish_pending, discard_staged, stage_url
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=10)
+def process_item_images(self, item_id, staged_paths, replace=False):
+    """Store staged images for an item and attach them."""
+    try:
+        item = Items.objects.get(pk=item_id)
+    except Items.DoesNotExist:
+        discard_staged(staged_paths)
+        return
+
+    try:
+        # Nothing stays referenced when this raises
+        uploaded = store_files(staged_paths)
+    except Exception as exc:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=exc)
+
+        finish_pending(item, len(staged_paths), 'failed')
+        invalidate('items')
+        discard_staged(staged_paths)
+        raise
+
+    try:
+        attach_item_images(item, uploaded, replace=replace)
+    except Exception:
+        # E.g. other images took the last free places meanwhile
+        release(asset.public_id for asset in uploaded)
+        finish_pending(item, len(staged_paths), 'failed')
+        invalidate('items')
+        raise
+    finally:
+        discard_staged(staged_paths)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def generate_image_variants(self, asset_id):
+    """Render the responsive derivatives of a stored image and put them on the rows using it."""
+    # Unreferenced assets are about to be collected
+    asset = MediaAsset.objects.filter(pk=asset_id, refcount__gt=0).first()
+    if asset is None:
+        return
+    if asset.variants:
+        apply_variants(asset)
+        return
+
+    try:
+        generate_variants(asset)
+    except Exception as exc:
+        # Until then the serializers fall back to the original
+        raise self.retry(exc=exc)
+
+
+@shared_task
+def import_item_images(entries):
+    """
+    Download the images of a few imported items (ITEM_IMPORT_IMAGE_BATCH),
+    given as (item id, urls) pairs, and hand each item to
+    `process_item_images`. Items none of whose images could be fetched are
+    marked failed.
+    """
+    urls = [url for _, item_urls in entries for url in item_urls]
+    try:
+        paths = run_storage_calls(stage_url, urls)
+    except ImageStorageError as e:
+        print(f"Error fetching imported images: {e.detail}")
+        paths = e.results
+
+    failed = []
+    position = 0
+    for item_id, item_urls in entries:
+        item_paths = [path for path in paths[position:position + len(item_urls)] if path is not None]
+        position += len(item_urls)
+        if item_paths:
+            process_item_images.delay(item_id, item_paths)
+        else:
+            failed.append(item_id)
+
+    if failed:
+        Items.objects.filter(pk__in=failed).touch(images_status='failed')
+        invalidate('items')
@@ -1,3 +1,1238 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections, transaction
+from django.http import HttpResponse, QueryDict
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+import requests
+from asgiref.sync import async_to_sync
+from requests.adapters import HTTPAdapter
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from localconnecto_project import instrumentation
+from localconnecto_project.async_views import Fallback, async_read_view
+from localconnecto_project.tiered_cache import TieredCache
+from users_auth.models import UserProfile
+from . import derivatives, media, uploads
+from .async_views import categories_list, item_detail, items_list
+from .cache import build_key, get_version
+from .export import export_rows
+from .image_ordering import ImageOrderError
+from .models import ItemCategory, Items, ItemImage, MediaAsset
+from .tasks import process_item_images
+from .views import ItemsViewSet
 
-# Create your tests here.
+User = get_user_model()
+
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def create_user(email):
+    with mock.patch('users_auth.signals.welcome_mail'):
+        return User.objects.create_user(email=email, password='password')
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ImageOrderTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller = create_user('seller@example.com')
+        category, _ = ItemCategory.objects.get_or_create(name='Furniture')
+        self.item = Items.objects.create(user=self.seller, category=category, title='Chair', location='Leeds')
+        self.images = [
+            ItemImage.objects.create(item=self.item, image=f'image{i}', order=i) for i in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def image_ids(self):
+        return list(self.item.images.order_by('order').values_list('id', flat=True))
+
+    def orders(self):
+        return list(self.item.images.order_by('order').values_list('order', flat=True))
+
+    def test_reorder(self):
+        first, second, third = [image.pk for image in self.images]
+        response = self.client.put(
+            f'/items/{self.item.pk}/reorder-images/', {'image_order': [third, first, second]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.image_ids(), [third, first, second])
+        self.assertEqual(self.orders(), [0, 1, 2])
+
+    def test_reorder_needs_every_image_once(self):
+        first, second, third = [image.pk for image in self.images]
+        for image_order in [[first, second], [first, second, second], [first, second, third, 0], ['x', first, second], []]:
+            response = self.client.put(
+                f'/items/{self.item.pk}/reorder-images/', {'image_order': image_order}, format='json'
+            )
+            self.assertEqual(response.status_code, 400, image_order)
+        self.assertEqual(self.image_ids(), [first, second, third])
+
+    def test_remove_closes_gap(self):
+        first, second, third = [image.pk for image in self.images]
+        response = self.client.delete(f'/items/{self.item.pk}/remove-image/{first}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.image_ids(), [second, third])
+        self.assertEqual(self.orders(), [0, 1])
+
+    def test_remove_then_reorder(self):
+        first, second, third = [image.pk for image in self.images]
+        self.client.delete(f'/items/{self.item.pk}/remove-image/{second}/')
+        response = self.client.put(
+            f'/items/{self.item.pk}/reorder-images/', {'image_order': [third, first]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.image_ids(), [third, first])
+        self.assertEqual(self.orders(), [0, 1])
+
+    def test_last_image_is_kept(self):
+        first, second, third = [image.pk for image in self.images]
+        self.client.delete(f'/items/{self.item.pk}/remove-image/{first}/')
+        self.client.delete(f'/items/{self.item.pk}/remove-image/{second}/')
+        response = self.client.delete(f'/items/{self.item.pk}/remove-image/{third}/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.image_ids(), [third])
+        self.assertEqual(self.orders(), [0])
+
+    def test_remove_unknown_image(self):
+        other = Items.objects.create(user=self.seller, category=self.item.category, title='Table', location='Leeds')
+        foreign = ItemImage.objects.create(item=other, image='other', order=0)
+        response = self.client.delete(f'/items/{self.item.pk}/remove-image/{foreign.pk}/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(len(self.image_ids()), 3)
+
+    def test_only_owner_can_change_images(self):
+        self.client.force_authenticate(create_user('buyer@example.com'))
+        response = self.client.delete(f'/items/{self.item.pk}/remove-image/{self.images[0].pk}/')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(len(self.image_ids()), 3)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ImageLimitRaceTests(TransactionTestCase):
+    """Two requests adding an image to an item one short of the limit, on separate connections."""
+
+    def setUp(self):
+        cache.clear()
+        seller = create_user('seller@example.com')
+        category, _ = ItemCategory.objects.get_or_create(name='Furniture')
+        self.item = Items.objects.create(user=seller, category=category, title='Chair', location='Leeds')
+        for i in range(2):
+            ItemImage.objects.create(item=self.item, image=f'image{i}', order=i)
+        self.assets = [
+            MediaAsset.objects.create(
+                digest=f'{i}' * 64, public_id=f'asset{i}', format='jpg', size=1, refcount=2, variants={'thumb': {}}
+            )
+            for i in range(2)
+        ]
+
+    def test_concurrent_adds_respect_limit(self):
+        check_image_capacity = uploads.check_image_capacity
+
+        def slow_check(*args):
+            # Widen the window between the count and the insert
+            check_image_capacity(*args)
+            time.sleep(0.3)
+
+        results = []
+
+        def add(asset):
+            try:
+                with mock.patch.object(uploads, 'store_files', return_value=[asset]):
+                    uploads.add_item_images(self.item, ['file'])
+                results.append('added')
+            except ImageOrderError:
+                results.append('full')
+            finally:
+                connection.close()
+
+        with mock.patch.object(uploads, 'check_image_capacity', slow_check):
+            threads = [threading.Thread(target=add, args=(asset,)) for asset in self.assets]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(sorted(results), ['added', 'full'])
+        self.assertEqual(self.item.images.count(), 3)
+        self.assertEqual(list(self.item.images.values_list('order', flat=True)), [0, 1, 2])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CursorPaginationTests(TestCase):
+
+    def setUp(self):
+        # Ids are reused once a test rolls back: no responses cached by an earlier one
+        cache.clear()
+        seller = create_user('seller@example.com')
+        category, _ = ItemCategory.objects.get_or_create(name='Furniture')
+        posted = timezone.now() - timedelta(days=1)
+        self.items = []
+        for i in range(14):
+            item = Items.objects.create(user=seller, category=category, title=f'Lamp {i}', location='Leeds')
+            # Pairs share a posted date, so the id has to break the tie
+            Items.objects.filter(pk=item.pk).update(posted_date=posted + timedelta(minutes=i // 2))
+            self.items.append(item.pk)
+        # Newest first
+        self.expected = sorted(self.items, key=lambda pk: (self.items.index(pk) // 2, pk), reverse=True)
+        self.client = APIClient()
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ids(self, page):
+        return [item['id'] for item in page['results']]
+
+    def test_next_pages(self):
+        first = self.get('/items/', pagination='cursor')
+        self.assertNotIn('count', first)
+        self.assertIsNone(first['previous'])
+        second = self.get(first['next'])
+        third = self.get(second['next'])
+        self.assertIsNone(third['next'])
+        self.assertEqual(self.ids(first) + self.ids(second) + self.ids(third), self.expected)
+
+    def test_previous_pages(self):
+        first = self.get('/items/', pagination='cursor')
+        second = self.get(first['next'])
+        third = self.get(second['next'])
+
+        back = self.get(third['previous'])
+        self.assertEqual(self.ids(back), self.ids(second))
+        back = self.get(back['previous'])
+        self.assertEqual(self.ids(back), self.ids(first))
+        self.assertIsNone(back['previous'])
+
+    def test_items_added_while_paging(self):
+        first = self.get('/items/', pagination='cursor')
+        Items.objects.create(
+            user=User.objects.get(email='seller@example.com'), category=ItemCategory.objects.get(name='Furniture'),
+            title='New lamp', location='Leeds'
+        )
+        second = self.get(first['next'])
+        self.assertEqual(self.ids(second), self.expected[6:12])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/items/', {'pagination': 'cursor', 'cursor': 'junk'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_search_is_paged_by_number(self):
+        page = self.get('/items/', pagination='cursor', search='lamp')
+        self.assertEqual(page['count'], 14)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller = create_user('seller@example.com')
+        category, _ = ItemCategory.objects.get_or_create(name='Furniture')
+        self.item = Items.objects.create(user=self.seller, category=category, title='Lamp', location='Leeds')
+        self.client = APIClient()
+
+    def test_list_not_modified(self):
+        etag = self.client.get('/items/')['ETag']
+        # Answered from the cache version alone, without scanning the listings
+        with self.assertNumQueries(0):
+            response = self.client.get('/items/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_etag_follows_changes(self):
+        etag = self.client.get('/items/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.title = 'Brass lamp'
+            self.item.save()
+
+        response = self.client.get('/items/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'][0]['title'], 'Brass lamp')
+
+    def test_list_etag_depends_on_query(self):
+        etag = self.client.get('/items/')['ETag']
+        response = self.client.get('/items/', {'listing_type': 'free'}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_cached_list_needs_no_query(self):
+        self.client.get('/items/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/items/')
+        self.assertEqual(response.json()['count'], 1)
+
+    def test_detail_not_modified(self):
+        response = self.client.get(f'/items/{self.item.pk}/')
+        self.assertEqual(
+            self.client.get(f'/items/{self.item.pk}/', headers={'If-None-Match': response['ETag']}).status_code, 304
+        )
+        self.assertEqual(
+            self.client.get(
+                f'/items/{self.item.pk}/', headers={'If-Modified-Since': response['Last-Modified']}
+            ).status_code,
+            304
+        )
+
+    def test_detail_changes_with_item(self):
+        etag = self.client.get(f'/items/{self.item.pk}/')['ETag']
+        Items.objects.filter(pk=self.item.pk).touch()
+        response = self.client.get(f'/items/{self.item.pk}/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_non_numeric_id(self):
+        self.assertEqual(self.client.get('/items/abc/').status_code, 404)
+
+    async def test_async_list_not_modified(self):
+        # The handler served under ASGI (ASYNC_READ_VIEWS), called directly
+        response = await items_list(AsyncRequestFactory().get('/items/'))
+        self.assertEqual(json.loads(response.content)['count'], 1)
+
+        response = await items_list(AsyncRequestFactory().get('/items/', headers={'If-None-Match': response['ETag']}))
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class LocalMediaTestCase(TestCase):
+    """Stores media with LocalBackend, under a MEDIA_ROOT of its own."""
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        backend = mock.patch.object(media, '_backend', media.LocalBackend())
+        backend.start()
+        self.addCleanup(backend.stop)
+
+    def image(self, content=b'photo'):
+        return SimpleUploadedFile('photo.jpg', content)
+
+    def png(self, size=(2000, 1000), color='orange'):
+        out = io.BytesIO()
+        Image.new('RGB', size, color).save(out, 'PNG')
+        return SimpleUploadedFile('photo.png', out.getvalue())
+
+    def stored_file(self, asset):
+        return media.get_backend().path(asset.public_id, asset.format)
+
+
+class MediaAssetTests(LocalMediaTestCase):
+
+    def test_same_content_is_stored_once(self):
+        with mock.patch.object(media.LocalBackend, 'upload', autospec=True, side_effect=media.LocalBackend.upload) as upload:
+            first, = media.store_files([self.image()])
+            second, third = media.store_files([self.image(), self.image(b'other')])
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(upload.call_count, 2)
+        self.assertEqual(MediaAsset.objects.get(pk=first.pk).refcount, 2)
+        self.assertEqual(MediaAsset.objects.get(pk=third.pk).refcount, 1)
+
+    def test_last_release_destroys_asset(self):
+        asset, _ = media.store_files([self.image(), self.image()])
+        self.assertTrue(os.path.exists(self.stored_file(asset)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            media.release([asset.public_id])
+        self.assertEqual(MediaAsset.objects.get(pk=asset.pk).refcount, 1)
+        self.assertTrue(os.path.exists(self.stored_file(asset)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            media.release([asset.public_id])
+        self.assertFalse(MediaAsset.objects.filter(pk=asset.pk).exists())
+        self.assertFalse(os.path.exists(self.stored_file(asset)))
+
+    def test_deleting_image_releases_asset(self):
+        seller = create_user('seller@example.com')
+        category, _ = ItemCategory.objects.get_or_create(name='Furniture')
+        item = Items.objects.create(user=seller, category=category, title='Chair', location='Leeds')
+        asset, = media.store_files([self.image()])
+        image = ItemImage.objects.create(item=item, image=asset.as_resource(), image_public_id=asset.public_id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.assertFalse(MediaAsset.objects.filter(pk=asset.pk).exists())
+
+    def test_failed_destroy_keeps_asset(self):
+        asset, = media.store_files([self.image()])
+        with mock.patch.object(media.LocalBackend, 'destroy', side_effect=OSError('unavailable')), \
+                self.captureOnCommitCallbacks(execute=True):
+            media.release([asset.public_id])
+        # Back, unreferenced, for the next collect()
+        self.assertEqual(MediaAsset.objects.get(digest=asset.digest).refcount, 0)
+        self.assertTrue(os.path.exists(self.stored_file(asset)))
+
+
+class ImageVariantTests(LocalMediaTestCase):
+
+    def test_variants_copied_to_images_and_profiles(self):
+        seller = create_user('seller@example.com')
+        category, _ = ItemCategory.objects.get_or_create(name='Furniture')
+        item = Items.objects.create(user=seller, category=category, title='Chair', location='Leeds')
+        asset, = media.store_files([self.png()])
+        ItemImage.objects.create(item=item, image=asset.as_resource(), image_public_id=asset.public_id)
+        profile = UserProfile.objects.get(user=seller)
+        profile.image_public_id = asset.public_id
+        profile.save()
+        before = Items.objects.get(pk=item.pk).updated_at
+
+        with self.captureOnCommitCallbacks(execute=True):
+            derivatives.generate_variants(asset)
+
+        image = ItemImage.objects.get(item=item)
+        self.assertEqual((image.width, image.height), (2000, 1000))
+        self.assertTrue(image.placeholder.startswith('data:image/webp;base64,'))
+        self.assertEqual(
+            {size: (variant['width'], variant['height']) for size, variant in image.variants.items()},
+            {'thumb': (160, 80), 'card': (480, 240), 'full': (1280, 640)}
+        )
+        self.assertEqual(set(image.variants['card']), {'width', 'height', 'webp', 'jpeg'})
+        self.assertEqual(MediaAsset.objects.get(pk=asset.pk).variants, image.variants)
+        self.assertEqual(UserProfile.objects.get(user=seller).image_variants, image.variants)
+        self.assertGreater(Items.objects.get(pk=item.pk).updated_at, before)
+
+    def test_small_images_not_upscaled(self):
+        asset, = media.store_files([self.png((100, 50))])
+        derivatives.generate_variants(asset)
+        self.assertEqual(
+            {(variant['width'], variant['height']) for variant in asset.variants.values()}, {(100, 50)}
+        )
+
+
+@override_settings(CACHES=LOCAL_CACHE, ITEM_IMPORT_IMAGE_BATCH=2)
+class ImportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller = create_user('seller@example.com')
+        self.category, _ = ItemCategory.objects.get_or_create(name='Furniture')
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def row(self, title, **fields):
+        return {
+            'title': title, 'category': self.category.pk, 'price': '10.00', 'location': 'Leeds',
+            'image_urls': [f'https://images.example.com/{title}.jpg'], **fields
+        }
+
+    def test_valid_rows_created_and_images_fetched_in_batches(self):
+        rows = [self.row('Chair'), self.row('Table', price='cheap'), self.row('Lamp'), self.row('Rug')]
+        with mock.patch('items.tasks.import_item_images.delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/items/import/', rows, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        result = response.json()
+        self.assertEqual(result['created'], 3)
+        self.assertEqual([error['row'] for error in result['errors']], [2])
+        self.assertIn('price', result['errors'][0]['errors'])
+
+        chair, lamp, rug = result['ids']
+        self.assertEqual(
+            [call.args[0] for call in delay.call_args_list],
+            [
+                [(chair, ['https://images.example.com/Chair.jpg']), (lamp, ['https://images.example.com/Lamp.jpg'])],
+                [(rug, ['https://images.example.com/Rug.jpg'])],
+            ]
+        )
+        self.assertEqual(
+            set(Items.objects.filter(pk__in=result['ids']).values_list('images_status', flat=True)), {'pending'}
+        )
+
+    def test_only_invalid_rows(self):
+        response = self.client.post('/items/import/', [self.row('Chair', image_urls=[])], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['created'], 0)
+
+
+def resolves_to(*addresses):
+    return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', (address, 443)) for address in addresses]
+
+
+class PublicUrlTests(SimpleTestCase):
+
+    def respond(self, status=200, headers=None):
+        def send(adapter, request, **kwargs):
+            response = requests.Response()
+            response.status_code = status
+            response.headers.update(headers or {'Content-Type': 'image/jpeg'})
+            response.raw = io.BytesIO(b'')
+            response.url, response.request = request.url, request
+            return response
+        return mock.patch.object(HTTPAdapter, 'send', autospec=True, side_effect=send)
+
+    def test_internal_addresses_rejected(self):
+        for url in [
+            'http://127.0.0.1/a.jpg', 'http://169.254.169.254/latest/meta-data/', 'http://10.0.0.5/a.jpg',
+            'http://[::1]/a.jpg', 'http://[::ffff:127.0.0.1]/a.jpg', 'http://0.0.0.0/a.jpg',
+            'ftp://images.example.com/a.jpg', 'file:///etc/passwd',
+        ]:
+            with self.subTest(url=url), self.assertRaises(ValueError):
+                uploads.check_public_url(url)
+
+    def test_host_with_any_internal_address_rejected(self):
+        with mock.patch('socket.getaddrinfo', return_value=resolves_to('93.184.216.34', '10.0.0.5')), \
+                self.assertRaises(ValueError):
+            uploads.check_public_url('https://images.example.com/a.jpg')
+
+    def test_connects_to_the_checked_address(self):
+        # A second lookup would answer with an internal address (DNS rebinding)
+        lookups = [resolves_to('93.184.216.34'), resolves_to('127.0.0.1')]
+        with mock.patch('socket.getaddrinfo', side_effect=lookups) as getaddrinfo, self.respond() as send:
+            response = uploads.open_public_url('https://images.example.com/photos/a.jpg?size=large')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(getaddrinfo.call_count, 1)
+        adapter, request = send.call_args.args
+        self.assertEqual(request.url, 'https://93.184.216.34/photos/a.jpg?size=large')
+        self.assertEqual(request.headers['Host'], 'images.example.com')
+        _, pool_kwargs = adapter.build_connection_pool_key_attributes(request, True)
+        # TLS still checks the certificate against the name
+        self.assertEqual(pool_kwargs['server_hostname'], 'images.example.com')
+        self.assertEqual(pool_kwargs['assert_hostname'], 'images.example.com')
+
+    def test_redirect_to_internal_address_rejected(self):
+        with mock.patch('socket.getaddrinfo', return_value=resolves_to('93.184.216.34')), \
+                self.respond(302, {'Location': 'http://169.254.169.254/latest/meta-data/'}), \
+                self.assertRaises(ValueError):
+            uploads.open_public_url('https://images.example.com/a.jpg')
+
+
+@override_settings(CACHES=LOCAL_CACHE, REPLICA_DATABASES=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    # `replica` mirrors the test database (see settings.py) but is its own
+    # connection, so the queries each one runs show where a request read.
+    # Not a TestCase: reads inside its transaction would all stay on the primary
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.seller = create_user('seller@example.com')
+        category, _ = ItemCategory.objects.get_or_create(name='Furniture')
+        self.item = Items.objects.create(user=self.seller, category=category, title='Chair', location='Leeds')
+        self.client = APIClient()
+
+    def queries(self, method, url, data=None):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 300)
+        return len(primary), len(replica)
+
+    def test_public_reads_use_replica(self):
+        for url in ['/items/', f'/items/{self.item.pk}/', '/categories/']:
+            with self.subTest(url=url):
+                primary, replica = self.queries('get', url)
+                self.assertEqual(primary, 0)
+                self.assertGreater(replica, 0)
+
+    def test_other_reads_use_primary(self):
+        self.client.force_authenticate(self.seller)
+        primary, replica = self.queries('get', '/items/users_items/')
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_writes_use_primary_and_pin_writer(self):
+        self.client.force_authenticate(self.seller)
+        self.assertGreater(self.queries('get', '/items/')[1], 0)
+
+        primary, replica = self.queries('patch', f'/items/{self.item.pk}/', {'title': 'Armchair'})
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+        # The writer reads their own writes from the primary for a while...
+        self.assertEqual(self.queries('get', '/items/')[1], 0)
+        # ...unlike everyone else
+        self.client.force_authenticate(None)
+        self.assertGreater(self.queries('get', f'/items/{self.item.pk}/')[1], 0)
+
+        self.client.force_authenticate(self.seller)
+        later = time.time() + settings.REPLICA_STICKY_SECONDS + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertGreater(self.queries('get', '/items/')[1], 0)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class TieredCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tiered = TieredCache(f'test-{self._testMethodName}')
+
+    def test_missing_values_cached(self):
+        loader = mock.Mock(return_value=None)
+        self.assertIsNone(self.tiered.get('gone', loader))
+        self.assertIsNone(self.tiered.get('gone', loader))
+        self.tiered.drop_local()  # As in another worker: from L2
+        self.assertIsNone(self.tiered.get('gone', loader))
+        self.assertEqual(loader.call_count, 1)
+
+        loader = mock.Mock(return_value={1: 'one'})
+        self.assertEqual(self.tiered.get_many([1, 2], loader), {1: 'one'})
+        self.tiered.drop_local()
+        self.assertEqual(self.tiered.get_many([1, 2], loader), {1: 'one'})
+        loader.assert_called_once_with([1, 2])
+
+    def test_invalidation_during_load_not_written_back(self):
+        def load_old():
+            # A writer commits and invalidates while the value is being loaded
+            self.tiered._invalidate_now('key')
+            return 'old'
+
+        self.assertEqual(self.tiered.get('key', load_old), 'old')
+        self.assertEqual(self.tiered.get('key', lambda: 'new'), 'new')
+        self.tiered.drop_local()
+        self.assertEqual(self.tiered.get('key', lambda: 'newer'), 'new')
+
+    def test_invalidation_during_many_load_not_written_back(self):
+        def load_old(keys):
+            self.tiered._invalidate_now(1)
+            return {key: 'old' for key in keys}
+
+        self.assertEqual(self.tiered.get_many([1, 2], load_old), {1: 'old', 2: 'old'})
+        self.assertEqual(self.tiered.get_many([1, 2], lambda keys: {key: 'new' for key in keys}), {1: 'new', 2: 'old'})
+
+    async def test_async_invalidation_during_load_not_written_back(self):
+        async def load_old():
+            self.tiered._invalidate_now('key')
+            return 'old'
+
+        async def load_new():
+            return 'new'
+
+        self.assertEqual(await self.tiered.aget('key', load_old), 'old')
+        self.assertEqual(await self.tiered.aget('key', load_new), 'new')
+
+
+@override_settings(CACHES=LOCAL_CACHE, SERVER_TIMING_HEADER=True, PROFILE_SAMPLE_RATE=0)
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        seller = create_user('seller@example.com')
+        category, _ = ItemCategory.objects.get_or_create(name='Furniture')
+        Items.objects.create(user=seller, category=category, title='Chair', location='Leeds')
+
+    def metrics(self, response):
+        return {
+            metric.split(';')[0]: dict(part.split('=', 1) for part in metric.split(';')[1:])
+            for metric in response['Server-Timing'].split(', ')
+        }
+
+    def test_request_queries_counted(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/items/')
+        metrics = self.metrics(response)
+        self.assertEqual(metrics['db']['desc'], f'"{len(queries)} queries"')
+        self.assertIn('cache', metrics)
+        self.assertIn('total', metrics)
+        # Only for the request
+        self.assertEqual(connection.execute_wrappers, [])
+
+    def test_only_project_cache_calls_counted(self):
+        def view(request):
+            instrumentation.cache.get('counted')
+            cache.get('not counted')
+            return HttpResponse()
+
+        response = instrumentation.InstrumentationMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(self.metrics(response)['cache']['desc'], '"1 call"')
+        self.assertNotIn('db', self.metrics(response))
+
+    async def test_async_request_queries_counted(self):
+        async def view(request):
+            await Items.objects.acount()
+            await instrumentation.cache.aget('counted')
+            return HttpResponse()
+
+        response = await instrumentation.InstrumentationMiddleware(view)(AsyncRequestFactory().get('/'))
+        metrics = self.metrics(response)
+        self.assertEqual(metrics['db']['desc'], '"1 query"')
+        self.assertEqual(metrics['cache']['desc'], '"1 call"')
+
+    def test_storage_calls_counted(self):
+        def view(request):
+            media.LocalBackend().destroy('missing')
+            return HttpResponse()
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            response = instrumentation.InstrumentationMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(self.metrics(response)['storage']['desc'], '"1 call"')
+
+    def test_disabled(self):
+        with override_settings(SERVER_TIMING_HEADER=False):
+            response = self.client.get('/items/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(connection.execute_wrappers, [])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ItemQueryCountTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category, _ = ItemCategory.objects.get_or_create(name='Furniture')
+        self.client = APIClient()
+        self.add_items(2)
+
+    def add_items(self, count):
+        for _ in range(count):
+            seller = create_user(f'seller{Items.objects.count()}@example.com')
+            item = Items.objects.create(user=seller, category=self.category, title='Chair', location='Leeds')
+            for order in range(2):
+                ItemImage.objects.create(item=item, image='image/upload/v1/chair.jpg', image_public_id='chair', order=order)
+        return item
+
+    def count_queries(self, url):
+        # Nothing cached: every request builds its response
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_list_queries_do_not_grow_with_page(self):
+        few, page = self.count_queries('/items/')
+        self.add_items(3)
+        many, page = self.count_queries('/items/')
+        self.assertEqual(len(page['results']), 5)
+        self.assertEqual(many, few)
+        self.assertTrue(all(len(item['images']) == 2 for item in page['results']))
+
+    def test_retrieve_queries_do_not_grow_with_images(self):
+        item = self.add_items(1)
+        few, _ = self.count_queries(f'/items/{item.pk}/')
+        ItemImage.objects.create(item=item, image='image/upload/v1/chair.jpg', image_public_id='chair', order=2)
+        many, data = self.count_queries(f'/items/{item.pk}/')
+        self.assertEqual(len(data['images']), 3)
+        self.assertEqual(many, few)
+
+
+@override_settings(CACHES=LOCAL_CACHE, THROTTLE_ENABLED=False)
+class SearchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller = create_user('seller@example.com')
+        self.category, _ = ItemCategory.objects.get_or_create(name='Furniture')
+        self.client = APIClient()
+
+    def create(self, title, description='', location='Leeds'):
+        return Items.objects.create(
+            user=self.seller, category=self.category, title=title, description=description, location=location
+        ).pk
+
+    def search(self, terms):
+        response = self.client.get('/items/', {'search': terms})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.json()['results']]
+
+    def test_title_matches_rank_first(self):
+        in_description = self.create('Chair', description='Matches the oak table')
+        in_title = self.create('Oak table')
+        in_location = self.create('Lamp', location='Tablehurst')
+        self.create('Sofa')
+        self.assertEqual(self.search('table'), [in_title, in_location, in_description])
+
+    def test_every_term_must_match_as_a_prefix(self):
+        oak = self.create('Oak table')
+        self.create('Pine table')
+        self.assertEqual(self.search('tab oa'), [oak])
+        self.assertEqual(self.search('TABLE, "oak"'), [oak])
+
+    def test_accents_ignored(self):
+        cafe = self.create('Café chair')
+        self.assertEqual(self.search('cafe'), [cafe])
+
+    def test_index_follows_changes(self):
+        pk = self.create('Oak table')
+        Items.objects.get(pk=pk).delete()
+        self.assertEqual(self.search('oak'), [])
+
+        pk = self.create('Pine table')
+        item = Items.objects.get(pk=pk)
+        item.title = 'Oak desk'
+        item.save()
+        self.assertEqual(self.search('pine'), [])
+        self.assertEqual(self.search('desk'), [pk])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller = create_user('seller@example.com')
+        self.category, _ = ItemCategory.objects.get_or_create(name='Furniture')
+        self.item = Items.objects.create(user=self.seller, category=self.category, title='Lamp', location='Leeds')
+        self.client = APIClient()
+
+    def titles(self):
+        return [item['title'] for item in self.client.get('/items/').json()['results']]
+
+    def test_authenticated_requests_not_cached(self):
+        self.client.force_authenticate(self.seller)
+        self.client.get('/items/')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/items/')
+        self.assertGreater(len(queries), 0)
+
+    def test_invalidated_once_write_commits(self):
+        self.assertEqual(self.titles(), ['Lamp'])
+        with self.captureOnCommitCallbacks() as callbacks:
+            Items.objects.create(user=self.seller, category=self.category, title='Desk', location='Leeds')
+        self.assertEqual(self.titles(), ['Lamp'])
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.titles(), ['Desk', 'Lamp'])
+
+    def test_rolled_back_write_keeps_cache(self):
+        self.titles()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError), transaction.atomic():
+                self.item.title = 'Desk'
+                self.item.save()
+                raise ValueError
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles(), ['Lamp'])
+
+    def test_related_changes_invalidate(self):
+        self.titles()
+        self.client.get(f'/items/{self.item.pk}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Lighting'
+            self.category.save()
+        self.assertEqual(self.client.get('/items/').json()['results'][0]['category_name'], 'Lighting')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ItemImage.objects.create(item=self.item, image='image/upload/v1/lamp.jpg', image_public_id='lamp')
+        self.assertEqual(len(self.client.get(f'/items/{self.item.pk}/').json()['images']), 1)
+        self.assertEqual(len(self.client.get('/items/').json()['results'][0]['images']), 1)
+
+
+@override_settings(ITEM_IMAGE_UPLOADS_ASYNC=True)
+class ImagePipelineTests(LocalMediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.staging_dir = os.path.join(settings.MEDIA_ROOT, 'staging')
+        staging = override_settings(ITEM_IMAGE_STAGING_DIR=self.staging_dir)
+        staging.enable()
+        self.addCleanup(staging.disable)
+
+        self.seller = create_user('seller@example.com')
+        category, _ = ItemCategory.objects.get_or_create(name='Furniture')
+        self.item = Items.objects.create(user=self.seller, category=category, title='Chair', location='Leeds')
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def add_images(self, *contents):
+        with mock.patch('items.tasks.process_item_images.delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/items/{self.item.pk}/add_image/', {'images': [self.image(content) for content in contents]}
+            )
+        return response, delay
+
+    def test_upload_finishes_in_background(self):
+        response, delay = self.add_images(b'one', b'two')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['images_status'], 'pending')
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.images_status, self.item.pending_images), ('pending', 2))
+        self.assertFalse(self.item.images.exists())
+
+        (item_id, paths, replace), _ = delay.call_args
+        process_item_images.apply(args=(item_id, paths, replace))
+
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.images_status, self.item.pending_images), ('ready', 0))
+        self.assertEqual(list(self.item.images.values_list('order', flat=True)), [0, 1])
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+
+    def test_pending_images_count_against_limit(self):
+        self.add_images(b'one', b'two')
+        response, delay = self.add_images(b'three', b'four')
+        self.assertEqual(response.status_code, 400)
+        delay.assert_not_called()
+
+    def test_failed_upload_marks_item(self):
+        _, delay = self.add_images(b'one')
+        (item_id, paths, replace), _ = delay.call_args
+        with mock.patch('items.tasks.store_files', side_effect=OSError('unavailable')):
+            process_item_images.apply(args=(item_id, paths, replace), retries=process_item_images.max_retries)
+
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.images_status, self.item.pending_images), ('failed', 0))
+        self.assertFalse(os.path.exists(paths[0]))
+
+
+@override_settings(ITEM_IMAGE_UPLOADS_ASYNC=False)
+class SyncUploadTests(LocalMediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seller = create_user('seller@example.com')
+        self.category, _ = ItemCategory.objects.get_or_create(name='Furniture')
+
+    def test_storage_calls_run_concurrently(self):
+        started = time.monotonic()
+        results = media.run_storage_calls(lambda arg: time.sleep(0.2) or arg * 2, [1, 2, 3])
+        self.assertEqual(results, [2, 4, 6])
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_failed_calls_raised_together(self):
+        def call(arg):
+            if arg % 2:
+                raise OSError(f'{arg} failed')
+            return arg
+
+        with self.assertRaises(media.ImageStorageError) as raised:
+            media.run_storage_calls(call, [1, 2, 3])
+        self.assertEqual(raised.exception.results, [None, 2, None])
+
+    def test_create_with_images(self):
+        client = APIClient()
+        client.force_authenticate(self.seller)
+        response = client.post('/items/', {
+            'title': 'Chair', 'category': self.category.pk, 'location': 'Leeds', 'listing_type': 'free',
+            'uploaded_images': [self.png(color='red'), self.png(color='blue')],
+        })
+        self.assertEqual(response.status_code, 201)
+        item = Items.objects.get(pk=response.json()['id'])
+        self.assertEqual(list(item.images.values_list('order', flat=True)), [0, 1])
+        self.assertEqual(list(MediaAsset.objects.values_list('refcount', flat=True)), [1, 1])
+
+    def test_failed_upload_leaves_nothing_referenced(self):
+        known, = media.store_files([self.image(b'known')])
+        upload = media.LocalBackend.upload
+
+        def upload_or_fail(backend, file, public_id):
+            file.seek(0)
+            if file.read() == b'broken':
+                raise OSError('unavailable')
+            return upload(backend, file, public_id)
+
+        with mock.patch.object(media.LocalBackend, 'upload', autospec=True, side_effect=upload_or_fail), \
+                self.captureOnCommitCallbacks(execute=True), self.assertRaises(media.ImageStorageError):
+            media.store_files([self.image(b'known'), self.image(b'new'), self.image(b'broken')])
+
+        # The known asset is back to its one reference; the new one, stored
+        # before the failure, has been collected
+        self.assertEqual(list(MediaAsset.objects.values_list('pk', 'refcount')), [(known.pk, 1)])
+        stored = self.stored_file(known)
+        self.assertEqual(os.listdir(os.path.dirname(stored)), [os.path.basename(stored)])
+
+    def test_rejected_images_released(self):
+        item = Items.objects.create(user=self.seller, category=self.category, title='Chair', location='Leeds')
+        uploads.add_item_images(item, [self.image(b'one'), self.image(b'two'), self.image(b'three')])
+
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(ImageOrderError):
+            uploads.add_item_images(item, [self.image(b'four')])
+        self.assertEqual(item.images.count(), 3)
+        self.assertEqual(MediaAsset.objects.count(), 3)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class NearbyTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller = create_user('seller@example.com')
+        self.category, _ = ItemCategory.objects.get_or_create(name='Furniture')
+        self.client = APIClient()
+
+    def create(self, latitude=None, longitude=None):
+        return Items.objects.create(
+            user=self.seller, category=self.category, title='Chair', location='Leeds',
+            latitude=latitude, longitude=longitude,
+        ).pk
+
+    def near(self, near, **params):
+        response = self.client.get('/items/', {'near': near, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(item['id'], item['distance_km']) for item in response.json()['results']]
+
+    def test_nearest_first_within_radius(self):
+        far = self.create(53.75, -1.60)   # About 6.5 km away
+        near = self.create(53.83, -1.55)  # About 3.4 km
+        here = self.create(53.80, -1.55)
+        self.create()                     # No coordinates
+
+        results = self.near('53.7997,-1.5492')
+        self.assertEqual([pk for pk, _ in results], [here, near])
+        self.assertLess(results[0][1], 0.2)
+        self.assertAlmostEqual(results[1][1], 3.4, delta=0.1)
+
+        self.assertEqual([pk for pk, _ in self.near('53.7997,-1.5492', radius=10)], [here, near, far])
+
+    def test_across_the_antimeridian(self):
+        east = self.create(0, 179.99)
+        west = self.create(0, -179.99)
+        self.create(0, 170)
+        self.assertEqual({pk for pk, _ in self.near('0,180')}, {east, west})
+
+    def test_moved_item_found_at_new_place(self):
+        item = Items.objects.get(pk=self.create(51.5, -0.12))
+        item.latitude, item.longitude = 53.80, -1.55
+        item.save()
+        self.assertEqual([pk for pk, _ in self.near('53.7997,-1.5492')], [item.pk])
+
+    def test_invalid_parameters(self):
+        for params in [{'near': 'leeds'}, {'near': '95,0'}, {'near': '53.8,-1.5', 'radius': '500'}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/items/', params).status_code, 400)
+
+
+@override_settings(CACHES=LOCAL_CACHE, THROTTLE_ENABLED=False)
+class FacetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        seller = create_user('seller@example.com')
+        furniture, _ = ItemCategory.objects.get_or_create(name='Furniture')
+        electronics, _ = ItemCategory.objects.get_or_create(name='Electronics')
+        self.categories = {'Furniture': furniture.pk, 'Electronics': electronics.pk}
+        for category, listing_type, price, status in [
+            (furniture, 'sell', 100, 'available'),
+            (furniture, 'sell', 700, 'available'),
+            (furniture, 'free', None, 'available'),
+            (electronics, 'sell', 20000, 'available'),
+            (electronics, 'sell', 100, 'booked'),
+        ]:
+            Items.objects.create(
+                user=seller, category=category, title='Oak chair' if category == furniture else 'Radio',
+                location='Leeds', listing_type=listing_type, price=price, status=status,
+            )
+        self.client = APIClient()
+
+    def facets(self, **params):
+        with self.assertNumQueries(1):
+            response = self.client.get('/items/facets/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_counts(self):
+        self.assertEqual(self.facets(), {
+            'count': 4,
+            'category': [
+                {'id': self.categories['Electronics'], 'name': 'Electronics', 'count': 1},
+                {'id': self.categories['Furniture'], 'name': 'Furniture', 'count': 3},
+            ],
+            'listing_type': [{'value': 'free', 'count': 1}, {'value': 'sell', 'count': 3}],
+            'price': [
+                {'bucket': 'free', 'count': 1}, {'bucket': '0-500', 'count': 1},
+                {'bucket': '500-1000', 'count': 1}, {'bucket': '10000+', 'count': 1},
+            ],
+        })
+
+    def test_counts_follow_filters_and_search(self):
+        facets = self.facets(listing_type='sell', price__lte=1000)
+        self.assertEqual(facets['count'], 2)
+        self.assertEqual(facets['listing_type'], [{'value': 'sell', 'count': 2}])
+
+        facets = self.facets(search='radio')
+        self.assertEqual(facets['category'], [{'id': self.categories['Electronics'], 'name': 'Electronics', 'count': 1}])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class InventoryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller = create_user('seller@example.com')
+        category, _ = ItemCategory.objects.get_or_create(name='Furniture')
+        self.ids = []
+        for status in ['available', 'booked', 'available', 'available', 'booked']:
+            item = Items.objects.create(user=self.seller, category=category, title='Chair', location='Leeds', status=status)
+            self.ids.append(item.pk)
+        other = create_user('other@example.com')
+        Items.objects.create(user=other, category=category, title='Desk', location='Leeds')
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_counts_per_status(self):
+        page = self.get('/items/users_items/', status='booked')
+        self.assertEqual(page['counts'], {'available': 3, 'booked': 2, 'total': 5})
+        self.assertEqual([item['id'] for item in page['results']], [self.ids[4], self.ids[1]])
+        self.assertEqual({item['status'] for item in page['results']}, {'booked'})
+
+    def test_own_items_paged_newest_first(self):
+        first = self.get('/items/users_items/', page_size=3)
+        second = self.get(first['next'])
+        self.assertIsNone(second['next'])
+        self.assertEqual(
+            [item['id'] for item in first['results'] + second['results']], list(reversed(self.ids))
+        )
+        self.assertEqual(second['counts']['total'], 5)
+
+    def test_invalid_status(self):
+        self.assertEqual(self.client.get('/items/users_items/', {'status': 'sold'}).status_code, 400)
+
+    def test_requires_login(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/items/users_items/').status_code, 401)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ExportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        seller = create_user('seller@example.com')
+        category, _ = ItemCategory.objects.get_or_create(name='Furniture')
+        self.ids = []
+        for listing_type, status in [('sell', 'available'), ('free', 'booked'), ('sell', 'available')]:
+            item = Items.objects.create(
+                user=seller, category=category, title='Chair', location='Leeds', listing_type=listing_type,
+                price=None if listing_type == 'free' else 25, status=status,
+            )
+            self.ids.append(item.pk)
+        for order in [1, 0]:
+            ItemImage.objects.create(
+                item_id=self.ids[0], image=f'image/upload/v1/chair{order}.jpg', image_public_id=f'chair{order}',
+                order=order,
+            )
+
+        staff = create_user('staff@example.com')
+        staff.is_staff = True
+        staff.save()
+        self.client = APIClient()
+        self.client.force_authenticate(staff)
+
+    def export(self, **params):
+        response = self.client.get('/items/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson_rows(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        # Every item, booked ones too, in id order
+        self.assertEqual([row['id'] for row in rows], self.ids)
+        self.assertEqual(rows[0]['category_name'], 'Furniture')
+        self.assertEqual(rows[0]['price'], '25.00')
+        self.assertEqual(rows[1]['status'], 'booked')
+        self.assertEqual([image.rsplit('/', 1)[1] for image in rows[0]['images']], ['chair0.jpg', 'chair1.jpg'])
+        self.assertEqual(rows[2]['images'], [])
+
+    def test_filters_and_csv(self):
+        response, content = self.export(output='csv', listing_type='sell')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual([int(row['id']) for row in rows], [self.ids[0], self.ids[2]])
+        self.assertEqual(len(rows[0]['images'].split()), 2)
+
+    def test_invalid_output(self):
+        self.assertEqual(self.client.get('/items/export/', {'output': 'xml'}).status_code, 400)
+
+    def test_staff_only(self):
+        self.client.force_authenticate(User.objects.get(email='seller@example.com'))
+        self.assertEqual(self.client.get('/items/export/').status_code, 403)
+
+    def test_one_image_query_per_chunk(self):
+        with self.assertNumQueries(3):
+            chunks = list(export_rows(Items.objects.all(), chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class AsyncReadViewTests(TestCase):
+    """The handlers served under ASGI (ASYNC_READ_VIEWS), called directly, against the DRF views."""
+
+    def setUp(self):
+        cache.clear()
+        self.seller = create_user('seller@example.com')
+        self.category, _ = ItemCategory.objects.get_or_create(name='Furniture')
+        self.items = [
+            Items.objects.create(
+                user=self.seller, category=self.category, title=f'Lamp {n}', location='Leeds',
+                listing_type='free' if n % 2 else 'sell', price=None if n % 2 else 10 + n,
+            )
+            for n in range(8)
+        ]
+        ItemImage.objects.create(
+            item=self.items[0], image='image/upload/v1/lamp.jpg', image_public_id='lamp', order=0
+        )
+        self.client = APIClient()
+        self.factory = AsyncRequestFactory()
+
+    def call(self, handler, path, *args, **kwargs):
+        return async_to_sync(handler)(self.factory.get(path, **kwargs), *args)
+
+    def assertSameAsDrf(self, handler, path, *args, namespace='items', action='list'):
+        expected = self.client.get(path)
+        # Drop the DRF view's cache entry, or the handler would answer from it
+        request = self.factory.get(path)
+        key = build_key(namespace, get_version(namespace), request.path, request.GET, suffix=action)
+        self.assertTrue(cache.delete(key))
+
+        response = self.call(handler, path, *args)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), expected.json())
+        self.assertEqual(response['ETag'], expected['ETag'])
+
+    def test_list_matches_drf(self):
+        self.assertSameAsDrf(items_list, '/items/')
+        self.assertSameAsDrf(items_list, '/items/?page=2')
+        self.assertSameAsDrf(items_list, f'/items/?listing_type=sell&price__gte=13&category={self.category.pk}')
+
+    def test_detail_matches_drf(self):
+        self.assertSameAsDrf(item_detail, f'/items/{self.items[0].pk}/', self.items[0].pk, action='retrieve')
+
+    def test_categories_match_drf(self):
+        self.assertSameAsDrf(categories_list, '/categories/', namespace='categories')
+
+    def test_authenticated_request(self):
+        token = str(RefreshToken.for_user(self.seller).access_token)
+        response = self.call(items_list, '/items/', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(json.loads(response.content)['count'], 8)
+        # Authenticated responses are not cached
+        key = build_key('items', get_version('items'), '/items/', QueryDict(), suffix='list')
+        self.assertIsNone(cache.get(key))
+
+    def test_falls_back(self):
+        for path, kwargs in [
+            ('/items/?search=lamp', {}),  # Searches are left to ItemsViewSet
+            ('/items/?page=last', {}),
+            ('/items/?page=5', {}),  # DRF's 404
+            ('/items/?price=cheap', {}),  # DRF's 400
+            ('/items/?category=999', {}),
+            ('/items/', {'headers': {'Authorization': 'Bearer nonsense'}}),  # DRF's 401
+        ]:
+            with self.subTest(path=path, **kwargs), self.assertRaises(Fallback):
+                self.call(items_list, path, **kwargs)
+        with self.assertRaises(Fallback):
+            self.call(item_detail, '/items/999/', 999)
+
+    def test_fallback_served_by_drf(self):
+        view = async_read_view(ItemsViewSet.as_view({'get': 'list'}, basename='items', detail=False), items_list)
+        response = async_to_sync(view)(self.factory.get('/items/', {'page': 5}))
+        response.render()
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,289 @@
+import ipaddress
+import os
+import socket
+import tempfile
+from urllib.parse import urljoin, urlsplit, urlunsplit
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from .models import Items, ItemImage
+from .cache import invalidate
+from .image_ordering import lock_item, next_image_order, check_image_capacity
+from .media import store_files, release
+from .derivatives import variant_fields, queue_variants
+
+
+def save_item_images(item, assets, start_order=0):
+    """
+    Create the ItemImage rows for already stored assets in one insert.
+    Every path adding images goes through here; call it with the item
+    locked. Raises ImageOrderError if the images don't fit.
+    """
+    check_image_capacity(item, len(assets))
+    images = ItemImage.objects.bulk_create([
+        ItemImage(
+            item=item, image=asset.as_resource(), image_public_id=asset.public_id, order=start_order + i,
+            **variant_fields(asset)
+        )
+        for i, asset in enumerate(assets)
+    ])
+    # bulk_create skips the model signals
+    Items.objects.filter(pk=item.pk).touch()
+    invalidate('items')
+    queue_variants(assets)
+    return images
+
+
+def create_item_with_images(fields, files):
+    """
+    Synchronous path: store the files, then create the item and its image
+    rows in one transaction. The storage round trips stay outside it, so the
+    write lock is only held for the inserts.
+    """
+    assets = store_files(files)
+    try:
+        with transaction.atomic():
+            item = Items.objects.create(**fields)
+            lock_item(item)
+            save_item_images(item, assets)
+            return item
+    except Exception:
+        release(asset.public_id for asset in assets)
+        raise
+
+
+def add_item_images(item, files):
+    """
+    Synchronous path: store the files, then append them after the item's
+    existing images under the item lock.
+    """
+    assets = store_files(files)
+    try:
+        with transaction.atomic():
+            lock_item(item)
+            return save_item_images(item, assets, next_image_order(item))
+    except Exception:
+        release(asset.public_id for asset in assets)
+        raise
+
+
+def replace_item_images(item, files, save_item=None):
+    """
+    Synchronous path: store the new files first, then, in one transaction,
+    call `save_item()` (the item's other changes) and swap the rows. Deleting
+    the old rows releases their assets (see items/signals.py), which are
+    destroyed once the transaction has committed if nothing else uses them.
+    """
+    assets = store_files(files)
+    try:
+        with transaction.atomic():
+            if save_item is not None:
+                save_item()
+            lock_item(item)
+            item.images.all().delete()
+            save_item_images(item, assets)
+    except Exception:
+        release(asset.public_id for asset in assets)
+        raise
+
+
+# Background path
+
+def stage_uploads(files):
+    """Copy uploaded files to the staging directory and return their paths."""
+    staging_dir = settings.ITEM_IMAGE_STAGING_DIR
+    os.makedirs(staging_dir, exist_ok=True)
+
+    paths = []
+    for file in files:
+        ext = os.path.splitext(file.name)[1].lower()
+        fd, path = tempfile.mkstemp(suffix=ext, dir=staging_dir)
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in file.chunks():
+                out.write(chunk)
+        paths.append(path)
+    return paths
+
+
+IMAGE_CONTENT_TYPES = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/gif': '.gif'}
+
+
+MAX_REDIRECTS = 5
+
+
+def check_public_url(url):
+    """
+    Raise ValueError unless `url` is http(s) on a host whose addresses are all
+    public: imported URLs come from users, and the worker must not be made to
+    fetch (and publish) internal services, cloud metadata or localhost.
+    Returns the address to connect to.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError(f"{url} is not an http(s) URL")
+
+    try:
+        addresses = socket.getaddrinfo(
+            parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80), proto=socket.IPPROTO_TCP
+        )
+    except (socket.gaierror, UnicodeError):
+        raise ValueError(f"{url}: host not found")
+
+    checked = []
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split('%')[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if (address.is_private or address.is_loopback or address.is_link_local or address.is_reserved
+                or address.is_multicast or not address.is_global):
+            raise ValueError(f"{url} is not a public address")
+        checked.append(address)
+    return checked[0]
+
+
+class PinnedHostAdapter(HTTPAdapter):
+    """
+    For requests sent to an IP address in place of `hostname`: TLS still
+    asks for (SNI) and verifies the certificate of `hostname`.
+    """
+
+    def __init__(self, hostname, **kwargs):
+        self.hostname = hostname
+        super().__init__(**kwargs)
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify, cert)
+        if host_params['scheme'] == 'https':
+            pool_kwargs['server_hostname'] = self.hostname
+            pool_kwargs['assert_hostname'] = self.hostname
+        return host_params, pool_kwargs
+
+
+def get_public_url(url):
+    """
+    GET `url` (streamed, redirects not followed) from the address
+    check_public_url() approved. Connecting by name would resolve it again,
+    and a host that answers with a public address for the check and an
+    internal one for the connection (DNS rebinding) would get through.
+    """
+    address = check_public_url(url)
+    parts = urlsplit(url)
+    host = f'[{address}]' if address.version == 6 else str(address)
+    if parts.port:
+        host = f'{host}:{parts.port}'
+    try:
+        hostname = parts.hostname.encode('idna').decode('ascii')
+    except UnicodeError:
+        raise ValueError(f"{url}: host not found")
+
+    host_header = f'[{hostname}]' if ':' in hostname else hostname  # IPv6 literal
+    if parts.port:
+        host_header = f'{host_header}:{parts.port}'
+
+    with requests.Session() as session:
+        session.trust_env = False  # A proxy would resolve the name itself
+        session.mount('https://', PinnedHostAdapter(hostname))
+        return session.get(
+            urlunsplit((parts.scheme, host, parts.path, parts.query, '')),
+            headers={'Host': host_header},
+            stream=True, timeout=settings.IMAGE_STORAGE_TIMEOUT, allow_redirects=False,
+        )
+
+
+def open_public_url(url):
+    """GET `url` (streamed) with get_public_url(), checking every redirect the same way."""
+    for _ in range(MAX_REDIRECTS + 1):
+        response = get_public_url(url)
+        if not response.is_redirect:
+            return response
+        response.close()
+        url = urljoin(url, response.headers['Location'])
+    raise ValueError(f"{url}: too many redirects")
+
+
+def stage_url(url):
+    """
+    Download an image (for bulk imports) to the staging directory and return
+    its path. Held to the same types and size as uploads, and to public
+    http(s) addresses.
+    """
+    with open_public_url(url) as response:
+        response.raise_for_status()
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in IMAGE_CONTENT_TYPES:
+            raise ValueError(f"{url} is not a JPG, PNG or GIF image ({content_type or 'no content type'})")
+
+        os.makedirs(settings.ITEM_IMAGE_STAGING_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=IMAGE_CONTENT_TYPES[content_type], dir=settings.ITEM_IMAGE_STAGING_DIR)
+        try:
+            size = 0
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    size += len(chunk)
+                    if size > settings.ITEM_IMAGE_MAX_BYTES:
+                        raise ValueError(f"{url} is larger than {settings.ITEM_IMAGE_MAX_BYTES // (1024 * 1024)}MB")
+                    out.write(chunk)
+            with Image.open(path) as image:
+                image.verify()
+        except Exception:
+            os.remove(path)
+            raise
+    return path
+
+
+def discard_staged(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def queue_item_images(item, files, replace=False):
+    """
+    Stage the files and hand them to the `process_item_images` task once the
+    current transaction commits. The item is flagged `pending` until then,
+    and the staged images count against its limit.
+    """
+    from .tasks import process_item_images
+
+    with transaction.atomic():
+        lock_item(item)
+        if not replace:
+            pending = Items.objects.filter(pk=item.pk).values_list('pending_images', flat=True).get()
+            check_image_capacity(item, len(files), pending)
+
+        paths = stage_uploads(files)
+        Items.objects.filter(pk=item.pk).touch(images_status='pending', pending_images=F('pending_images') + len(paths))
+    item.images_status = 'pending'
+    transaction.on_commit(lambda: process_item_images.delay(item.pk, paths, replace))
+
+
+def finish_pending(item, count, images_status):
+    """Take `count` staged images off the item's pending ones, setting `images_status` once none are left."""
+    Items.objects.filter(pk=item.pk).touch(
+        pending_images=Greatest(F('pending_images') - count, 0),
+        images_status=Case(When(pending_images__gt=count, then=Value('pending')), default=Value(images_status)),
+    )
+
+
+def attach_item_images(item, assets, replace=False):
+    """
+    Save stored assets on the item, replacing the existing images if asked
+    to, and mark the item ready. Raises ImageOrderError if appending them
+    would go over the limit.
+    """
+    with transaction.atomic():
+        lock_item(item)
+        if replace:
+            item.images.all().delete()
+            start_order = 0
+        else:
+            start_order = next_image_order(item)
+
+        save_item_images(item, assets, start_order)
+        finish_pending(item, len(assets), 'ready')
@@ -1,5 +1,8 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework import routers
+from localconnecto_project.async_views import async_read_view
+from .async_views import items_list, item_detail, categories_list, category_detail
 from .views import CategoryViewSet, ItemsViewSet
 
 
@@ -12,4 +15,24 @@ router.register(r'items', ItemsViewSet, basename='items')
 
 urlpatterns = [
     path('', include(router.urls))
-]
\ No newline at end of file
+]
+
+if settings.ASYNC_READ_VIEWS:
+    # Native async GETs under ASGI, ahead of the router's routes for the same
+    # URLs (see localconnecto_project/async_views.py)
+    list_actions = {'get': 'list', 'post': 'create'}
+    detail_actions = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+    urlpatterns[:0] = [
+        path('categories/', async_read_view(
+            CategoryViewSet.as_view(list_actions, basename='categories', detail=False), categories_list
+        )),
+        path('categories/<int:pk>/', async_read_view(
+            CategoryViewSet.as_view(detail_actions, basename='categories', detail=True), category_detail
+        )),
+        path('items/', async_read_view(
+            ItemsViewSet.as_view(list_actions, basename='items', detail=False), items_list
+        )),
+        path('items/<int:pk>/', async_read_view(
+            ItemsViewSet.as_view(detail_actions, basename='items', detail=True), item_detail
+        )),
+    ]
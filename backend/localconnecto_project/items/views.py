@@ -1,18 +1,51 @@
 from rest_framework import viewsets, permissions, status
+from django.db.models import Prefetch, Count
+from rest_framework.exceptions import ValidationError
+from django.db import router
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from .models import ItemCategory, Items, ItemImage
-from .serializers import ItemCategorySerializer, ItemSerializers, ItemImageSerializer
-from django.shortcuts import get_object_or_404
+from .serializers import (
+    ItemCategorySerializer, ItemSerializers, ItemImageSerializer, ItemCardSerializer, parse_field_list, LIST_IMAGE_SIZES
+)
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from cloudinary import uploader
 from .permissions import IsOwnerOrReadOnly
-from .paginations import ItemPagination
+from .paginations import ItemPagination, ItemCursorPagination, InventoryPagination
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters
+from .search import ItemSearchFilter
+from .cache import CachedResponseMixin, get_version, make_key
+from .facets import compute_facets
+from .lookups import get_categories
+from .conditional import ConditionalGetMixin, make_etag, query_etag_parts
+from localconnecto_project.instrumentation import cache
+from .uploads import queue_item_images, add_item_images
+from .image_ordering import remove_item_image, reorder_item_images
+from .geo import parse_near, nearby
+from .export import CONTENT_TYPES, astream, filter_items, stream_items
+from .imports import import_rows
+from django.conf import settings
+from localconnecto_project.db_routing import ReplicaReadMixin
+from localconnecto_project.throttling import PolicyThrottle
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ReplicaReadMixin, ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     queryset = ItemCategory.objects.all()
     serializer_class = ItemCategorySerializer
+    cache_namespace = 'categories'
+
+    def get_queryset(self):
+        # The category list is tiny and read on every page load: serve it from the two-tier cache
+        if self.action == 'list':
+            return get_categories()
+        return super().get_queryset()
+
+    def get_list_validators(self, request):
+        categories = [(category.pk, category.name) for category in get_categories()]
+        return make_etag(categories, *query_etag_parts(request)), None
+
+    def get_detail_validators(self, request, **kwargs):
+        return self.get_list_validators(request)
+
     def get_permissions(self):
         if self.action == 'list' or self.action == 'retrieve':
             permission_classes = [permissions.AllowAny]
@@ -21,38 +54,204 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]  # create instances of each permission class
 
 
-class ItemsViewSet(viewsets.ModelViewSet):
+class ItemsViewSet(ReplicaReadMixin, ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     serializer_class = ItemSerializers
     pagination_class = ItemPagination
+    cache_namespace = 'items'
+    replica_actions = ('list', 'retrieve', 'export')
 
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-    search_fields = ['title', 'location']
+    filter_backends = [DjangoFilterBackend, ItemSearchFilter]
+    search_fields = ['title', 'description', 'location']
     filterset_fields = {
         'price': ['exact', 'gte', 'lte'],
         'category': ['exact'],
         'listing_type': ['exact'],
     }
+    throttle_classes = [PolicyThrottle]
+
+    def get_throttle_policy(self):
+        # Full-text searches are the expensive reads; browsing is not limited
+        if self.action in ('list', 'facets') and self.request.query_params.get(ItemSearchFilter.search_param):
+            return 'search'
+        return None
 
     def get_permissions(self):
-        if self.action == 'list' or self.action == 'retrieve':
+        if self.action in ('list', 'retrieve', 'facets'):
             permission_classes = [permissions.AllowAny]
+        elif self.action == 'export':
+            permission_classes = [permissions.IsAdminUser]
         else:
             permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
         return [permission() for permission in permission_classes]
 
+    @property
+    def paginator(self):
+        # `?pagination=cursor` switches the feed to keyset pagination (no total count)
+        if not hasattr(self, '_paginator'):
+            # Distance-sorted `?near=` and relevance-sorted `?search=` results are paged by number
+            params = self.request.query_params if self.request is not None else {}
+            if (params.get('pagination') == 'cursor'
+                    and not params.get('near') and not params.get(ItemSearchFilter.search_param)):
+                self._paginator = ItemCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def is_card_view(self):
+        return self.action == 'list' and self.request.query_params.get('view') == 'card'
+
+    def get_serializer_class(self):
+        if self.is_card_view():
+            return ItemCardSerializer
+        return super().get_serializer_class()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ('list', 'users_items'):
+            # Lists show thumbnails and cards; the detail view gets every size
+            context['image_sizes'] = LIST_IMAGE_SIZES
+        return context
+
     def get_queryset(self):
-        queryset = Items.objects.filter(status='available')
+        if self.is_card_view():
+            return self.get_card_queryset()
+        if self.action == 'facets':
+            return Items.objects.filter(status='available')
+
+        queryset = Items.objects.filter(status='available').with_related()
+        return queryset
+
+    def paginate_queryset(self, queryset):
+        near = parse_near(self.request.query_params) if self.action == 'list' else None
+        if near is None:
+            return super().paginate_queryset(queryset)
+
+        # `?near=lat,lng&radius=km`: items within the radius, nearest first
+        matches = nearby(queryset, *near)
+        page = super().paginate_queryset(matches)
+        if page is None:
+            page = matches
+
+        items = self.get_queryset().in_bulk([pk for pk, _ in page])
+        results = []
+        for pk, distance in page:
+            item = items[pk]
+            item.distance_km = round(distance, 2)
+            results.append(item)
+        return results
+
+    def get_list_validators(self, request):
+        # Weak, and from the response cache version rather than the rows: every
+        # write a listing can show bumps it (see items/signals.py), and reading
+        # it costs no query
+        return make_etag(get_version(self.cache_namespace), *query_etag_parts(request), weak=True), None
+
+    def get_detail_validators(self, request, **kwargs):
+        try:
+            updated_at = self.get_queryset().filter(pk=kwargs.get('pk')).values_list('updated_at', flat=True).first()
+        except (TypeError, ValueError):
+            return None, None  # Not an id: get_object() answers the 404
+        if updated_at is None:
+            return None, None
+        return make_etag(kwargs.get('pk'), updated_at.isoformat(), *query_etag_parts(request)), updated_at
+
+    def get_card_queryset(self):
+        return self.with_card_related(Items.objects.filter(status='available'))
+
+    def with_card_related(self, queryset):
+        expand = parse_field_list(self.request.query_params.get('expand'))
+
+        queryset = queryset.select_related('category').prefetch_related(
+            Prefetch('images', queryset=ItemImage.objects.order_by('order')[:1], to_attr='primary_images')
+        )
+        if 'user' in expand:
+            queryset = queryset.select_related('user')
+        if 'description' not in expand:
+            queryset = queryset.defer('description')
         return queryset
     
     def perform_create(self, serializer):
         serializer.save(user= self.request.user)
     
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Counts per category, listing type and price bucket for the current filters and search."""
+        key = make_key(self.cache_namespace, request, suffix='facets')
+        data = cache.get(key)
+        if data is None:
+            data = compute_facets(self.filter_queryset(self.get_queryset()))
+            cache.set(key, data, timeout=settings.RESPONSE_CACHE_TIMEOUT)
+        return Response(data)
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_items(self, request):
+        """
+        Create many listings in one request: a JSON list of up to
+        ITEM_IMPORT_MAX_ROWS items (or `{"items": [...]}`), each with up to
+        three `image_urls` that are fetched in the background. Valid rows are
+        created; the others are reported by row number.
+        """
+        rows = request.data.get('items') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not rows:
+            raise ValidationError({'items': "Expected a non-empty list of items."})
+        if len(rows) > settings.ITEM_IMPORT_MAX_ROWS:
+            raise ValidationError({'items': f"At most {settings.ITEM_IMPORT_MAX_ROWS} items per request."})
+
+        result = import_rows(rows, request.user)
+        return Response(result, status=status.HTTP_201_CREATED if result['created'] else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def export(self, request):
+        """
+        Every item, whatever its status, streamed as NDJSON (or CSV with
+        `?output=csv`), for staff. Takes the same filters as the list.
+        """
+        output = request.query_params.get('output', 'ndjson')
+        if output not in CONTENT_TYPES:
+            raise ValidationError({'output': f"Must be one of: {', '.join(CONTENT_TYPES)}."})
+
+        # The rows are read while the response streams, after the request
+        # has left the view (and the routing middleware): pin the database now
+        queryset = Items.objects.using(router.db_for_read(Items))
+        queryset = filter_items(queryset, request.query_params, self.filterset_fields)
+
+        content = stream_items(queryset, output)
+        if isinstance(request._request, ASGIRequest):
+            content = astream(content)  # Or Django would read it all before sending
+
+        response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[output])
+        response['Content-Disposition'] = f'attachment; filename="items.{output}"'
+        return response
+
     @action(detail=False, methods=['get', 'put'], permission_classes=[permissions.IsAuthenticated, IsOwnerOrReadOnly])
     def users_items(self, request, pk=None):
-        user_item = Items.objects.filter(user= request.user)
-        serializer = self.get_serializer(user_item, many=True)
+        """
+        The seller's own listings, newest first, one cursor page at a time in
+        the card form (`?status=available|booked` narrows them), with the
+        number of listings per status in `counts`.
+        """
+        user_items = Items.objects.filter(user=request.user)
+
+        statuses = dict(Items._meta.get_field('status').choices)
+        counts = dict.fromkeys(statuses, 0)
+        # One grouped count, answered from items_user_status_idx
+        for row in user_items.order_by().values('status').annotate(count=Count('id')):
+            counts[row['status']] = row['count']
+        counts['total'] = sum(counts.values())
 
-        return Response(serializer.data)
+        item_status = request.query_params.get('status')
+        if item_status:
+            if item_status not in statuses:
+                raise ValidationError({'status': f"Must be one of: {', '.join(statuses)}."})
+            user_items = user_items.filter(status=item_status)
+
+        paginator = InventoryPagination()
+        page = paginator.paginate_queryset(self.with_card_related(user_items), request, view=self)
+        serializer = ItemCardSerializer(page, many=True, context=self.get_serializer_context())
+
+        response = paginator.get_paginated_response(serializer.data)
+        response.data = {'counts': counts, **response.data}
+        return response
     
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated, IsOwnerOrReadOnly])
@@ -61,7 +260,8 @@ class ItemsViewSet(viewsets.ModelViewSet):
 
         images = request.FILES.getlist('images')
 
-        if item.images.count() + len(images) > 3:
+        # Images still being uploaded in the background count too
+        if item.images.count() + item.pending_images + len(images) > 3:
             return Response(
                {"detail": "Item already has the maximum of 3 images."},
                 status=status.HTTP_400_BAD_REQUEST 
@@ -73,21 +273,14 @@ class ItemsViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        added_image = []
-        for i, image_file in enumerate(images):
-            item_images = ItemImage(
-                item= item,
-                order= item.images.count() + i
+        if settings.ITEM_IMAGE_UPLOADS_ASYNC:
+            queue_item_images(item, images)
+            return Response(
+                {"detail": "Images are being processed.", "images_status": item.images_status},
+                status=status.HTTP_202_ACCEPTED
             )
-            item_images.image = image_file
-            item_images.save()
 
-       
-            if hasattr(item_images.image, 'public_id'):
-                item_images.image_public_id = item_images.image.public_id
-                item_images.save()
-            
-            added_image.append(item_images)
+        added_image = add_item_images(item, images)
             
         serializer = ItemImageSerializer(added_image, many=True)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -97,41 +290,13 @@ class ItemsViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['delete'], url_path='remove-image/(?P<image_id>[^/.]+)',  permission_classes=[permissions.IsAuthenticated, IsOwnerOrReadOnly])
     def remove_image(self, request, pk=None, image_id=None):
         item = self.get_object()
-        image = get_object_or_404(ItemImage, id=image_id, item=item)
-
-        if item.images.count() <= 1:
-            return Response(
-                {"detail": "Item must have at least one image."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        if image.image_public_id:
-            uploader.destroy(image.image_public_id)
-        
-        image.delete()
-
-        for i, img in enumerate(item.images.all().order_by('order')):
-            img.order = i
-            img.save()
-        
+        remove_item_image(item, image_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
     
     @action(detail=True, methods=['put'], url_path='reorder-images', permission_classes=[permissions.IsAuthenticated, IsOwnerOrReadOnly])
     def reorder_images(self, request, pk=None):
         item = self.get_object()
 
-        image_order = request.data.get('image_order', [])
-
-        if not image_order or len(image_order) != item.images.count():
-            return Response(
-                {"detail": "Please provide the correct order for all images."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        for i, image_id in enumerate(image_order):
-            image = get_object_or_404(ItemImage, id=image_id, item=item)
-            image.order = i
-            image.save()
+        reorder_item_images(item, request.data.get('image_order', []))
 
         return Response(status=status.HTTP_200_OK)
-    
\ No newline at end of file
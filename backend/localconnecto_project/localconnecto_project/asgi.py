@@ -12,5 +12,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'localconnecto_project.settings')
+# The hot read endpoints have native async views (localconnecto_project/async_views.py)
+os.environ.setdefault('ASYNC_READ_VIEWS', '1')
+# Persistent connections belong to a thread, and under ASGI each request's
+# sync code runs on a thread of its own: kept open, they would pile up
+# rather than be reused
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -0,0 +1,123 @@
+"""
+Native async views for the hot read endpoints, used under ASGI.
+
+asgi.py turns ASYNC_READ_VIEWS on; the URLconfs then route the public item
+and category reads, `auth/users/` and `auth/profiles/` through
+async_read_view() ahead of their usual routes. It answers plain JSON GETs
+with an async handler and leaves everything else to the DRF view it wraps:
+
+    path('items/', async_read_view(ItemsViewSet.as_view({...}), items_list))
+
+The handlers use the async ORM and cache API (queryset `async for`, aget,
+aaggregate, cache.aget/aset), so a request only borrows a thread for the
+database and cache calls themselves while the event loop keeps serving
+other connections. Writes, the browsable API, query parameters a handler
+does not know and every error response (401, 404, bad filters) go to the
+DRF view, which stays the reference: the handlers raise Fallback for them.
+Both paths return the same bodies and headers.
+
+Under WSGI each async view would need an event loop per request, so
+ASYNC_READ_VIEWS stays off there and the URLconfs are left as they were.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+User = get_user_model()
+
+
+class Fallback(Exception):
+    """Raised by an async handler to leave the request to the DRF view."""
+
+
+def wants_json(request):
+    # The browsable API and `?format=` go through DRF's content negotiation
+    return 'format' not in request.GET and 'text/html' not in request.headers.get('Accept', '')
+
+
+def allowed_methods(sync_view):
+    """The `Allow` header DRF sends for `sync_view` (a ViewSet or APIView as_view())."""
+    cls = sync_view.cls
+    actions = getattr(sync_view, 'actions', None)
+    if actions is not None:
+        methods = set(actions)
+    else:
+        methods = {method for method in cls.http_method_names if hasattr(cls, method)}
+    if 'get' in methods:
+        methods.add('head')
+    methods.add('options')
+    return ', '.join(method.upper() for method in cls.http_method_names if method in methods)
+
+
+def async_read_view(sync_view, handler):
+    """
+    Serve GET from `handler(request, *args, **kwargs)`, an async function
+    returning a response or raising Fallback, and every other request with
+    `sync_view`.
+    """
+    run_sync = sync_to_async(sync_view)
+    allow = allowed_methods(sync_view)
+
+    @csrf_exempt  # as DRF views are; they authenticate with JWTs
+    async def view(request, *args, **kwargs):
+        if request.method == 'GET' and wants_json(request):
+            try:
+                response = await handler(request, *args, **kwargs)
+            except Fallback:
+                pass
+            else:
+                response['Allow'] = allow
+                patch_vary_headers(response, ['Accept'])
+                return response
+        return await run_sync(request, *args, **kwargs)
+
+    view.cls = sync_view.cls
+    return view
+
+
+def json_response(data):
+    """`data` rendered as DRF's Response would render it."""
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json')
+
+
+async def authenticate(request):
+    """
+    The user of the request's JWT, or AnonymousUser without one, as DRF's
+    JWTAuthentication finds it. Raises Fallback for tokens it would reject,
+    so DRF answers those with its usual 401.
+    """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return AnonymousUser()
+
+    try:
+        token = authentication.get_validated_token(raw_token)
+        user_id = token[api_settings.USER_ID_CLAIM]
+    except (InvalidToken, AuthenticationFailed, KeyError):
+        raise Fallback
+
+    try:
+        user = await User.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+    except User.DoesNotExist:
+        raise Fallback
+
+    if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        raise Fallback
+    if api_settings.CHECK_REVOKE_TOKEN and \
+            token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+        raise Fallback
+
+    # As DRF does, for the routing middleware and the handlers it calls
+    request.user = user
+    return user
@@ -0,0 +1,16 @@
+"""
+Helpers shared by the benchmark commands (`loadtest`, `benchmark_asgi`,
+`benchmark_mail`), whose JSON reports record the revision they measured.
+"""
+import subprocess
+from django.conf import settings
+
+
+def git_revision():
+    """The short hash of the checked out commit, or None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5, cwd=settings.BASE_DIR
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
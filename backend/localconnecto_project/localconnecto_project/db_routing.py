@@ -0,0 +1,150 @@
+"""
+Read-replica routing.
+
+Reads go to a replica (one of settings.REPLICA_DATABASES) only where a view
+opts in with ReplicaReadMixin (or, for async views, awaits
+read_from_replica()), e.g. the public item and category lists.
+Everything else, and every write, uses `default`.
+
+Replicas lag behind the primary, so after a request writes anything the
+user is pinned to the primary for REPLICA_STICKY_SECONDS: they always read
+their own writes. The pin is kept in the shared cache so it holds across
+worker processes.
+
+Try it locally with a read-only second alias onto the same SQLite file:
+
+    DATABASE_REPLICAS='file:db.sqlite3?mode=ro' python manage.py runserver
+"""
+import contextvars
+import random
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from .instrumentation import cache
+
+_state = contextvars.ContextVar('db_routing_state', default=None)
+
+
+class RoutingState:
+    """Where the current request may read from, and whether it has written."""
+
+    def __init__(self):
+        self.replica = None  # Alias chosen by ReplicaReadMixin
+        self.wrote = False
+
+
+def sticky_key(user_id):
+    return f'db:primary:{user_id}'
+
+
+def stick_to_primary(user_id):
+    cache.set(sticky_key(user_id), 1, timeout=settings.REPLICA_STICKY_SECONDS)
+
+
+def is_sticky(user_id):
+    return cache.get(sticky_key(user_id)) is not None
+
+
+async def ais_sticky(user_id):
+    return await cache.aget(sticky_key(user_id)) is not None
+
+
+async def read_from_replica(user):
+    """ReplicaReadMixin for async views: read from a replica for the rest of the request."""
+    state = _state.get()
+    if state is None or not settings.REPLICA_DATABASES:
+        return
+    if user.is_authenticated and await ais_sticky(user.pk):
+        return
+    state.replica = random.choice(settings.REPLICA_DATABASES)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or state.wrote:
+            return None
+        if connections['default'].in_atomic_block:
+            # Reads inside a transaction on the primary must see its writes
+            return None
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {'default', *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary; they are never migrated themselves
+        return db not in settings.REPLICA_DATABASES
+
+
+class ReplicaReadMixin:
+    """
+    Serve `replica_actions` from a replica, unless the user wrote something
+    in the last REPLICA_STICKY_SECONDS. Needs ReplicaRoutingMiddleware.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)  # Authenticates the user
+
+        state = _state.get()
+        if state is None or not settings.REPLICA_DATABASES or self.action not in self.replica_actions:
+            return
+        if request.user.is_authenticated and is_sticky(request.user.pk):
+            return
+        # One replica for the whole request so its queries see one snapshot
+        state.replica = random.choice(settings.REPLICA_DATABASES)
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        self.pin_writer(request, state)
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote and settings.REPLICA_DATABASES:
+            # request.user may still be the lazy session user, which queries
+            await sync_to_async(self.pin_writer)(request, state)
+        return response
+
+    def pin_writer(self, request, state):
+        # DRF puts the user it authenticated (JWT) on the request as well
+        user = getattr(request, 'user', None)
+        if state.wrote and settings.REPLICA_DATABASES and user is not None and user.is_authenticated:
+            stick_to_primary(user.pk)
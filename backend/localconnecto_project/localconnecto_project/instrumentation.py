@@ -0,0 +1,328 @@
+"""
+Per-request performance instrumentation.
+
+InstrumentationMiddleware counts and times, for every request:
+
+    db          SQL queries (all database aliases)
+    cache       the project's cache calls (through `instrumentation.cache`)
+    celery      task messages sent (.delay() / .apply_async())
+    storage     media backend calls (upload, destroy, open; see items/media.py)
+    render      DRF/template response rendering
+
+and reports them, with the total, in a `Server-Timing` header that the
+browser devtools show next to the request:
+
+    Server-Timing: db;dur=12.4;desc="7 queries", cache;dur=0.8;desc="3 calls", total;dur=31.0
+
+Other code can time its own sections with `timed('name')` (a context manager
+or decorator); they show up in the same header.
+
+Requests can also be profiled: PROFILE_SAMPLE_RATE of them run under a
+sampling profiler (or cProfile), and the ones slower than
+PROFILE_SLOW_REQUEST_MS are written to PROFILE_OUTPUT_DIR. The sampling
+profiler writes collapsed stacks (`a;b;c 12`) for flamegraph.pl or
+speedscope; cProfile writes .prof files for pstats/snakeviz. Async requests
+(under ASGI) are profiled on the event loop thread, so their profiles also
+show whatever else the loop ran meanwhile.
+
+Nothing is patched: queries are timed by an execute wrapper on the
+request's connections (on the thread the async ORM uses, under ASGI), and
+Celery messages through its publish signals. Other code's cache calls and
+anything outside a request are left alone.
+"""
+import contextvars
+import cProfile
+import functools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from celery.signals import after_task_publish, before_task_publish
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from django.db import connections
+
+CACHE_METHODS = {
+    'add', 'get', 'set', 'touch', 'delete', 'get_many', 'set_many', 'delete_many',
+    'has_key', 'incr', 'decr', 'get_or_set', 'clear',
+}
+UNITS = {'db': ('query', 'queries'), 'celery': ('task', 'tasks'), 'render': ('render', 'renders')}
+
+_current = contextvars.ContextVar('instrumentation_timings', default=None)
+_active = contextvars.ContextVar('instrumentation_active', default=frozenset())
+_publish_started = contextvars.ContextVar('instrumentation_publish_started', default=None)
+
+
+class Timings:
+    """Call counts and total milliseconds per category for one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.counts = Counter()
+        self.durations = Counter()
+        self._lock = threading.Lock()  # storage calls record from the thread pool
+
+    def add(self, name, duration_ms, count=1):
+        with self._lock:
+            self.counts[name] += count
+            self.durations[name] += duration_ms
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def header(self, total_ms):
+        metrics = []
+        for name in sorted(self.counts):
+            singular, plural = UNITS.get(name, ('call', 'calls'))
+            count = self.counts[name]
+            metrics.append(f'{name};dur={self.durations[name]:.1f};desc="{count} {singular if count == 1 else plural}"')
+        metrics.append(f'total;dur={total_ms:.1f}')
+        return ', '.join(metrics)
+
+
+def current():
+    """The Timings of the request being handled, or None outside of one."""
+    return _current.get()
+
+
+@contextmanager
+def _record(name):
+    timings = _current.get()
+    # Nested calls of the same kind (cache.get_or_set calling get and add) count once
+    if timings is None or name in _active.get():
+        yield
+        return
+
+    token = _active.set(_active.get() | {name})
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, (time.perf_counter() - started) * 1000)
+        _active.reset(token)
+
+
+class timed:
+    """
+    Time a block or function under `name` in the current request's timings:
+
+        with timed('facets'):
+            ...
+
+        @timed('geo')
+        def nearby(...):
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self._context = _record(self.name)
+        return self._context.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self._context.__exit__(*exc_info)
+
+    def __call__(self, func):
+        if iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with _record(self.name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _record(self.name):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class TimedCache:
+    """
+    The default cache, with its calls (and their async versions) timed under
+    `cache`. The project's modules use this one in place of
+    django.core.cache.cache.
+    """
+
+    def __getattr__(self, name):
+        attribute = getattr(default_cache, name)
+        if name in CACHE_METHODS or name.startswith('a') and name[1:] in CACHE_METHODS:
+            return timed('cache')(attribute)
+        return attribute
+
+
+cache = TimedCache()
+
+
+def _time_query(execute, sql, params, many, context):
+    with _record('db'):
+        return execute(sql, params, many, context)
+
+
+def time_queries():
+    """Time the queries of this thread's connections until the returned stack is closed."""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(_time_query))
+    return stack
+
+
+@before_task_publish.connect(dispatch_uid='instrumentation.before_task_publish')
+def _start_publish(**kwargs):
+    if _current.get() is not None:
+        _publish_started.set(time.perf_counter())
+
+
+@after_task_publish.connect(dispatch_uid='instrumentation.after_task_publish')
+def _finish_publish(**kwargs):
+    timings, started = _current.get(), _publish_started.get()
+    if timings is not None and started is not None:
+        _publish_started.set(None)
+        timings.add('celery', (time.perf_counter() - started) * 1000)
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack every `interval` seconds into collapsed stacks."""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path + '.folded', 'w') as out:
+            for stack, count in self.stacks.most_common():
+                out.write(f'{stack} {count}\n')
+
+
+class CProfiler:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path):
+        self.profile.dump_stats(path + '.prof')
+
+
+def make_profiler():
+    if random.random() >= settings.PROFILE_SAMPLE_RATE:
+        return None
+    if settings.PROFILE_MODE == 'cprofile':
+        return CProfiler()
+    return SamplingProfiler(threading.get_ident(), interval=settings.PROFILE_INTERVAL)
+
+
+def profile_path(request, total_ms):
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_') or 'root'
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}_{request.method}_{slug[:80]}_{total_ms:.0f}ms"
+    return os.path.join(settings.PROFILE_OUTPUT_DIR, name)
+
+
+class InstrumentationMiddleware:
+    """Put this first in MIDDLEWARE so the timings cover the whole stack."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        timings, token, profiler = self.start()
+        queries = time_queries() if settings.SERVER_TIMING_HEADER else ExitStack()
+        try:
+            with queries:
+                response = self.get_response(request)
+        finally:
+            self.stop(token, profiler)
+        return self.finish(request, response, timings, profiler)
+
+    async def __acall__(self, request):
+        timings, token, profiler = self.start()
+        try:
+            if settings.SERVER_TIMING_HEADER:
+                # On the thread the request's async ORM calls run on
+                queries = await sync_to_async(time_queries)()
+                try:
+                    response = await self.get_response(request)
+                finally:
+                    await sync_to_async(queries.close)()
+            else:
+                response = await self.get_response(request)
+        finally:
+            self.stop(token, profiler)
+        return self.finish(request, response, timings, profiler)
+
+    def start(self):
+        timings = Timings()
+        token = _current.set(timings)
+        profiler = make_profiler()
+        if profiler is not None:
+            profiler.start()
+        return timings, token, profiler
+
+    def stop(self, token, profiler):
+        try:
+            if profiler is not None:
+                profiler.stop()
+        finally:
+            _current.reset(token)
+
+    def finish(self, request, response, timings, profiler):
+        total_ms = timings.elapsed_ms()
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = timings.header(total_ms)
+
+        if profiler is not None and total_ms >= settings.PROFILE_SLOW_REQUEST_MS:
+            os.makedirs(settings.PROFILE_OUTPUT_DIR, exist_ok=True)
+            profiler.write(profile_path(request, total_ms))
+
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before the response is rendered; the callback runs right after
+        timings = _current.get()
+        if timings is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                timings.add('render', (time.perf_counter() - started) * 1000)
+
+            response.add_post_render_callback(rendered)
+        return response
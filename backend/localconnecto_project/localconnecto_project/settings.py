@@ -3,6 +3,8 @@ from datetime import timedelta
 import cloudinary
 from dotenv import load_dotenv
 import os
+import sys
+import tempfile
 load_dotenv()
 
 
@@ -56,6 +58,8 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'localconnecto_project.instrumentation.InstrumentationMiddleware',
+    'localconnecto_project.db_routing.ReplicaRoutingMiddleware',
     'corsheaders.middleware.CorsMiddleware', 
     'django.middleware.common.CommonMiddleware', 
     "allauth.account.middleware.AccountMiddleware",
@@ -101,9 +105,40 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep each worker thread's connection open between requests instead
+        # of reconnecting every time; checked before reuse. (Django's own pool,
+        # OPTIONS['pool'], only exists for PostgreSQL.) WSGI only: asgi.py
+        # defaults DB_CONN_MAX_AGE to 0.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+        # A file rather than the in-memory default, whose shared-cache locks
+        # fail instead of waiting: the locking tests race two connections
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Read replicas (see localconnecto_project/db_routing.py): a comma-separated
+# list of database files or `file:` URIs, e.g. 'file:db.sqlite3?mode=ro' for a
+# read-only second connection to the primary when trying it out locally.
+REPLICA_DATABASES = []
+for i, name in enumerate(filter(None, os.getenv('DATABASE_REPLICAS', '').split(',')), start=1):
+    alias = f'replica{i}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': name.strip(),
+        'OPTIONS': {'timeout': 20},
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(alias)
+
+# The routing tests (items/tests.py) read through a replica of their own: a
+# second connection to the test database, for which Django creates nothing
+if sys.argv[1:2] == ['test']:
+    DATABASES['replica'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['localconnecto_project.db_routing.ReplicaRouter']
+REPLICA_STICKY_SECONDS = 10  # reads stay on the primary this long after a user writes
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -201,6 +236,9 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
+    # Proxies in front of the app, so throttles see the client's IP. Left at 0,
+    # X-Forwarded-For is ignored (clients could set it to dodge IP limits).
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '0')),
     # 'DEFAULT_PAGINATION_CLASS': ['rest_framework.pagination.PageNumberPagination'],
     # 'PAGE_SIZE': 6,
 }
@@ -240,6 +278,13 @@ EMAIL_HOST_PASSWORD = SENDGRID_API_KEY
 EMAIL_USE_TLS = True
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL')
 
+# Transactional mail from the workers (see users_auth/mailer.py)
+MAIL_BATCH_SIZE = 50  # messages a task takes off the queue at a time
+MAIL_BATCH_DELAY = 1  # seconds a queued message waits for others to batch with
+MAIL_MAX_RETRIES = 5
+MAIL_RETRY_DELAY = 30  # seconds before the first retry, doubling after each
+MAIL_CONNECTION_MAX_IDLE = 60  # seconds; the server drops idle connections
+
 
 #used for google auth
 LOGIN_REDIRECT_URL = '/callback/'
@@ -262,6 +307,37 @@ CLOUDINARY_STORAGE = {
 
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
+# Item images are staged here and uploaded to Cloudinary by a Celery task.
+# Set ITEM_IMAGE_UPLOADS_ASYNC to False to upload during the request instead.
+ITEM_IMAGE_UPLOADS_ASYNC = True
+ITEM_IMAGE_STAGING_DIR = os.getenv('ITEM_IMAGE_STAGING_DIR', os.path.join(tempfile.gettempdir(), 'localconnecto_uploads'))
+ITEM_IMAGE_MAX_BYTES = 2 * 1024 * 1024  # for images fetched by URL (bulk imports)
+
+# Bulk imports (see items/imports.py): rows per bulk_create, per API request,
+# and items whose images one `import_item_images` task fetches
+ITEM_IMPORT_CHUNK_SIZE = 500
+ITEM_IMPORT_MAX_ROWS = 1000
+ITEM_IMPORT_IMAGE_BATCH = 10
+
+# Where uploaded images are stored, once per distinct content (see items/media.py):
+# 'items.media.CloudinaryBackend', or 'items.media.LocalBackend' to keep them under
+# MEDIA_ROOT for development, CI and benchmarks.
+MEDIA_BACKEND = os.getenv('MEDIA_BACKEND', 'items.media.CloudinaryBackend')
+MEDIA_ASSET_FOLDER = 'assets'
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', BASE_DIR / 'media')
+MEDIA_URL = '/media/'
+
+# Cloudinary calls within one request/task run on a small thread pool
+IMAGE_STORAGE_MAX_WORKERS = 4
+IMAGE_STORAGE_TIMEOUT = 30  # seconds per upload/destroy call
+
+# Resized copies generated for every stored image (see items/derivatives.py):
+# size name -> longest side in pixels, each in every format listed
+IMAGE_VARIANTS = {'thumb': 160, 'card': 480, 'full': 1280}
+IMAGE_VARIANT_FORMATS = ['webp', 'jpeg']
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_PLACEHOLDER_SIZE = 16  # longest side of the inline blur placeholder
+
 
 
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
@@ -275,4 +351,37 @@ CACHES = {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
         }
     }
-}
\ No newline at end of file
+}
+
+# Seconds an anonymous /items/ or /categories/ response stays cached (see items/cache.py)
+RESPONSE_CACHE_TIMEOUT = 60 * 5
+
+# Serve the hot reads from native async views (see localconnecto_project/async_views.py).
+# asgi.py turns this on; under WSGI the DRF views are cheaper.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', '0') == '1'
+
+# Password reset OTPs (see users_auth/otp.py)
+OTP_TIMEOUT = 60 * 5  # seconds a code can be used
+OTP_MAX_ATTEMPTS = 5  # wrong guesses before the code is dropped
+OTP_VERIFIED_TIMEOUT = 60 * 5  # seconds to change the password once verified
+
+# Rate limits (see localconnecto_project/throttling.py): per policy, rules of
+# (identity, requests, window in seconds), identity being 'ip', 'email' (from
+# the request body) or 'user'. A request must pass every rule.
+THROTTLE_ENABLED = True
+THROTTLE_POLICIES = {
+    'otp_send': [('email', 3, 15 * 60), ('ip', 10, 60 * 60)],
+    'otp_verify': [('email', 5, 15 * 60), ('ip', 20, 15 * 60)],
+    'password_reset': [('email', 5, 15 * 60), ('ip', 20, 15 * 60)],
+    'login': [('email', 10, 15 * 60), ('ip', 30, 5 * 60)],
+    'google_token': [('ip', 30, 5 * 60)],
+    'search': [('user', 60, 60), ('ip', 120, 60)],
+}
+
+# Per-request instrumentation (see localconnecto_project/instrumentation.py)
+SERVER_TIMING_HEADER = True
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # share of requests to profile, 0 disables
+PROFILE_SLOW_REQUEST_MS = int(os.getenv('PROFILE_SLOW_REQUEST_MS', '500'))  # only slower requests are written
+PROFILE_MODE = os.getenv('PROFILE_MODE', 'sampling')  # 'sampling' (collapsed stacks) or 'cprofile'
+PROFILE_INTERVAL = 0.005  # seconds between stack samples
+PROFILE_OUTPUT_DIR = os.getenv('PROFILE_OUTPUT_DIR', os.path.join(tempfile.gettempdir(), 'localconnecto_profiles'))
@@ -0,0 +1,36 @@
+"""
+Settings for load tests: the regular settings with Cloudinary and SMTP
+replaced by the local stand-ins in stubs.py, so write endpoints can be
+driven without touching the real services.
+
+    export DJANGO_SETTINGS_MODULE=localconnecto_project.settings_loadtest
+    python manage.py migrate
+    python manage.py runserver --noreload        # or gunicorn localconnecto_project.wsgi
+    python manage.py loadtest --seed 10000 --json results.json
+
+Redis (cache, Celery broker) is used as configured unless LOADTEST_NO_REDIS
+is set, in which case the cache is per process and tasks run inline.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES, os, tempfile
+from . import stubs
+
+DEBUG = False  # DEBUG keeps every executed query in memory
+ALLOWED_HOSTS = ['localhost', '127.0.0.1', 'testserver']
+
+EMAIL_BACKEND = 'localconnecto_project.stubs.StubEmailBackend'
+STUB_MEDIA_ROOT = os.getenv('STUB_MEDIA_ROOT', os.path.join(tempfile.gettempdir(), 'localconnecto_stub_media'))
+STUB_LATENCY = float(os.getenv('STUB_LATENCY', '0.05'))  # seconds per stubbed upload/destroy/send
+MEDIA_BACKEND = os.getenv('MEDIA_BACKEND', 'localconnecto_project.stubs.media_backend')
+THROTTLE_ENABLED = False  # every load test client comes from the same IP
+
+# Under load, SQLite's deferred transactions that read and then write fail
+# with "database is locked" as soon as another writer holds the lock. Take
+# the lock when the transaction starts instead, and wait longer for it.
+DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE', 'timeout': 20}
+
+if os.getenv('LOADTEST_NO_REDIS'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    CELERY_TASK_ALWAYS_EAGER = True
+
+stubs.install_cloudinary()
@@ -0,0 +1,188 @@
+"""
+Local stand-ins for the external services, for load tests and offline runs.
+
+    cloudinary  install_cloudinary() swaps the uploader functions for ones that
+                write the file under STUB_MEDIA_ROOT and return what Cloudinary
+                would; destroy removes the file again. media_backend() is the
+                Cloudinary media backend reading the files back from there.
+    smtp        StubEmailBackend accepts the messages without sending them.
+                SMTPStandIn is a local SMTP server that accepts and drops
+                every message, for measuring the SMTP backend itself.
+
+Both wait a fixed STUB_LATENCY (seconds) per call, so a load test still pays
+for the round trip to the service, just without its variance. SMTPStandIn
+takes its own latencies for opening a connection and for each message.
+"""
+import itertools
+import os
+import socketserver
+import threading
+import time
+import cloudinary
+from cloudinary import uploader
+from django.conf import settings
+from django.core.mail.backends.base import BaseEmailBackend
+
+_ids = itertools.count(1)
+_installed = False
+
+
+def latency():
+    delay = getattr(settings, 'STUB_LATENCY', 0)
+    if delay:
+        time.sleep(delay)
+
+
+def media_root():
+    return settings.STUB_MEDIA_ROOT
+
+
+def read_file(file):
+    """Bytes of an upload given as a path or a (Django) file object."""
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            return f.read()
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    return file.read()
+
+
+def store(file, folder, public_id=None):
+    if not public_id:
+        public_id = f"stub_{os.getpid()}_{next(_ids)}"
+        if folder:
+            public_id = f"{folder.strip('/')}/{public_id}"
+    path = os.path.join(media_root(), public_id + '.jpg')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = read_file(file)
+    with open(path, 'wb') as out:
+        out.write(data)
+    latency()
+    return public_id, len(data)
+
+
+def upload_resource(file, **options):
+    public_id, _ = store(file, options.get('folder'), options.get('public_id'))
+    return cloudinary.CloudinaryResource(
+        public_id, format='jpg', version='1', type='upload', resource_type='image', metadata={}
+    )
+
+
+def upload(file, **options):
+    public_id, size = store(file, options.get('folder'), options.get('public_id'))
+    return {
+        'public_id': public_id,
+        'version': 1,
+        'format': 'jpg',
+        'resource_type': 'image',
+        'type': 'upload',
+        'bytes': size,
+        'url': f'http://stub.invalid/image/upload/v1/{public_id}.jpg',
+        'secure_url': f'https://stub.invalid/image/upload/v1/{public_id}.jpg',
+    }
+
+
+def destroy(public_id, **options):
+    latency()
+    try:
+        os.remove(os.path.join(media_root(), public_id + '.jpg'))
+    except OSError:
+        return {'result': 'not found'}
+    return {'result': 'ok'}
+
+
+def install_cloudinary():
+    """
+    Replace the Cloudinary uploader calls process-wide. Call before the apps
+    are imported (e.g. from a settings module): modules that did
+    `from cloudinary.uploader import upload` keep whatever they imported.
+    """
+    global _installed
+    if _installed:
+        return
+    uploader.upload_resource = upload_resource
+    uploader.upload = upload
+    uploader.destroy = destroy
+    if not cloudinary.config().cloud_name:
+        cloudinary.config(cloud_name='stub')
+    _installed = True
+
+
+def media_backend():
+    """MEDIA_BACKEND factory: CloudinaryBackend over the stubbed uploader."""
+    # Imported here: settings modules import this one before the apps are loaded
+    from items.media import CloudinaryBackend
+
+    class StubMediaBackend(CloudinaryBackend):
+        def open(self, public_id, format, version):
+            return open(os.path.join(media_root(), public_id + '.jpg'), 'rb')
+
+    return StubMediaBackend()
+
+
+class StubEmailBackend(BaseEmailBackend):
+    """Accepts every message without sending it."""
+
+    def send_messages(self, email_messages):
+        if not email_messages:
+            return 0
+        latency()
+        return len(email_messages)
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """
+    Accepts every message over plain SMTP and counts it. `connect_latency`
+    (seconds) stands in for the TLS handshake and login of a new connection,
+    `message_latency` for the server taking a message.
+
+        server = SMTPStandIn(connect_latency=0.2).start()
+        # EMAIL_HOST, EMAIL_PORT = server.server_address, EMAIL_USE_TLS = False
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0), connect_latency=0, message_latency=0):
+        super().__init__(address, SMTPHandler)
+        self.connect_latency = connect_latency
+        self.message_latency = message_latency
+        self.connections = 0
+        self.messages = 0
+        self._count_lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='smtp-stand-in', daemon=True).start()
+        return self
+
+    def count(self, name):
+        with self._count_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.server.count('connections')
+        time.sleep(self.server.connect_latency)
+        self.reply('220 localhost SMTP stand-in')
+        for line in iter(self.rfile.readline, b''):
+            command = line.decode(errors='replace').strip().split(' ', 1)[0].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif command in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                for data in iter(self.rfile.readline, b''):
+                    if data.rstrip(b'\r\n') == b'.':
+                        break
+                time.sleep(self.server.message_latency)
+                self.server.count('messages')
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
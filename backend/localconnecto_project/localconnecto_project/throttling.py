@@ -0,0 +1,216 @@
+"""
+Sliding-window rate limits kept in Redis.
+
+Each policy in settings.THROTTLE_POLICIES is a list of rules, each counting
+requests per client IP, per email address (from the request body) or per
+signed-in user over a window in seconds:
+
+    THROTTLE_POLICIES = {
+        'otp_send': [('email', 3, 15 * 60), ('ip', 10, 60 * 60)],
+    }
+
+A request goes through when every rule that applies to it has room, and
+only then is it counted against all of them. One Lua script does the
+checking and counting for the whole policy, so a check is a single Redis
+round trip and atomic across every worker. Rejected requests answer 429
+with `Retry-After`.
+
+Each rule keeps a sliding-window counter: the counts of the current and the
+previous fixed window, the previous one weighted by how much of it the
+sliding window still covers. That is two integers per key whatever the
+limit, close enough to an exact sliding log for rate limiting.
+
+DRF views opt in with `throttle_classes = [PolicyThrottle]` and a
+`throttle_policy` (or get_throttle_policy()); plain Django views use the
+`throttle(policy)` decorator. Without a django_redis cache (locmem in
+tests) the windows are kept in process memory; if Redis is unreachable
+requests are let through.
+"""
+import functools
+import hashlib
+import math
+import threading
+import time
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.throttling import BaseThrottle
+from .instrumentation import timed
+from .tiered_cache import get_connection
+
+# KEYS: one hash per rule. ARGV: limit and window (seconds) per rule.
+# Returns 0 when the request is allowed (and counted), otherwise the
+# milliseconds until it would be.
+SCRIPT = """
+local now = redis.call('TIME')
+local t = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local wait = 0
+local windows = {}
+
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[2 * i - 1])
+    local window = tonumber(ARGV[2 * i])
+    local index = math.floor(t / window)
+
+    local stored = redis.call('HMGET', key, 'w', 'c', 'p')
+    local stored_index = tonumber(stored[1])
+    local current = tonumber(stored[2]) or 0
+    local previous = tonumber(stored[3]) or 0
+    if stored_index ~= index then
+        if stored_index == index - 1 then previous = current else previous = 0 end
+        current = 0
+    end
+
+    local elapsed = t - index * window
+    if previous * (window - elapsed) / window + current + 1 > limit then
+        local rule_wait
+        if current + 1 <= limit then
+            -- Room once enough of the previous window has slid out
+            rule_wait = window - elapsed - (limit - 1 - current) * window / previous
+        else
+            -- This window is full: wait for the next one to weigh it down enough
+            rule_wait = window - elapsed + math.max(0, window * (1 - (limit - 1) / current))
+        end
+        wait = math.max(wait, rule_wait)
+    end
+    windows[i] = {index, current, previous, window}
+end
+
+if wait > 0 then
+    return math.max(1, math.ceil(wait * 1000))
+end
+
+for i, key in ipairs(KEYS) do
+    local w = windows[i]
+    redis.call('HSET', key, 'w', w[1], 'c', w[2] + 1, 'p', w[3])
+    redis.call('EXPIRE', key, w[4] * 2)
+end
+return 0
+"""
+
+
+def rule_key(policy, scope, window, identity):
+    # Emails are hashed so the keys hold no addresses
+    digest = hashlib.sha256(str(identity).encode()).hexdigest()[:32]
+    return f'throttle:{policy}:{scope}:{window}:{digest}'
+
+
+def check(policy, identities):
+    """
+    Count a request under `policy` for `identities` ({'ip': ..., 'email': ...,
+    'user': ...}; rules whose identity is missing are skipped). Returns 0 if
+    it is allowed, otherwise the seconds to wait before retrying.
+    """
+    rules = [
+        (rule_key(policy, scope, window, identities[scope]), limit, window)
+        for scope, limit, window in settings.THROTTLE_POLICIES[policy]
+        if identities.get(scope) not in (None, '')
+    ]
+    if not rules or not settings.THROTTLE_ENABLED:
+        return 0
+
+    with timed('throttle'):
+        connection = get_connection()
+        if connection is None:
+            wait_ms = _local.check(rules)
+        else:
+            try:
+                # EVAL rather than EVALSHA: one round trip even right after a
+                # Redis restart; Redis caches the compiled script by hash anyway
+                wait_ms = connection.eval(
+                    SCRIPT, len(rules), *[key for key, _, _ in rules],
+                    *[value for _, limit, window in rules for value in (limit, window)]
+                )
+            except Exception as e:
+                print(f"Error checking rate limit {policy}, letting the request through: {e}")
+                return 0
+    return math.ceil(int(wait_ms) / 1000)
+
+
+class LocalWindows:
+    """SCRIPT's sliding-window counters in process memory, for caches other than django_redis."""
+
+    def __init__(self):
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def check(self, rules):
+        t = time.time()
+        wait = 0
+        windows = []
+        with self._lock:
+            for key, limit, window in rules:
+                index = math.floor(t / window)
+                stored_index, current, previous = self._windows.get(key, (None, 0, 0))
+                if stored_index != index:
+                    previous = current if stored_index == index - 1 else 0
+                    current = 0
+
+                elapsed = t - index * window
+                if previous * (window - elapsed) / window + current + 1 > limit:
+                    if current + 1 <= limit:
+                        rule_wait = window - elapsed - (limit - 1 - current) * window / previous
+                    else:
+                        rule_wait = window - elapsed + max(0, window * (1 - (limit - 1) / current))
+                    wait = max(wait, rule_wait)
+                windows.append((key, index, current, previous))
+
+            if wait > 0:
+                return max(1, math.ceil(wait * 1000))
+            for key, index, current, previous in windows:
+                self._windows[key] = (index, current + 1, previous)
+        return 0
+
+
+_local = LocalWindows()
+
+
+def request_identities(request, ip):
+    """The IP, the (lower-cased) `email` of the request body, and the signed-in user's id."""
+    email = None
+    data = getattr(request, 'data', None)
+    if hasattr(data, 'get') and isinstance(data.get('email'), str):
+        email = data.get('email').strip().lower()
+
+    user = getattr(request, 'user', None)
+    return {
+        'ip': ip,
+        'email': email,
+        'user': user.pk if user is not None and user.is_authenticated else None,
+    }
+
+
+class PolicyThrottle(BaseThrottle):
+    """Applies the view's `throttle_policy` (or get_throttle_policy()), if it has one."""
+
+    def allow_request(self, request, view):
+        if hasattr(view, 'get_throttle_policy'):
+            policy = view.get_throttle_policy()
+        else:
+            policy = getattr(view, 'throttle_policy', None)
+        if policy is None:
+            return True
+
+        self.retry_after = check(policy, request_identities(request, self.get_ident(request)))
+        return not self.retry_after
+
+    def wait(self):
+        return self.retry_after
+
+
+def throttle(policy):
+    """`throttle_policy` for plain Django views: answers 429 with Retry-After like DRF does."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            retry_after = check(policy, {'ip': BaseThrottle().get_ident(request)})
+            if retry_after:
+                response = JsonResponse(
+                    {'detail': f"Request was throttled. Expected available in {retry_after} seconds."},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS
+                )
+                response['Retry-After'] = str(retry_after)
+                return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
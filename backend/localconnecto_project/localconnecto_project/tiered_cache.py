@@ -0,0 +1,324 @@
+"""
+Two-tier cache for small, hot lookup data.
+
+L1 is a per-process LRU with a short TTL; L2 is the default (django_redis)
+cache shared by every worker. Invalidations retire the L2 entry and are
+broadcast over Redis pub/sub so every worker process drops its L1 copy
+straight away instead of serving it until the TTL runs out. Values the
+loaders don't find are cached as well, so they aren't looked up every time.
+
+    categories = TieredCache('categories', ttl=60)
+    data = categories.get('all', load_categories)
+    categories.invalidate('all')
+
+Async views use aget()/aget_many() with async loaders; L1 hits are served
+without leaving the event loop.
+"""
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from django.db import transaction
+from .instrumentation import cache
+
+CHANNEL = 'tiered_cache:invalidate'
+
+_registry = {}
+_listener_lock = threading.Lock()
+_listener_pid = None
+
+
+class TieredCache:
+    def __init__(self, name, maxsize=1024, ttl=30, l2_timeout=300):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.l2_timeout = l2_timeout
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._drops = 0  # L1 drops so far, see _set_local()
+        _registry[name] = self
+
+    # L2 values are keyed by the key's generation, which invalidating bumps:
+    # a reader that loaded the old value before an invalidation writes it
+    # under a key nobody reads any more, instead of over the fresh one.
+
+    def _generation_key(self, key):
+        return f'tiered_cache:{self.name}:generation:{key}'
+
+    def _l2_key(self, key, generation):
+        return f'tiered_cache:{self.name}:{generation}:{key}'
+
+    def _generations(self, keys):
+        generation_keys = {self._generation_key(key): key for key in keys}
+        found = cache.get_many(list(generation_keys))
+        generations = {}
+        for generation_key, key in generation_keys.items():
+            generation = found.get(generation_key)
+            if generation is None:
+                generation = initial_generation()
+                if not cache.add(generation_key, generation, timeout=self.l2_timeout):
+                    generation = cache.get(generation_key)  # Another worker's came first
+            generations[key] = generation
+        return generations
+
+    async def _agenerations(self, keys):
+        generation_keys = {self._generation_key(key): key for key in keys}
+        found = await cache.aget_many(list(generation_keys))
+        generations = {}
+        for generation_key, key in generation_keys.items():
+            generation = found.get(generation_key)
+            if generation is None:
+                generation = initial_generation()
+                if not await cache.aadd(generation_key, generation, timeout=self.l2_timeout):
+                    generation = await cache.aget(generation_key)
+            generations[key] = generation
+        return generations
+
+    # L1
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return value
+
+    def _set_local(self, key, value, drops):
+        with self._lock:
+            # Read before an invalidation reached this process: maybe stale
+            if drops != self._drops:
+                return
+            self._local[key] = (time.monotonic() + self.ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+    def drop_local(self, key=None):
+        with self._lock:
+            self._drops += 1
+            if key is None:
+                self._local.clear()
+            else:
+                self._local.pop(key, None)
+
+    # Reads
+
+    def get(self, key, loader):
+        """
+        Return the value for `key`, calling `loader()` on a miss in both
+        tiers. A None from the loader is cached too.
+        """
+        ensure_listener()
+
+        value = self._get_local(key)
+        if value is not None:
+            return found_value(value)
+
+        drops = self._drops
+        l2_key = self._l2_key(key, self._generations([key])[key])
+        value = cache.get(l2_key)
+        if value is None:
+            value = loader()
+            if value is None:
+                value = MISSING
+            cache.set(l2_key, value, timeout=self.l2_timeout)
+
+        self._set_local(key, value, drops)
+        return found_value(value)
+
+    def get_many(self, keys, loader):
+        """
+        Return {key: value} for `keys`. Keys missing from both tiers are
+        loaded together with `loader(missing_keys)`, which returns a dict;
+        keys it leaves out are cached as missing and left out here too.
+        """
+        ensure_listener()
+
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._get_local(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+
+        if missing:
+            drops = self._drops
+            generations = self._generations(missing)
+            l2_keys = {key: self._l2_key(key, generations[key]) for key in missing}
+            l2_values = cache.get_many(list(l2_keys.values()))
+            still_missing = []
+            for key in missing:
+                value = l2_values.get(l2_keys[key])
+                if value is None:
+                    still_missing.append(key)
+                else:
+                    found[key] = value
+                    self._set_local(key, value, drops)
+
+            if still_missing:
+                loaded = loader(still_missing)
+                loaded = {key: MISSING if loaded.get(key) is None else loaded[key] for key in still_missing}
+                cache.set_many({l2_keys[key]: value for key, value in loaded.items()}, timeout=self.l2_timeout)
+                for key, value in loaded.items():
+                    found[key] = value
+                    self._set_local(key, value, drops)
+
+        return {key: value for key, value in found.items() if value != MISSING}
+
+    async def aget(self, key, loader):
+        """get() for async code: `loader` is an async function."""
+        ensure_listener()
+
+        value = self._get_local(key)
+        if value is not None:
+            return found_value(value)
+
+        drops = self._drops
+        l2_key = self._l2_key(key, (await self._agenerations([key]))[key])
+        value = await cache.aget(l2_key)
+        if value is None:
+            value = await loader()
+            if value is None:
+                value = MISSING
+            await cache.aset(l2_key, value, timeout=self.l2_timeout)
+
+        self._set_local(key, value, drops)
+        return found_value(value)
+
+    async def aget_many(self, keys, loader):
+        """get_many() for async code: `loader(missing_keys)` is an async function."""
+        ensure_listener()
+
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._get_local(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+
+        if missing:
+            drops = self._drops
+            generations = await self._agenerations(missing)
+            l2_keys = {key: self._l2_key(key, generations[key]) for key in missing}
+            l2_values = await cache.aget_many(list(l2_keys.values()))
+            still_missing = []
+            for key in missing:
+                value = l2_values.get(l2_keys[key])
+                if value is None:
+                    still_missing.append(key)
+                else:
+                    found[key] = value
+                    self._set_local(key, value, drops)
+
+            if still_missing:
+                loaded = await loader(still_missing)
+                loaded = {key: MISSING if loaded.get(key) is None else loaded[key] for key in still_missing}
+                await cache.aset_many({l2_keys[key]: value for key, value in loaded.items()}, timeout=self.l2_timeout)
+                for key, value in loaded.items():
+                    found[key] = value
+                    self._set_local(key, value, drops)
+
+        return {key: value for key, value in found.items() if value != MISSING}
+
+    # Invalidation
+
+    def invalidate(self, key):
+        """Drop `key` from both tiers in every worker once the transaction commits."""
+        transaction.on_commit(lambda: self._invalidate_now(key))
+
+    def _invalidate_now(self, key):
+        try:
+            cache.incr(self._generation_key(key))
+        except ValueError:
+            pass  # No generation: no value cached under one either
+        self.drop_local(key)
+        publish(self.name, key)
+
+
+# Stands in for "no value" in both tiers, where None means "not cached"
+MISSING = 'tiered_cache:missing'
+
+
+def found_value(value):
+    return None if value == MISSING else value
+
+
+def initial_generation():
+    # Random rather than 1, so a generation that expired doesn't start over
+    # at one a reader still holds
+    return secrets.randbits(48)
+
+
+def publish(name, key):
+    connection = get_connection()
+    if connection is None:
+        return
+    try:
+        connection.publish(CHANNEL, json.dumps({'cache': name, 'key': key}))
+    except Exception as e:
+        print(f"Error publishing cache invalidation: {e}")
+
+
+def get_connection():
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        # Not a django_redis cache (e.g. locmem in tests): L1 expiry only
+        return None
+
+
+def ensure_listener():
+    """Start this process's invalidation listener (again after a fork)."""
+    global _listener_pid
+    if _listener_pid == os.getpid():
+        return
+
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+        threading.Thread(target=_listen, name='tiered-cache-invalidation', daemon=True).start()
+
+
+def _listen():
+    while True:
+        connection = get_connection()
+        if connection is None:
+            return
+
+        try:
+            pubsub = connection.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CHANNEL)
+            # Messages may have been missed while we were not subscribed
+            for tiered in list(_registry.values()):
+                tiered.drop_local()
+
+            for message in pubsub.listen():
+                _dispatch(message.get('data'))
+        except Exception as e:
+            print(f"Cache invalidation listener error, reconnecting: {e}")
+            time.sleep(1)
+
+
+def _dispatch(data):
+    try:
+        payload = json.loads(data)
+    except (TypeError, ValueError):
+        return
+
+    tiered = _registry.get(payload.get('cache'))
+    if tiered is not None:
+        tiered.drop_local(payload.get('key'))
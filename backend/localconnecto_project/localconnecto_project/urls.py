@@ -1,10 +1,16 @@
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from users_auth.views import google_login_callback, validate_google_token, UserDataView, UserProfileViewSet
+from rest_framework_simplejwt.views import TokenRefreshView
+from users_auth.views import (
+    google_login_callback, validate_google_token, UserDataView, UserProfileViewSet,
+    ThrottledLoginView, ThrottledTokenObtainPairView,
+)
 from dj_rest_auth.registration.views import RegisterView
-from dj_rest_auth.views import LoginView
 from rest_framework import routers
+from localconnecto_project.async_views import async_read_view
+from users_auth.async_views import user_data, profiles_list, profile_detail
 
 router = routers.DefaultRouter()
 router.register(r'profiles', UserProfileViewSet, basename='profiles')
@@ -15,10 +21,10 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     # path('auth/', include('dj_rest_auth.urls')),
     path('auth/registration/', RegisterView.as_view(), name="user_registration"),
-    path('auth/login/', LoginView.as_view(), name='user_login'),
+    path('auth/login/', ThrottledLoginView.as_view(), name='user_login'),
     path('auth/users/', UserDataView.as_view(), name='user_data'),
     path('auth/', include(router.urls)),
-    path('auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('auth/token/', ThrottledTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('accounts/', include('allauth.urls')),
     path('callback/', google_login_callback, name='callback'),
@@ -29,3 +35,23 @@ urlpatterns = [
     # path('auth/social/', include('allauth.socialaccount.urls')),  # Social account URLs
     # path('auth/google/', include('allauth.socialaccount.providers.google.urls')), 
 ]
+
+if settings.ASYNC_READ_VIEWS:
+    # Native async GETs under ASGI, ahead of the routes above (see localconnecto_project/async_views.py)
+    urlpatterns[:0] = [
+        path('auth/users/', async_read_view(UserDataView.as_view(), user_data)),
+        path('auth/profiles/', async_read_view(
+            UserProfileViewSet.as_view({'get': 'list', 'post': 'create'}, basename='profiles', detail=False),
+            profiles_list
+        )),
+        path('auth/profiles/<int:pk>/', async_read_view(
+            UserProfileViewSet.as_view(
+                {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'},
+                basename='profiles', detail=True
+            ),
+            profile_detail
+        )),
+    ]
+
+# Images stored by items.media.LocalBackend (static() is a no-op unless DEBUG)
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
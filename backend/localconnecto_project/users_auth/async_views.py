@@ -0,0 +1,37 @@
+from localconnecto_project.async_views import Fallback, authenticate, json_response
+from .models import UserProfile
+from .serializers import UserDataSerializer, UserProfileSerializer
+
+# Async versions of the signed-in user's own reads, served under ASGI (see
+# localconnecto_project/async_views.py). Anonymous requests and missing
+# profiles fall back to the DRF views for their 401/404.
+
+
+async def signed_in_user(request):
+    user = await authenticate(request)
+    if not user.is_authenticated:
+        raise Fallback
+    return user
+
+
+async def user_data(request):
+    """GET /auth/users/: UserDataView."""
+    user = await signed_in_user(request)
+    return json_response(UserDataSerializer([user], many=True).data)
+
+
+async def profiles_list(request):
+    """GET /auth/profiles/: UserProfileViewSet.list."""
+    user = await signed_in_user(request)
+    profiles = [profile async for profile in UserProfile.objects.filter(user=user).select_related('user')]
+    return json_response(UserProfileSerializer(profiles, many=True).data)
+
+
+async def profile_detail(request, pk):
+    """GET /auth/profiles/<pk>/: UserProfileViewSet.retrieve."""
+    user = await signed_in_user(request)
+    try:
+        profile = await UserProfile.objects.select_related('user').aget(user=user, pk=pk)
+    except UserProfile.DoesNotExist:
+        raise Fallback
+    return json_response(UserProfileSerializer(profile).data)
@@ -0,0 +1,149 @@
+import json
+import os
+import smtplib
+import threading
+import time
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from localconnecto_project.tiered_cache import get_connection as get_redis_connection
+
+# Transactional email (welcome mails, OTPs) for the Celery workers.
+#
+# queue_mail() puts a message on a Redis list and makes sure a
+# `send_queued_mail` task is coming within MAIL_BATCH_DELAY seconds; that
+# task drains the list in batches of MAIL_BATCH_SIZE, so a signup burst is
+# a handful of tasks rather than one per mail. Each worker process keeps
+# one SMTP connection open across tasks (the TLS handshake and login cost
+# more than the message itself) and reopens it when the server dropped it
+# or it sat idle for MAIL_CONNECTION_MAX_IDLE seconds.
+#
+# The messages of a batch are handed to send_messages() one by one on that
+# connection: given several, it stops at the first failure without saying
+# which were sent. A failed message is retried on its own by
+# `send_mail_messages` after MAIL_RETRY_DELAY seconds, doubling each time,
+# up to MAIL_MAX_RETRIES times; addresses the server rejects outright are
+# not retried.
+#
+# Without a django_redis cache (locmem in tests) messages go straight to a
+# `send_mail_messages` task.
+
+QUEUE_KEY = 'mail:queue'
+FLUSH_KEY = 'mail:flush_scheduled'
+
+_connection = None
+_connection_pid = None
+_last_used = 0
+_lock = threading.Lock()
+
+
+def queue_mail(subject, body, to, from_email=None):
+    """
+    Send a plain text mail from a worker, batched with the others queued
+    around it, once the current transaction commits: a mail about a signup
+    that rolls back is never sent, and the Redis round trip stays out of it.
+    """
+    payload = {'subject': subject, 'body': body, 'to': list(to), 'from_email': from_email, 'attempt': 0}
+    transaction.on_commit(lambda: push_mail(payload))
+
+
+def push_mail(payload):
+    from .tasks import send_mail_messages, send_queued_mail
+
+    connection = get_redis_connection()
+    if connection is None:
+        send_mail_messages.delay([payload])
+        return
+
+    pipeline = connection.pipeline(transaction=False)
+    pipeline.rpush(QUEUE_KEY, json.dumps(payload))
+    # Expires in case the task is lost, so a later mail schedules another
+    pipeline.set(FLUSH_KEY, 1, nx=True, ex=settings.MAIL_BATCH_DELAY + 60)
+    _, scheduled = pipeline.execute()
+    if scheduled:
+        send_queued_mail.apply_async(countdown=settings.MAIL_BATCH_DELAY)
+
+
+def take_batch(connection):
+    pipeline = connection.pipeline(transaction=True)
+    pipeline.lrange(QUEUE_KEY, 0, settings.MAIL_BATCH_SIZE - 1)
+    pipeline.ltrim(QUEUE_KEY, settings.MAIL_BATCH_SIZE, -1)
+    batch, _ = pipeline.execute()
+    return [json.loads(payload) for payload in batch]
+
+
+def send_queue():
+    """Send everything queued so far, a batch at a time."""
+    connection = get_redis_connection()
+    if connection is None:
+        return
+    # Mails queued from here on schedule the next task
+    connection.delete(FLUSH_KEY)
+    while True:
+        batch = take_batch(connection)
+        if not batch:
+            break
+        send_payloads(batch)
+
+
+def send_payloads(payloads):
+    """Send each message over the shared connection, scheduling retries for the ones that fail."""
+    from .tasks import send_mail_messages
+
+    for payload in payloads:
+        try:
+            deliver(EmailMessage(payload['subject'], payload['body'], payload['from_email'], payload['to']))
+        except Exception as e:
+            attempt = payload['attempt'] + 1
+            if is_permanent(e) or attempt > settings.MAIL_MAX_RETRIES:
+                print(f"Error sending mail to {', '.join(payload['to'])}, giving up: {e}")
+                continue
+            print(f"Error sending mail to {', '.join(payload['to'])}, retry {attempt}: {e}")
+            send_mail_messages.apply_async(
+                [[{**payload, 'attempt': attempt}]],
+                countdown=settings.MAIL_RETRY_DELAY * 2 ** (attempt - 1)
+            )
+
+
+def is_permanent(error):
+    # 5xx replies (unknown addresses, rejected content) won't go through on a retry
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def deliver(message):
+    with _lock:
+        try:
+            shared_connection().send_messages([message])
+        except smtplib.SMTPServerDisconnected:
+            # Most likely closed by the server while idle: once more on a new connection
+            close_connection()
+            shared_connection().send_messages([message])
+
+
+def shared_connection():
+    """This process's open mail connection."""
+    global _connection, _connection_pid, _last_used
+    if _connection_pid != os.getpid():
+        _connection = None  # the parent's socket, after a fork
+    elif _connection is not None and time.monotonic() - _last_used > settings.MAIL_CONNECTION_MAX_IDLE:
+        close_connection()
+
+    if _connection is None:
+        connection = get_connection(fail_silently=False)
+        connection.open()
+        _connection, _connection_pid = connection, os.getpid()
+    _last_used = time.monotonic()
+    return _connection
+
+
+def close_connection():
+    global _connection
+    if _connection is None:
+        return
+    try:
+        _connection.close()
+    except Exception:
+        pass
+    _connection = None
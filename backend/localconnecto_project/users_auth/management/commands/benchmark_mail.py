@@ -0,0 +1,93 @@
+import json
+import time
+from django.conf import settings
+from django.core.mail import send_mail
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.utils import timezone
+from localconnecto_project.benchmarks import git_revision
+from localconnecto_project.stubs import SMTPStandIn
+from users_auth import mailer
+
+MODES = ['per-message', 'pooled']
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure messages/s of the SMTP backend against a local SMTP stand-in: 'per-message' "
+        "is send_mail() per message (a new connection each), 'pooled' sends MAIL_BATCH_SIZE "
+        "batches over the mailer's shared connection, as the send_queued_mail task does."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=[*MODES, 'both'], default='both')
+        parser.add_argument('--messages', type=int, default=500)
+        parser.add_argument('--connect-latency', type=float, default=150,
+                            help="Milliseconds the stand-in takes to open a connection (TLS handshake and login).")
+        parser.add_argument('--message-latency', type=float, default=2,
+                            help="Milliseconds the stand-in takes per message.")
+        parser.add_argument('--json', dest='json_path', help="Write the report here.")
+
+    def handle(self, *args, **options):
+        server = SMTPStandIn(
+            connect_latency=options['connect_latency'] / 1000, message_latency=options['message_latency'] / 1000
+        ).start()
+        host, port = server.server_address
+        modes = MODES if options['mode'] == 'both' else [options['mode']]
+
+        report = {
+            'revision': git_revision(),
+            'started_at': timezone.now().isoformat(),
+            'connect_latency_ms': options['connect_latency'],
+            'message_latency_ms': options['message_latency'],
+            'batch_size': settings.MAIL_BATCH_SIZE,
+            'modes': {},
+        }
+        try:
+            with override_settings(
+                EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST=host, EMAIL_PORT=port,
+                EMAIL_USE_TLS=False, EMAIL_USE_SSL=False, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+            ):
+                for mode in modes:
+                    report['modes'][mode] = self.run(mode, server, options['messages'])
+        finally:
+            mailer.close_connection()
+            server.shutdown()
+            server.server_close()
+
+        self.stdout.write(f"{'mode':<12} {'messages':>9} {'sent':>6} {'connections':>12} {'seconds':>8} {'msg/s':>8}")
+        for mode, stats in report['modes'].items():
+            self.stdout.write(
+                f"{mode:<12} {stats['messages']:>9} {stats['sent']:>6} {stats['connections']:>12} "
+                f"{stats['seconds']:>8.2f} {stats['messages_per_second']:>8.1f}"
+            )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as out:
+                json.dump(report, out, indent=2)
+
+    def run(self, mode, server, count):
+        messages = [
+            {'subject': 'Benchmark', 'body': f'Message {number}', 'to': [f'user{number}@example.com'],
+             'from_email': 'noreply@example.com', 'attempt': 0}
+            for number in range(count)
+        ]
+        connections, sent = server.connections, server.messages
+
+        started = time.perf_counter()
+        if mode == 'per-message':
+            for message in messages:
+                send_mail(message['subject'], message['body'], message['from_email'], message['to'])
+        else:
+            mailer.close_connection()  # the first connection is part of the cost
+            for start in range(0, count, settings.MAIL_BATCH_SIZE):
+                mailer.send_payloads(messages[start:start + settings.MAIL_BATCH_SIZE])
+        elapsed = time.perf_counter() - started
+
+        return {
+            'messages': count,
+            'sent': server.messages - sent,
+            'connections': server.connections - connections,
+            'seconds': round(elapsed, 3),
+            'messages_per_second': round(count / elapsed, 1),
+        }
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users_auth', '0006_userprofile_latitude_userprofile_longitude'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
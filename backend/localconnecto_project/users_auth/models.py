@@ -1,4 +1,5 @@
 from django.db import models
+from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import AbstractUser
 from .manager import CustomUserManager
 from cloudinary.models import CloudinaryField
@@ -26,7 +27,10 @@ class UserProfile(models.Model):
     bio = models.TextField(blank=True, null=True)
     location = models.CharField(max_length=50, blank=True, null= True)
     phone_number = models.CharField(max_length=15, blank=True, null=True)
+    latitude = models.FloatField(blank=True, null=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(blank=True, null=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
     image_public_id = models.CharField(max_length=255, blank=True, null=True)
+    image_variants = models.JSONField(blank=True, default=dict)  # Resized copies of the image (see items/derivatives.py)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
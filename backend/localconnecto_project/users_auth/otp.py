@@ -0,0 +1,143 @@
+import threading
+import time
+from django.conf import settings
+from django.utils.crypto import salted_hmac
+from localconnecto_project.tiered_cache import get_connection
+
+# The password reset OTP of each email, as one Redis hash:
+#
+#     otp_state:<email>  code=<hmac of the code>  attempts=<wrong guesses>
+#     otp_state:<email>  verified=1                (once the code matched)
+#
+# Every step is a single round trip that reads and changes the hash
+# atomically: issue() replaces it, verify() checks a guess and counts it or
+# swaps the code for the verified flag, consume() takes the flag for a
+# password change. Two requests racing on the same email therefore can't
+# both use one code or one verification. Too many wrong guesses drop the
+# code, so a new one has to be requested.
+#
+# Without a django_redis cache (locmem in tests) the hashes live in process
+# memory.
+
+VERIFIED, INVALID, EXPIRED, LOCKED = 'verified', 'invalid', 'expired', 'locked'
+
+# KEYS[1]: the hash. ARGV: the guess's hmac, max attempts, verified timeout.
+VERIFY_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'code', 'attempts')
+if not state[1] then
+    return 'expired'
+end
+if state[1] ~= ARGV[1] then
+    local attempts = tonumber(state[2] or 0) + 1
+    if attempts >= tonumber(ARGV[2]) then
+        redis.call('DEL', KEYS[1])
+        return 'locked'
+    end
+    redis.call('HSET', KEYS[1], 'attempts', attempts)
+    return 'invalid'
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'verified', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 'verified'
+"""
+
+CONSUME_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'verified') == '1' then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+
+def otp_key(email):
+    return f'otp_state:{email.strip().lower()}'
+
+
+def hash_code(email, code):
+    # Keyed by SECRET_KEY: six digits are quick to brute force from a plain hash
+    return salted_hmac('users_auth.otp', f'{email.strip().lower()}:{code}').hexdigest()
+
+
+def issue(email, code):
+    """Start over with a new `code` for `email`, dropping any earlier code or verification."""
+    key, code_hash = otp_key(email), hash_code(email, code)
+    connection = get_connection()
+    if connection is None:
+        _local.issue(key, code_hash)
+        return
+
+    pipeline = connection.pipeline(transaction=True)
+    pipeline.delete(key)
+    pipeline.hset(key, mapping={'code': code_hash, 'attempts': 0})
+    pipeline.expire(key, settings.OTP_TIMEOUT)
+    pipeline.execute()
+
+
+def verify(email, code):
+    """Check a guess at the code: VERIFIED, INVALID, LOCKED (too many wrong guesses) or EXPIRED."""
+    key, code_hash = otp_key(email), hash_code(email, code)
+    connection = get_connection()
+    if connection is None:
+        return _local.verify(key, code_hash)
+
+    result = connection.eval(
+        VERIFY_SCRIPT, 1, key, code_hash, settings.OTP_MAX_ATTEMPTS, settings.OTP_VERIFIED_TIMEOUT
+    )
+    return result.decode() if isinstance(result, bytes) else result
+
+
+def consume(email):
+    """Use up the verification of `email`. False if it was never verified, expired or already used."""
+    key = otp_key(email)
+    connection = get_connection()
+    if connection is None:
+        return _local.consume(key)
+    return bool(connection.eval(CONSUME_SCRIPT, 1, key))
+
+
+class LocalStates:
+    """The scripts above over process memory, for caches other than django_redis."""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        state = self._states.get(key)
+        if state is not None and state['expires'] <= time.monotonic():
+            del self._states[key]
+            return None
+        return state
+
+    def issue(self, key, code_hash):
+        with self._lock:
+            self._states[key] = {
+                'code': code_hash, 'attempts': 0, 'expires': time.monotonic() + settings.OTP_TIMEOUT,
+            }
+
+    def verify(self, key, code_hash):
+        with self._lock:
+            state = self._get(key)
+            if state is None or 'code' not in state:
+                return EXPIRED
+            if state['code'] != code_hash:
+                state['attempts'] += 1
+                if state['attempts'] >= settings.OTP_MAX_ATTEMPTS:
+                    del self._states[key]
+                    return LOCKED
+                return INVALID
+            self._states[key] = {'verified': True, 'expires': time.monotonic() + settings.OTP_VERIFIED_TIMEOUT}
+            return VERIFIED
+
+    def consume(self, key):
+        with self._lock:
+            state = self._get(key)
+            if state is None or not state.get('verified'):
+                return False
+            del self._states[key]
+            return True
+
+
+_local = LocalStates()
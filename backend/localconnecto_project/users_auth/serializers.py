@@ -2,9 +2,10 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from dj_rest_auth.registration.serializers import RegisterSerializer
 from .models import UserProfile
-from cloudinary.uploader import upload, destroy
+from items.media import store_files, release, asset_url
+from items.derivatives import queue_variants
 import os
-from django.core.cache import cache
+from . import otp
 
 User = get_user_model()
 
@@ -68,12 +69,15 @@ class UserProfileSerializer(serializers.ModelSerializer):
             'first_name',
             'last_name',
             'image',
+            'image_variants',
             'bio',
             'location',
             'phone_number',
+            'latitude',
+            'longitude',
             'created_at',
         ]
-        read_only_fields = ['id', 'email', 'created_at']
+        read_only_fields = ['id', 'email', 'image_variants', 'created_at']
     
 
     def validate_image(self, value):
@@ -102,24 +106,31 @@ class UserProfileSerializer(serializers.ModelSerializer):
         instance.bio = validated_data.get('bio', instance.bio)
         instance.location = validated_data.get('location', instance.location)
         instance.phone_number = validated_data.get('phone_number', instance.phone_number)
+        instance.latitude = validated_data.get('latitude', instance.latitude)
+        instance.longitude = validated_data.get('longitude', instance.longitude)
+
+        if (instance.latitude is None) != (instance.longitude is None):
+            raise serializers.ValidationError("Latitude and longitude must be provided together.")
 
         image = self.context['request'].FILES.get('image')
+        old_public_id = instance.image_public_id
         if image:
+            # Stored once per distinct content (see items/media.py)
+            asset = store_files([image])[0]
+            instance.image = asset_url(asset)
+            instance.image_public_id = asset.public_id
+            instance.image_variants = asset.variants  # Filled in later for new content
 
-            if instance.image_public_id:
-                try:
-                    destroy(instance.image_public_id)
-                except Exception as e:
-                    print(f"Error deleting old image: {e}")
-
-            upload_result = upload(
-                image,
-                folder = f'accounts/{instance.user.id}/profile_images'
-            )
-            instance.image = upload_result['secure_url']
-            instance.image_public_id = upload_result['public_id']
-        
-        instance.save()
+        try:
+            instance.save()
+        except Exception:
+            if image:
+                release([asset.public_id])
+            raise
+
+        if image:
+            release([old_public_id])
+            queue_variants([asset])
 
         return instance
     
@@ -144,22 +155,18 @@ class ValidateOTPSerializer(serializers.Serializer):
     otp = serializers.CharField()
 
     def validate(self, attrs):
-        email = attrs.get("email")
-        otp = attrs.get("otp")
-
-        key= f"otp:{email}"
-        stored_otp = cache.get(key)
+        # Checks the code and, if it matches, marks the email verified in one step
+        result = otp.verify(attrs.get("email"), attrs.get("otp"))
 
-        if stored_otp is None:
+        if result == otp.EXPIRED:
             raise serializers.ValidationError("OTP has expired or was not found.")
-        
-        if stored_otp != otp:
+
+        if result == otp.LOCKED:
+            raise serializers.ValidationError("Too many invalid attempts, request a new OTP.")
+
+        if result != otp.VERIFIED:
             raise serializers.ValidationError("Invalid OTP.")
-        
-        # OTP is valid, now mark as verified
-        cache.delete(key)
-        cache.set(f"otp_verified:{email}", True, timeout=300)
-        
+
         return attrs
 
 
@@ -170,10 +177,6 @@ class ChangePasswordSerializer(serializers.Serializer):
     def validate(self, attrs):
         email = attrs.get("email")
         password = attrs.get("password")
-        verified_key = f"otp_verified:{email}"
-
-        if not cache.get(verified_key):
-            raise serializers.ValidationError("OTP not verified or expired.")
 
         try:
             user = User.objects.get(email=email)
@@ -183,6 +186,11 @@ class ChangePasswordSerializer(serializers.Serializer):
         if user.check_password(password):
             raise serializers.ValidationError("New password can’t be the same as the old one.")
 
+        # Last, so a rejected password doesn't use up the verification; one
+        # verification allows one change even if requests race
+        if not otp.consume(email):
+            raise serializers.ValidationError("OTP not verified or expired.")
+
         attrs["user"] = user
 
         return attrs
@@ -192,9 +200,5 @@ class ChangePasswordSerializer(serializers.Serializer):
         user = self.validated_data["user"]
         new_password = self.validated_data["password"]
 
-        verified_key = f"otp_verified:{user.email}"
-
         user.set_password(new_password)
-        user.save()
-
-        cache.delete(verified_key)
\ No newline at end of file
+        user.save()
\ No newline at end of file
@@ -1,7 +1,7 @@
 from django.dispatch import receiver
 from django.db.models.signals import post_save
 from django.contrib.auth import get_user_model 
-from .tasks import send_welcome_message
+from .utils import welcome_mail
 from .models import UserProfile
 
 User = get_user_model()
@@ -10,7 +10,7 @@ User = get_user_model()
 @receiver(post_save, sender= User)
 def user_creation_mail(sender, instance, created, **kwargs):
     if created:
-        send_welcome_message.delay(instance.email)
+        welcome_mail(instance.email)
 
 
 @receiver(post_save, sender = User)
@@ -1,11 +1,24 @@
 from celery import shared_task
 from .utils import welcome_mail, send_otp_to_email
+from .mailer import send_queue, send_payloads
 
 
+# Kept for tasks already in the broker: they only hand their mail on to
+# mailer.queue_mail() (through the utils), which batches it like any other.
 @shared_task
 def send_welcome_message(user_email):
     welcome_mail(user_email)
 
 @shared_task
 def send_otp(user_email, otp_code):
-    send_otp_to_email(user_email, otp_code)
\ No newline at end of file
+    send_otp_to_email(user_email, otp_code)
+
+@shared_task
+def send_queued_mail():
+    """Send the mails queued by mailer.queue_mail(), in batches."""
+    send_queue()
+
+@shared_task
+def send_mail_messages(payloads):
+    """Send mails given as mailer payloads (retries, and every mail without Redis)."""
+    send_payloads(payloads)
@@ -1,3 +1,263 @@
-from django.test import TestCase
+import threading
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from localconnecto_project import throttling
+from . import otp
 
-# Create your tests here.
+User = get_user_model()
+
+# The otp and throttling modules fall back to process memory without a
+# django_redis cache; the tests run against that fallback.
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def run_together(function, count):
+    """Call `function` from `count` threads released at the same moment, and return the results."""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def call(i):
+        barrier.wait()
+        results[i] = function()
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@override_settings(CACHES=LOCAL_CACHE, OTP_MAX_ATTEMPTS=5)
+class OTPStateTests(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(otp, '_local', otp.LocalStates())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        otp.issue('buyer@example.com', '123456')
+
+    def test_verify_then_consume_once(self):
+        self.assertEqual(otp.verify('buyer@example.com', '123456'), otp.VERIFIED)
+        self.assertTrue(otp.consume('buyer@example.com'))
+        self.assertFalse(otp.consume('buyer@example.com'))
+
+    def test_code_is_used_up_by_verification(self):
+        self.assertEqual(otp.verify('buyer@example.com', '123456'), otp.VERIFIED)
+        self.assertEqual(otp.verify('buyer@example.com', '123456'), otp.EXPIRED)
+
+    def test_email_is_normalized(self):
+        self.assertEqual(otp.verify(' Buyer@Example.com', '123456'), otp.VERIFIED)
+        self.assertTrue(otp.consume('BUYER@example.com '))
+
+    def test_consume_without_verification(self):
+        self.assertFalse(otp.consume('buyer@example.com'))
+        self.assertEqual(otp.verify('buyer@example.com', '123456'), otp.VERIFIED)
+
+    def test_lockout_after_max_attempts(self):
+        for _ in range(4):
+            self.assertEqual(otp.verify('buyer@example.com', '000000'), otp.INVALID)
+        self.assertEqual(otp.verify('buyer@example.com', '000000'), otp.LOCKED)
+        # The code is gone: even the right one no longer works
+        self.assertEqual(otp.verify('buyer@example.com', '123456'), otp.EXPIRED)
+
+    def test_new_code_resets_attempts(self):
+        for _ in range(4):
+            otp.verify('buyer@example.com', '000000')
+        otp.issue('buyer@example.com', '654321')
+        self.assertEqual(otp.verify('buyer@example.com', '000000'), otp.INVALID)
+        self.assertEqual(otp.verify('buyer@example.com', '654321'), otp.VERIFIED)
+
+    def test_new_code_drops_verification(self):
+        otp.verify('buyer@example.com', '123456')
+        otp.issue('buyer@example.com', '654321')
+        self.assertFalse(otp.consume('buyer@example.com'))
+
+    def test_racing_verifications_succeed_once(self):
+        results = run_together(lambda: otp.verify('buyer@example.com', '123456'), 8)
+        self.assertEqual(results.count(otp.VERIFIED), 1)
+        self.assertEqual(results.count(otp.EXPIRED), 7)
+
+    def test_racing_consumes_succeed_once(self):
+        otp.verify('buyer@example.com', '123456')
+        results = run_together(lambda: otp.consume('buyer@example.com'), 8)
+        self.assertEqual(results.count(True), 1)
+
+    def test_racing_wrong_guesses_lock_once(self):
+        results = run_together(lambda: otp.verify('buyer@example.com', '000000'), 8)
+        self.assertEqual(results.count(otp.INVALID), 4)
+        self.assertEqual(results.count(otp.LOCKED), 1)
+        self.assertEqual(results.count(otp.EXPIRED), 3)
+
+
+@override_settings(CACHES=LOCAL_CACHE, THROTTLE_ENABLED=True)
+class PasswordResetTests(TestCase):
+
+    def setUp(self):
+        for target, new in [(otp, otp.LocalStates()), (throttling, throttling.LocalWindows())]:
+            patcher = mock.patch.object(target, '_local', new)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        with mock.patch('users_auth.signals.welcome_mail'):
+            self.user = User.objects.create_user(email='seller@example.com', password='old-password')
+        self.client = APIClient()
+
+    def send_otp(self, email='seller@example.com'):
+        with mock.patch('users_auth.views.generate_otp', return_value='123456'), \
+                mock.patch('users_auth.views.send_otp_to_email') as send:
+            response = self.client.post(reverse('send_otp'), {'email': email}, format='json')
+        return response, send
+
+    def test_reset_password(self):
+        response, send = self.send_otp()
+        self.assertEqual(response.status_code, 200)
+        send.assert_called_once_with('seller@example.com', '123456')
+
+        response = self.client.post(reverse('verify_otp'), {'email': 'seller@example.com', 'otp': '123456'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(
+            reverse('reset_password'), {'email': 'seller@example.com', 'password': 'new-password'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new-password'))
+
+    def test_verification_allows_one_change(self):
+        self.send_otp()
+        self.client.post(reverse('verify_otp'), {'email': 'seller@example.com', 'otp': '123456'}, format='json')
+
+        first = self.client.post(
+            reverse('reset_password'), {'email': 'seller@example.com', 'password': 'new-password'}, format='json'
+        )
+        second = self.client.post(
+            reverse('reset_password'), {'email': 'seller@example.com', 'password': 'other-password'}, format='json'
+        )
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 400)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new-password'))
+
+    def test_rejected_password_keeps_verification(self):
+        self.send_otp()
+        self.client.post(reverse('verify_otp'), {'email': 'seller@example.com', 'otp': '123456'}, format='json')
+
+        response = self.client.post(
+            reverse('reset_password'), {'email': 'seller@example.com', 'password': 'old-password'}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            reverse('reset_password'), {'email': 'seller@example.com', 'password': 'new-password'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_reset_without_verification(self):
+        self.send_otp()
+        response = self.client.post(
+            reverse('reset_password'), {'email': 'seller@example.com', 'password': 'new-password'}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_lockout(self):
+        self.send_otp()
+        for _ in range(4):
+            response = self.client.post(reverse('verify_otp'), {'email': 'seller@example.com', 'otp': '000000'}, format='json')
+            self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse('verify_otp'), {'email': 'seller@example.com', 'otp': '000000'}, format='json')
+        self.assertIn("Too many invalid attempts", str(response.data))
+
+        # Throttled by now too (5 guesses per email), but the code is gone either way
+        with mock.patch.object(throttling, '_local', throttling.LocalWindows()):
+            response = self.client.post(reverse('verify_otp'), {'email': 'seller@example.com', 'otp': '123456'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_send_otp_is_throttled_per_email(self):
+        for _ in range(3):
+            response, _ = self.send_otp()
+            self.assertEqual(response.status_code, 200)
+
+        response, send = self.send_otp()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        send.assert_not_called()
+
+
+@override_settings(CACHES=LOCAL_CACHE, THROTTLE_ENABLED=True, THROTTLE_POLICIES={'test': [('ip', 2, 60)]})
+class SlidingWindowTests(TestCase):
+    # Window boundaries fall on multiples of the window length
+    START = 60 * 1000
+
+    def setUp(self):
+        patcher = mock.patch.object(throttling, '_local', throttling.LocalWindows())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def check_at(self, t, ip='10.0.0.1'):
+        with mock.patch.object(throttling.time, 'time', return_value=self.START + t):
+            return throttling.check('test', {'ip': ip})
+
+    def test_limit_within_window(self):
+        self.assertEqual(self.check_at(0), 0)
+        self.assertEqual(self.check_at(1), 0)
+        self.assertEqual(self.check_at(2), 88)
+
+    def test_rejected_requests_are_not_counted(self):
+        self.check_at(0)
+        self.check_at(1)
+        for _ in range(5):
+            self.check_at(2)
+        self.assertEqual(self.check_at(90), 0)
+
+    def test_previous_window_slides_out(self):
+        self.check_at(0)
+        self.check_at(1)
+        # 29s into the next window the sliding window still covers 31s of this one
+        self.assertGreater(self.check_at(89), 0)
+        self.assertEqual(self.check_at(90), 0)
+
+    def test_identities_are_counted_apart(self):
+        self.check_at(0)
+        self.check_at(1)
+        self.assertEqual(self.check_at(2, ip='10.0.0.2'), 0)
+
+    def test_missing_identity_is_not_limited(self):
+        for _ in range(5):
+            self.assertEqual(throttling.check('test', {'ip': None}), 0)
+
+    @override_settings(THROTTLE_ENABLED=False)
+    def test_disabled(self):
+        for t in range(5):
+            self.assertEqual(self.check_at(t), 0)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class WelcomeMailTests(TestCase):
+    # Without django_redis the mailer hands each message to send_mail_messages
+
+    def setUp(self):
+        patcher = mock.patch('users_auth.tasks.send_mail_messages.delay')
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sent_once_signup_commits(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            User.objects.create_user(email='new@example.com', password='password')
+        self.send.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+        (payload,), = self.send.call_args.args
+        self.assertEqual(payload['to'], ['new@example.com'])
+        self.assertEqual(payload['subject'], "Welcome to LocalConnecto")
+
+    def test_not_sent_for_rolled_back_signup(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                User.objects.create_user(email='new@example.com', password='password')
+                User.objects.create_user(email='new@example.com', password='password')
+        self.send.assert_not_called()
+        self.assertFalse(User.objects.filter(email='new@example.com').exists())
@@ -1,5 +1,5 @@
-from django.core.mail import send_mail
 from django.conf import settings
+from .mailer import queue_mail
 import secrets
 
 def welcome_mail(user_mail):
@@ -16,7 +16,7 @@ def welcome_mail(user_mail):
     """
     app_mail = settings.DEFAULT_FROM_EMAIL
 
-    send_mail(subject, message, app_mail, [user_mail], fail_silently=True)
+    queue_mail(subject, message, [user_mail], app_mail)
 
 
 def generate_otp():
@@ -31,4 +31,4 @@ def send_otp_to_email(user_mail, otp_code):
 
     app_mail = settings.DEFAULT_FROM_EMAIL
 
-    send_mail(subject, message, app_mail, [user_mail], fail_silently=True)
+    queue_mail(subject, message, [user_mail], app_mail)
@@ -15,9 +15,11 @@ from rest_framework import viewsets
 from rest_framework.views import APIView
 from .models import UserProfile
 from rest_framework.response import Response
-from .tasks import send_otp
-from .utils import generate_otp
-from django.core.cache import cache
+from .utils import generate_otp, send_otp_to_email
+from . import otp
+from dj_rest_auth.views import LoginView
+from rest_framework_simplejwt.views import TokenObtainPairView
+from localconnecto_project.throttling import PolicyThrottle, throttle
 
 User = get_user_model()
 
@@ -48,6 +50,8 @@ class UserProfileViewSet(viewsets.ModelViewSet):
 class SendOTPView(APIView):
 
     permission_classes = [AllowAny]
+    throttle_classes = [PolicyThrottle]
+    throttle_policy = 'otp_send'
     
     def post(self, request):
         serializer = SendOTPSerializer(data=request.data)
@@ -55,8 +59,8 @@ class SendOTPView(APIView):
         if serializer.is_valid():
             email = serializer.validated_data['email']
             otp_code = generate_otp()
-            cache.set(f"otp:{email}", otp_code, timeout=300)
-            send_otp.delay(email, otp_code)
+            otp.issue(email, otp_code)
+            send_otp_to_email(email, otp_code)
 
             return Response({"message": "OTP send to email"}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -65,6 +69,8 @@ class SendOTPView(APIView):
 class ValidateOTPView(APIView):
 
     permission_classes = [AllowAny]
+    throttle_classes = [PolicyThrottle]
+    throttle_policy = 'otp_verify'
 
     def post(self, request):
         serializer = ValidateOTPSerializer(data=request.data)
@@ -77,6 +83,8 @@ class ValidateOTPView(APIView):
 class ChangePasswordAPIView(APIView):
 
     permission_classes = [AllowAny]
+    throttle_classes = [PolicyThrottle]
+    throttle_policy = 'password_reset'
 
     def post(self, request):
         serializer = ChangePasswordSerializer(data=request.data)
@@ -88,6 +96,16 @@ class ChangePasswordAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ThrottledLoginView(LoginView):
+    throttle_classes = [PolicyThrottle]
+    throttle_policy = 'login'
+
+
+class ThrottledTokenObtainPairView(TokenObtainPairView):
+    throttle_classes = [PolicyThrottle]
+    throttle_policy = 'login'
+
+
 @login_required
 def google_login_callback(request):
     user = request.user
@@ -132,6 +150,7 @@ def google_login_callback(request):
     return redirect(f'http://localhost:5173/login/callback/?access_token={access_token}&refresh_token={refresh_token}')
 
 @csrf_exempt
+@throttle('google_token')
 def validate_google_token(request):
     if request.method == 'POST':
         try: